@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# GMenu.Tree only says that something changed. This watches the same
+# directories (applications and desktop-directories in the XDG data dirs,
+# menus in the config dirs, with subdirectories) and reports every burst of
+# file events as one Change saying what kind of file changed, so views
+# can update the rows involved and only rebuild for .menu changes.
+
+import collections
+import os
+from gi.repository import GLib, GObject, Gio
+
+# milliseconds without events before a burst is reported
+SETTLE_DELAY = 200
+
+ITEM = 'item'            # one .desktop file, file_ids holds its id
+ITEMS = 'items'          # several .desktop files or a whole directory
+DIRECTORY = 'directory'  # .directory files
+MENU = 'menu'            # .menu files, the structure may have changed
+
+ADDED = 'added'
+CHANGED = 'changed'
+REMOVED = 'removed'
+
+Change = collections.namedtuple('Change', 'kind action file_ids paths')
+
+ADD_EVENTS = (Gio.FileMonitorEvent.CREATED, Gio.FileMonitorEvent.MOVED_IN)
+REMOVE_EVENTS = (Gio.FileMonitorEvent.DELETED, Gio.FileMonitorEvent.MOVED_OUT)
+CHANGE_EVENTS = ADD_EVENTS + REMOVE_EVENTS + (Gio.FileMonitorEvent.CHANGES_DONE_HINT,
+                                              Gio.FileMonitorEvent.ATTRIBUTE_CHANGED,
+                                              Gio.FileMonitorEvent.RENAMED)
+
+def getRoots():
+    # (directory, kind of the files in it)
+    roots = []
+    for path in [GLib.get_user_data_dir()] + list(GLib.get_system_data_dirs()):
+        roots.append((os.path.join(path, 'applications'), ITEM))
+        roots.append((os.path.join(path, 'desktop-directories'), DIRECTORY))
+    for path in [GLib.get_user_config_dir()] + list(GLib.get_system_config_dirs()):
+        roots.append((os.path.join(path, 'menus'), MENU))
+    return roots
+
+def getFileId(root, path):
+    return os.path.relpath(path, root).replace(os.sep, '-')
+
+class ChangeMonitor(GObject.GObject):
+    __gsignals__ = {
+        'changed': (GObject.SIGNAL_RUN_FIRST, None, (object,))
+    }
+
+    def __init__(self, roots=None):
+        GObject.GObject.__init__(self)
+        self.monitors = {}
+        self.events = collections.OrderedDict()
+        self.settleId = 0
+        for root, kind in roots or getRoots():
+            self.watch(root, root, kind)
+            if os.path.isdir(root):
+                for dirpath, dirnames, filenames in os.walk(root):
+                    for name in dirnames:
+                        self.watch(os.path.join(dirpath, name), root, kind)
+
+    def watch(self, path, root, kind):
+        if path in self.monitors:
+            return
+        try:
+            monitor = Gio.File.new_for_path(path).monitor_directory(Gio.FileMonitorFlags.NONE, None)
+        except GLib.GError:
+            return
+        monitor.connect('changed', self.onEvent, root, kind)
+        self.monitors[path] = monitor
+
+    def unwatch(self, path):
+        for dir_path in list(self.monitors):
+            if dir_path == path or dir_path.startswith(path + os.sep):
+                self.monitors.pop(dir_path).cancel()
+
+    def stop(self):
+        for monitor in self.monitors.values():
+            monitor.cancel()
+        self.monitors = {}
+        if self.settleId:
+            GLib.source_remove(self.settleId)
+            self.settleId = 0
+
+    def onEvent(self, monitor, file, other_file, event_type, root, kind):
+        if event_type not in CHANGE_EVENTS:
+            return
+        path = file.get_path()
+        if path is None:
+            return
+        is_dir = path in self.monitors or os.path.isdir(path)
+        if is_dir:
+            if event_type in ADD_EVENTS:
+                self.watch(path, root, kind)
+                for dirpath, dirnames, filenames in os.walk(path):
+                    for name in dirnames:
+                        self.watch(os.path.join(dirpath, name), root, kind)
+            elif event_type in REMOVE_EVENTS:
+                self.unwatch(path)
+
+        added = event_type in ADD_EVENTS
+        if path in self.events:
+            previous = self.events[path]
+            self.events[path] = (root, kind, is_dir, previous[3] or added)
+        else:
+            self.events[path] = (root, kind, is_dir, added)
+
+        #report once the files are quiet for a moment
+        if self.settleId:
+            GLib.source_remove(self.settleId)
+        self.settleId = GLib.timeout_add(SETTLE_DELAY, self.onSettled)
+
+    def onSettled(self):
+        self.settleId = 0
+        events = self.events
+        self.events = collections.OrderedDict()
+        change = self.classify(events)
+        if change is not None:
+            self.emit('changed', change)
+        return False
+
+    def classify(self, events):
+        paths = tuple(events)
+        if not paths:
+            return None
+
+        kinds = set()
+        items = []
+        for path, (root, kind, is_dir, added) in events.items():
+            if kind == ITEM and is_dir:
+                kinds.add(ITEMS)
+            elif kind == ITEM and path.endswith('.desktop'):
+                items.append((path, root, added))
+                kinds.add(ITEM)
+            elif kind == DIRECTORY and (is_dir or path.endswith('.directory')):
+                kinds.add(DIRECTORY)
+            elif kind == MENU and (is_dir or path.endswith('.menu')):
+                kinds.add(MENU)
+
+        if MENU in kinds:
+            return Change(MENU, None, (), paths)
+        if DIRECTORY in kinds and not items and ITEMS not in kinds:
+            return Change(DIRECTORY, None, (), paths)
+        if kinds == set([ITEM]) and len(items) == 1:
+            path, root, added = items[0]
+            if not os.path.exists(path):
+                action = REMOVED
+            elif added:
+                action = ADDED
+            else:
+                action = CHANGED
+            return Change(ITEM, action, (getFileId(root, path),), paths)
+        if kinds:
+            file_ids = tuple(getFileId(root, path) for path, root, added in items)
+            return Change(ITEMS, None, file_ids, paths)
+        #temporary files and the like
+        return None
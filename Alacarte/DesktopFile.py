@@ -0,0 +1,252 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Reading and editing of .desktop/.directory files without GLib.KeyFile.
+# When patching, only the lines of the keys being set are rewritten, every
+# other byte of the file (translations, comments, other groups) is copied
+# through as is.
+
+import os
+from collections.abc import Sequence
+
+DESKTOP_GROUP = 'Desktop Entry'
+ENCODING = 'utf-8'
+ERRORS = 'surrogateescape'
+
+def escapeValue(value, separator=None):
+    # same escaping as g_key_file_set_string()
+    out = []
+    leading = True
+    for char in value:
+        if char == ' ':
+            out.append('\\s' if leading else ' ')
+            continue
+        elif char == '\t':
+            out.append('\\t' if leading else '\t')
+            continue
+        elif char == '\n':
+            out.append('\\n')
+        elif char == '\r':
+            out.append('\\r')
+        elif char == '\\':
+            out.append('\\\\')
+        elif char == separator:
+            out.append('\\' + char)
+        else:
+            out.append(char)
+        leading = False
+    return ''.join(out)
+
+def formatValue(value):
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    elif isinstance(value, str):
+        return escapeValue(value)
+    elif isinstance(value, Sequence):
+        return ''.join(escapeValue(part, ';') + ';' for part in value)
+    return None
+
+def formatItems(items):
+    values = []
+    for key, item in items.items():
+        if item is None:
+            continue
+        value = formatValue(item)
+        if value is not None:
+            values.append((key, value))
+    return values
+
+def lineKey(line):
+    stripped = line.strip()
+    if not stripped or stripped.startswith('#') or '=' not in stripped:
+        return None
+    return stripped.split('=', 1)[0].rstrip()
+
+def groupName(line):
+    stripped = line.strip()
+    if stripped.startswith('[') and stripped.endswith(']'):
+        return stripped[1:-1]
+    return None
+
+def patchLines(lines, values):
+    newline = '\n'
+    if lines and lines[0].endswith('\r\n'):
+        newline = '\r\n'
+
+    pending = dict(values)
+    order = [key for key, value in values]
+    keys = set(order)
+    out = []
+    group = None
+    last_key = None
+    found_group = False
+
+    def flush():
+        # add the keys the group didn't have after its last entry
+        missing = [key for key in order if key in pending]
+        if not missing:
+            return
+        insert_at = len(out) if last_key is None else last_key + 1
+        if insert_at > 0 and not out[insert_at - 1].endswith('\n'):
+            out[insert_at - 1] += newline
+        out[insert_at:insert_at] = [key + '=' + pending.pop(key) + newline for key in missing]
+
+    for line in lines:
+        name = groupName(line)
+        if name is not None:
+            if group == DESKTOP_GROUP:
+                flush()
+            group = name
+            if group == DESKTOP_GROUP:
+                found_group = True
+                last_key = len(out)
+            out.append(line)
+            continue
+
+        if group == DESKTOP_GROUP:
+            key = lineKey(line)
+            if key is not None:
+                if key in keys:
+                    if key not in pending:
+                        # duplicate key, the value has been written already
+                        continue
+                    ending = newline if line.endswith('\n') else ''
+                    line = key + '=' + pending.pop(key) + ending
+                last_key = len(out)
+        out.append(line)
+
+    if group == DESKTOP_GROUP:
+        flush()
+
+    if not found_group:
+        header = ['[' + DESKTOP_GROUP + ']' + newline]
+        header += [key + '=' + value + newline for key, value in values]
+        if out:
+            header.append(newline)
+        out[0:0] = header
+    return out
+
+def readLines(path):
+    if path is None:
+        return []
+    with open(path, 'r', encoding=ENCODING, errors=ERRORS, newline='') as f:
+        return f.readlines()
+
+# Reading. This is enough of the key file format for the code that runs
+# without GLib, i.e. in worker processes.
+
+UNESCAPES = {'s': ' ', 'n': '\n', 't': '\t', 'r': '\r', '\\': '\\'}
+
+def unescapeValue(value):
+    if '\\' not in value:
+        return value
+    out = []
+    chars = iter(value)
+    for char in chars:
+        if char == '\\':
+            char = next(chars, '')
+            out.append(UNESCAPES.get(char, '\\' + char))
+        else:
+            out.append(char)
+    return ''.join(out)
+
+def splitList(value):
+    parts = []
+    current = []
+    chars = iter(value)
+    for char in chars:
+        if char == '\\':
+            escaped = next(chars, '')
+            if escaped == ';':
+                current.append(';')
+            else:
+                current.append(UNESCAPES.get(escaped, '\\' + escaped))
+        elif char == ';':
+            parts.append(''.join(current))
+            current = []
+        else:
+            current.append(char)
+    if current:
+        parts.append(''.join(current))
+    return parts
+
+def readGroup(lines, group=DESKTOP_GROUP):
+    # returns the raw values of the keys in group
+    values = {}
+    current = None
+    for line in lines:
+        name = groupName(line)
+        if name is not None:
+            if current == group:
+                break
+            current = name
+            continue
+        if current == group:
+            key = lineKey(line)
+            if key is not None:
+                values[key] = line.split('=', 1)[1].strip()
+    return values
+
+def parse(path, group=DESKTOP_GROUP):
+    return readGroup(readLines(path), group)
+
+def getLanguages(locale=None):
+    # the locale suffixes to look for, best match first, see the
+    # "Localized values for keys" section of the desktop entry spec
+    if locale is None:
+        for variable in ('LC_ALL', 'LC_MESSAGES', 'LANG'):
+            locale = os.environ.get(variable)
+            if locale:
+                break
+    if not locale or locale in ('C', 'POSIX'):
+        return []
+    modifier = None
+    if '@' in locale:
+        locale, modifier = locale.split('@', 1)
+    locale = locale.split('.', 1)[0]
+    lang, sep, country = locale.partition('_')
+    languages = []
+    if country and modifier:
+        languages.append('%s_%s@%s' % (lang, country, modifier))
+    if country:
+        languages.append('%s_%s' % (lang, country))
+    if modifier:
+        languages.append('%s@%s' % (lang, modifier))
+    languages.append(lang)
+    return languages
+
+def getString(values, key, default=None):
+    if key not in values:
+        return default
+    return unescapeValue(values[key])
+
+def getLocaleString(values, key, languages=(), default=None):
+    for language in languages:
+        localized = '%s[%s]' % (key, language)
+        if localized in values:
+            return unescapeValue(values[localized])
+    return getString(values, key, default)
+
+def getBoolean(values, key, default=False):
+    if key not in values:
+        return default
+    return values[key] in ('true', '1')
+
+def getList(values, key):
+    if key not in values:
+        return []
+    return splitList(values[key])
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Writes the resolved menu tree as JSON Lines, one object per menu,
+# launcher and separator, depth first in layout order:
+#
+#   {"type": "Item", "id": "gedit.desktop", "menu": "Accessories",
+#    "position": 3, "name": "Text Editor", "visible": true,
+#    "overridden": false, "source": "/usr/share/applications/gedit.desktop"}
+#
+# "menu" is the path of menu ids of the parent, "" for the children of the
+# root and null for the root itself. "overridden" is what canRevert says.
+# The records are made while GMenu is iterated, nothing but the current
+# path is kept, so memory use doesn't grow with the menu.
+#
+#   alacarte export [--menu applications.menu] [--output FILE]
+
+import json
+import os
+import sys
+from gi.repository import GMenu
+from Alacarte.MenuEditor import MenuEditor
+
+def makeRecord(item, visible, menu, position, overrides):
+    items, menus = overrides
+    if isinstance(item, GMenu.TreeDirectory):
+        source = item.get_desktop_file_path()
+        file_id = os.path.basename(source) if source else item.get_menu_id() + '.directory'
+        return dict(type='Menu', id=item.get_menu_id(), menu=menu, position=position,
+                    name=item.get_name(), visible=visible, overridden=file_id in menus, source=source)
+    elif isinstance(item, GMenu.TreeEntry):
+        file_id = item.get_desktop_file_id()
+        return dict(type='Item', id=file_id, menu=menu, position=position,
+                    name=item.get_app_info().get_display_name(), visible=visible,
+                    overridden=file_id in items, source=item.get_desktop_file_path())
+    return dict(type='Separator', id=None, menu=menu, position=position,
+                name=None, visible=visible, overridden=False, source=None)
+
+def iterRecords(editor):
+    # the overrides are listed once instead of asking canRevert, which
+    # stats the file system, for every item
+    overrides = editor.getOverrides()
+    def walk(menu, path):
+        for position, (item, visible) in enumerate(editor.getItems(menu)):
+            yield makeRecord(item, visible, path, position, overrides)
+            if isinstance(item, GMenu.TreeDirectory):
+                for record in walk(item, (path + '/' if path else '') + item.get_menu_id()):
+                    yield record
+    root = editor.getRoot()
+    yield makeRecord(root, True, None, 0, overrides)
+    for record in walk(root, ''):
+        yield record
+
+def writeRecords(records, out):
+    count = 0
+    encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    for record in records:
+        out.write(encoder.encode(record))
+        out.write('\n')
+        count += 1
+    return count
+
+def main(basename=None, output=None):
+    editor = MenuEditor(basename)
+    if output is None or output == '-':
+        writeRecords(iterRecords(editor), sys.stdout)
+        sys.stdout.flush()
+        return 0
+    try:
+        with open(output, 'w', encoding='utf-8') as out:
+            writeRecords(iterRecords(editor), out)
+    except OSError as e:
+        sys.stderr.write('alacarte: can not write %s: %s\n' % (output, e.strerror or e))
+        return 1
+    return 0
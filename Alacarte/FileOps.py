@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# The file operations of the FileWriter. They don't use GLib, so the
+# tools that run in worker processes write the same way alacarte does.
+
+import contextlib
+import fcntl
+import os
+import shutil
+import tempfile
+from Alacarte import DesktopFile
+
+# new files get the mode open() would give them; read once, os.umask
+# can only be read by setting it, which isn't safe once threads run
+UMASK = os.umask(0o022)
+os.umask(UMASK)
+FILE_MODE = 0o666 & ~UMASK
+
+def getFileMode(path):
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return FILE_MODE
+
+def replaceFile(path, write):
+    # write into a temporary file next to path, sync it and move it over
+    # path, so readers never see a half written file; a symlink is
+    # followed so the file it points to gets replaced, not the link
+    path = os.path.realpath(path)
+    mode = getFileMode(path)
+    dirname, basename = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + basename + '.', dir=dirname)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fchmod(f.fileno(), mode)
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def writeFile(path, contents):
+    data = contents.encode(DesktopFile.ENCODING, DesktopFile.ERRORS)
+    replaceFile(path, lambda f: f.write(data))
+
+def copyFile(src_path, dest_path):
+    def write(f):
+        with open(src_path, 'rb') as src:
+            shutil.copyfileobj(src, f)
+    replaceFile(dest_path, write)
+
+def patchFile(src_path, dest_path, items):
+    lines = DesktopFile.patchLines(DesktopFile.readLines(src_path), DesktopFile.formatItems(items))
+    writeFile(dest_path, ''.join(lines))
+
+def patchFiles(jobs, items):
+    values = DesktopFile.formatItems(items)
+    for src_path, dest_path in jobs:
+        writeFile(dest_path, ''.join(DesktopFile.patchLines(DesktopFile.readLines(src_path), values)))
+
+def getLockPath(path):
+    dirname, basename = os.path.split(path)
+    return os.path.join(dirname, '.' + basename + '.lock')
+
+@contextlib.contextmanager
+def lockFile(path):
+    # advisory lock for read-modify-write of path; other programs editing
+    # the user menus can take it too: flock(2) on .<basename>.lock next
+    # to the file
+    with open(getLockPath(path), 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def readText(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read().decode(DesktopFile.ENCODING, DesktopFile.ERRORS)
+    except FileNotFoundError:
+        return None
+
+def commitFile(path, base, contents, merge, result):
+    # writes contents if path still holds base, the version they were
+    # made from, else merge(base, contents, current) of both versions
+    with lockFile(path):
+        current = readText(path)
+        if current is not None and current != base:
+            contents = merge(base, contents, current)
+            result['merged'] = True
+        writeFile(path, contents)
+        result['contents'] = contents
+
+def removeFile(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
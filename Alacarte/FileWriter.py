@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import collections
+import queue
+import threading
+from gi.repository import GLib, GObject
+from Alacarte.FileOps import writeFile, copyFile, patchFile, patchFiles, commitFile, removeFile
+from Alacarte.WriteTracker import WriteTracker, getStamp
+
+class Job(object):
+    def __init__(self, paths, func, args, callback, data):
+        self.paths = paths
+        self.func = func
+        self.args = args
+        self.callback = callback
+        self.data = data
+
+# Does all the file writes for a MenuEditor and records them in its
+# WriteTracker. This one writes right away, AsyncFileWriter moves the
+# work off the main thread.
+class FileWriter(object):
+    def __init__(self):
+        self.tracker = WriteTracker()
+
+    def submit(self, job):
+        if job.func is not None:
+            job.func(*job.args)
+        for path in job.paths:
+            self.tracker.record(path)
+        if job.callback is not None:
+            job.callback(*job.data)
+
+    def write(self, path, contents, callback=None, *data):
+        self.submit(Job([path], writeFile, (path, contents), callback, data))
+
+    def copy(self, src_path, dest_path, callback=None, *data):
+        self.submit(Job([dest_path], copyFile, (src_path, dest_path), callback, data))
+
+    def patch(self, src_path, dest_path, items, callback=None, *data):
+        self.submit(Job([dest_path], patchFile, (src_path, dest_path, items), callback, data))
+
+    def patchMany(self, jobs, items, callback=None, *data):
+        paths = [dest_path for src_path, dest_path in jobs]
+        self.submit(Job(paths, patchFiles, (jobs, items), callback, data))
+
+    def remove(self, path, callback=None, *data):
+        self.submit(Job([path], removeFile, (path,), callback, data))
+
+    def commit(self, path, base, contents, merge, callback=None, *data):
+        # the callback gets a dict with the written 'contents' and
+        # 'merged' if somebody else changed the file since base
+        result = {}
+        self.submit(Job([path], commitFile, (path, base, contents, merge, result), callback, (result,) + data))
+
+    def wait(self, callback, *data):
+        # calls back once the jobs submitted before are done
+        self.submit(Job([], None, (), callback, data))
+
+    def isPending(self, path):
+        return False
+
+    def flush(self):
+        pass
+
+# Runs the jobs one after the other on a worker thread, so the order of
+# the writes is kept. Callbacks run on the main loop once the job is done,
+# failures are reported through the 'error' signal.
+class AsyncFileWriter(GObject.GObject, FileWriter):
+    __gsignals__ = {
+        'error': (GObject.SIGNAL_RUN_FIRST, None, (str, str))
+    }
+
+    def __init__(self):
+        GObject.GObject.__init__(self)
+        FileWriter.__init__(self)
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.pending = collections.Counter()
+        self.writes = {}
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def submit(self, job):
+        with self.lock:
+            self.pending.update(job.paths)
+            for path in job.paths:
+                self.tracker.recordPending(path)
+            self.queue.put(job)
+
+    def write(self, path, contents, callback=None, *data):
+        with self.lock:
+            # a newer version of a file that hasn't been written yet
+            # replaces the queued one
+            job = self.writes.get(path)
+            if job is not None and job.callback is None and callback is None:
+                job.args = (path, contents)
+                return
+            job = Job([path], writeFile, (path, contents), callback, data)
+            self.writes[path] = job
+        self.submit(job)
+
+    def isPending(self, path):
+        with self.lock:
+            return self.pending[path] > 0
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            with self.lock:
+                for path in job.paths:
+                    if self.writes.get(path) is job:
+                        del self.writes[path]
+                args = job.args
+            try:
+                if job.func is not None:
+                    job.func(*args)
+                error = None
+            except (IOError, OSError) as e:
+                error = e
+            stamps = [(path, getStamp(path)) for path in job.paths]
+            GLib.idle_add(self.finish, job, stamps, error, priority=GLib.PRIORITY_HIGH)
+            self.queue.task_done()
+
+    def finish(self, job, stamps, error):
+        with self.lock:
+            self.pending.subtract(job.paths)
+            self.pending += collections.Counter()
+        for path, stamp in stamps:
+            self.tracker.recordStamp(path, stamp)
+        if error is not None:
+            self.emit('error', job.paths[0], error.strerror or str(error))
+        elif job.callback is not None:
+            job.callback(*job.data)
+        return False
+
+    def flush(self):
+        self.queue.join()
+        context = GLib.MainContext.default()
+        while context.pending():
+            context.iteration(False)
@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Content hashes of resolved menu trees. Every menu gets a digest of its
+# name, visibility and icon plus the digests of its children in layout
+# order, so two trees are the same below a menu exactly when the digests
+# of that menu match, and diff() only descends where they don't.
+#
+# build() takes a function listing the children of a menu, so the same
+# code hashes GMenu trees (see MenuEditor.getFingerprint) and the records
+# of MenuResolver. The latter needs no GLib, which lets this compare the
+# menus of many home directories in worker processes:
+#
+#   python3 -m Alacarte.Fingerprint REFERENCE_HOME HOME...
+
+import argparse
+import collections
+import hashlib
+import multiprocessing
+import sys
+from Alacarte import MenuResolver
+
+# key is ('Menu', menu id), ('Item', desktop file id) or ('Separator', n)
+# for the n-th separator; entries are (key, digest) in layout order
+Node = collections.namedtuple('Node', 'key digest attrs entries submenus')
+Difference = collections.namedtuple('Difference', 'path change key')
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+REORDERED = 'reordered'
+
+def hashFields(*fields):
+    digest = hashlib.blake2b(digest_size=16)
+    for field in fields:
+        if isinstance(field, bytes):
+            digest.update(field)
+        else:
+            digest.update(str(field).encode('utf-8', 'surrogateescape'))
+        digest.update(b'\0')
+    return digest.digest()
+
+def build(menu, children):
+    # children(menu) yields (kind, id, fields, child) for every child of
+    # menu in layout order, fields being what tells its looks (name,
+    # visibility, icon) and child what to pass to children() again for
+    # menus, None for the rest. menu is hashed as the root with no fields.
+    def node(key, fields, menu):
+        attrs = hashFields(key[0], key[1], *fields)
+        entries = []
+        submenus = {}
+        separators = 0
+        for kind, child_id, child_fields, child in children(menu):
+            if kind == 'Menu':
+                child_node = node((kind, child_id), child_fields, child)
+                submenus[child_id] = child_node
+                entries.append((child_node.key, child_node.digest))
+            elif kind == 'Separator':
+                entries.append(((kind, separators), hashFields(kind, *child_fields)))
+                separators += 1
+            else:
+                entries.append(((kind, child_id), hashFields(kind, child_id, *child_fields)))
+        fields = [attrs]
+        for (kind, child_id), digest in entries:
+            fields += [kind, child_id, digest]
+        return Node(key, hashFields(*fields), attrs, tuple(entries), submenus)
+    return node(('Menu', None), (), menu)
+
+def diff(old, new, path=()):
+    # returns the Differences between two trees, only looking at the menus
+    # whose digests differ
+    if old.digest == new.digest:
+        return []
+    differences = []
+    if old.attrs != new.attrs:
+        differences.append(Difference(path, CHANGED, old.key))
+
+    old_entries = collections.OrderedDict(old.entries)
+    new_entries = collections.OrderedDict(new.entries)
+    for key in old_entries:
+        if key not in new_entries:
+            differences.append(Difference(path, REMOVED, key))
+    for key in new_entries:
+        if key not in old_entries:
+            differences.append(Difference(path, ADDED, key))
+    for key, digest in new_entries.items():
+        if key not in old_entries or old_entries[key] == digest:
+            continue
+        if key[0] == 'Menu':
+            differences += diff(old.submenus[key[1]], new.submenus[key[1]], path + (key[1],))
+        else:
+            differences.append(Difference(path, CHANGED, key))
+
+    common = [key for key in old_entries if key in new_entries]
+    if common != [key for key in new_entries if key in old_entries]:
+        differences.append(Difference(path, REORDERED, None))
+    return differences
+
+def findNode(node, path):
+    for menu_id in path:
+        node = node.submenus.get(menu_id)
+        if node is None:
+            return None
+    return node
+
+def resolverChildren(tree):
+    # children() for the records of MenuResolver
+    def children(menu):
+        for item in menu.contents:
+            visible = tree.isVisible(item)
+            if isinstance(item, MenuResolver.Directory):
+                yield ('Menu', item.menu_id, (item.name, visible, item.icon), item)
+            elif isinstance(item, MenuResolver.Entry):
+                yield ('Item', item.desktop_file_id, (item.display_name, visible, item.icon), None)
+            else:
+                yield ('Separator', None, (visible,), None)
+    return children
+
+def fingerprintHome(home, basename=None):
+    tree = MenuResolver.MenuTree(basename, home)
+    try:
+        root = tree.load()
+    except ValueError:
+        return None
+    return build(root, resolverChildren(tree))
+
+def fingerprintHomeArgs(args):
+    return fingerprintHome(*args)
+
+def fingerprintHomes(homes, basename=None, processes=None):
+    jobs = [(home, basename) for home in homes]
+    if len(jobs) < 2 or processes == 1:
+        return [fingerprintHome(*job) for job in jobs]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(fingerprintHomeArgs, jobs, chunksize=16)
+    finally:
+        pool.close()
+        pool.join()
+
+def formatDifference(difference):
+    path = '/'.join(difference.path) or '/'
+    if difference.key is None:
+        return '%s %s' % (difference.change, path)
+    return '%s %s in %s' % (difference.change, difference.key[1], path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Compare the resolved menus of home directories with a reference.')
+    parser.add_argument('reference', help='home directory to compare with')
+    parser.add_argument('homes', nargs='+', help='home directories to compare')
+    parser.add_argument('--menu', help='menu basename, e.g. applications.menu')
+    parser.add_argument('--jobs', type=int, help='number of worker processes')
+    args = parser.parse_args(argv)
+
+    homes = [args.reference] + args.homes
+    nodes = fingerprintHomes(homes, args.menu, args.jobs)
+    reference = nodes[0]
+    if reference is None:
+        sys.stderr.write('can not load the menu of %s\n' % (args.reference,))
+        return 1
+    differing = 0
+    for home, node in zip(args.homes, nodes[1:]):
+        if node is None:
+            sys.stdout.write('%s: can not load the menu\n' % (home,))
+            differing += 1
+            continue
+        differences = diff(reference, node)
+        if differences:
+            differing += 1
+            sys.stdout.write('%s:\n' % (home,))
+            for difference in differences:
+                sys.stdout.write('  %s\n' % (formatDifference(difference),))
+    sys.stdout.write('%d of %d homes differ\n' % (differing, len(args.homes)))
+    return 1 if differing else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,248 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import cairo
+import gettext
+import os
+import threading
+from gi.repository import GLib, GObject, Gtk, Pango
+from Alacarte import DesktopFile
+
+_ = gettext.gettext
+
+ICON_EXTENSIONS = ('.png', '.svg', '.xpm')
+ICON_SIZE = 48
+# how many rows past the visible ones to render ahead when scrolling
+RENDER_AHEAD = 32
+
+COLUMN_NAME = 0
+COLUMN_SURFACE = 1
+
+RESPONSE_FILE = 1
+
+def get_theme_dirs(search_path, theme_name):
+    # the directories of a theme and of the themes it inherits from,
+    # hicolor last as the spec says
+    dirs = []
+    themes = [theme_name]
+    seen = set()
+    while themes:
+        name = themes.pop(0)
+        if name in seen:
+            continue
+        seen.add(name)
+        for path in search_path:
+            theme_dir = os.path.join(path, name)
+            if not os.path.isdir(theme_dir):
+                continue
+            dirs.append(theme_dir)
+            try:
+                values = DesktopFile.parse(os.path.join(theme_dir, 'index.theme'), 'Icon Theme')
+            except IOError:
+                continue
+            themes += DesktopFile.getList(values, 'Inherits')
+        if not themes and 'hicolor' not in seen:
+            themes.append('hicolor')
+    return dirs
+
+def scan_icon_names(search_path, theme_name):
+    names = set()
+    for theme_dir in get_theme_dirs(search_path, theme_name):
+        for dirpath, dirnames, filenames in os.walk(theme_dir):
+            for filename in filenames:
+                base, ext = os.path.splitext(filename)
+                if ext in ICON_EXTENSIONS:
+                    names.add(base)
+    #loose icons, like the ones in /usr/share/pixmaps
+    for path in search_path:
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    base, ext = os.path.splitext(entry.name)
+                    if ext in ICON_EXTENSIONS:
+                        names.add(base)
+        except OSError:
+            pass
+    return sorted(names)
+
+# Index of the icon names of the current theme. Walking a big theme takes
+# a while, so it is done once in a worker thread and shared by all
+# browsers; 'changed' is emitted when the names are there.
+class IconIndex(GObject.GObject):
+    __gsignals__ = {
+        'changed': (GObject.SIGNAL_RUN_FIRST, None, ())
+    }
+
+    default = None
+
+    @classmethod
+    def get_default(cls):
+        if cls.default is None:
+            cls.default = cls()
+        return cls.default
+
+    def __init__(self):
+        GObject.GObject.__init__(self)
+        self.names = []
+        self.ready = False
+        self.theme = Gtk.IconTheme.get_default()
+        self.theme.connect('changed', self.on_theme_changed)
+        self.rescan()
+
+    def rescan(self):
+        search_path = self.theme.get_search_path()
+        theme_name = Gtk.Settings.get_default().props.gtk_icon_theme_name
+        thread = threading.Thread(target=self.scan_thread, args=(search_path, theme_name))
+        thread.daemon = True
+        thread.start()
+
+    def scan_thread(self, search_path, theme_name):
+        names = scan_icon_names(search_path, theme_name)
+        GLib.idle_add(self.scan_finished, names)
+
+    def scan_finished(self, names):
+        self.names = names
+        self.ready = True
+        self.emit('changed')
+        return False
+
+    def on_theme_changed(self, theme):
+        self.rescan()
+
+# Lets the user pick a theme icon by name. All names go in the model but
+# only the rows that are on screen get an image, rendered when they are
+# scrolled into view.
+class IconBrowser(object):
+    def __init__(self, parent):
+        self.index = IconIndex.get_default()
+        self.search = ''
+        self.render_id = 0
+
+        self.dialog = Gtk.Dialog(title=_("Choose an icon"), transient_for=parent, modal=True)
+        self.dialog.add_button(_("From File…"), RESPONSE_FILE)
+        self.dialog.add_button(Gtk.STOCK_CANCEL, Gtk.ResponseType.REJECT)
+        self.ok_button = self.dialog.add_button(Gtk.STOCK_OK, Gtk.ResponseType.ACCEPT)
+        self.ok_button.set_sensitive(False)
+        self.dialog.set_default_size(560, 480)
+
+        self.store = Gtk.ListStore(str, cairo.Surface)
+        self.filter = self.store.filter_new()
+        self.filter.set_visible_func(self.filter_func)
+
+        self.icon_view = Gtk.IconView(model=self.filter)
+        self.icon_view.set_item_width(ICON_SIZE + 48)
+        self.icon_view.set_selection_mode(Gtk.SelectionMode.BROWSE)
+        cell = Gtk.CellRendererPixbuf()
+        #a fixed size keeps the layout from needing the images
+        cell.set_fixed_size(ICON_SIZE, ICON_SIZE)
+        self.icon_view.pack_start(cell, False)
+        self.icon_view.add_attribute(cell, 'surface', COLUMN_SURFACE)
+        cell = Gtk.CellRendererText()
+        cell.props.ellipsize = Pango.EllipsizeMode.END
+        cell.props.xalign = 0.5
+        self.icon_view.pack_start(cell, False)
+        self.icon_view.add_attribute(cell, 'text', COLUMN_NAME)
+        self.icon_view.connect('selection-changed', self.on_selection_changed)
+        self.icon_view.connect('item-activated', self.on_item_activated)
+
+        scrolled = Gtk.ScrolledWindow()
+        scrolled.add(self.icon_view)
+        scrolled.get_vadjustment().connect('value-changed', self.queue_render)
+        self.icon_view.connect('size-allocate', self.queue_render)
+
+        self.search_entry = Gtk.SearchEntry()
+        self.search_entry.connect('search-changed', self.on_search_changed)
+
+        box = self.dialog.get_content_area()
+        box.set_spacing(6)
+        box.pack_start(self.search_entry, False, False, 0)
+        box.pack_start(scrolled, True, True, 0)
+
+        self.index_id = self.index.connect('changed', self.fill)
+        self.dialog.connect('destroy', self.on_destroy)
+        if self.index.ready:
+            self.fill()
+
+    def fill(self, *args):
+        self.icon_view.set_model(None)
+        self.store.clear()
+        for name in self.index.names:
+            self.store.append((name, None))
+        self.icon_view.set_model(self.filter)
+        self.queue_render()
+
+    def filter_func(self, model, iter, data):
+        return not self.search or self.search in model[iter][COLUMN_NAME].lower()
+
+    def on_search_changed(self, entry):
+        self.search = entry.get_text().strip().lower()
+        self.filter.refilter()
+        self.queue_render()
+
+    def queue_render(self, *args):
+        if not self.render_id:
+            self.render_id = GLib.idle_add(self.render_visible)
+
+    def render_visible(self):
+        self.render_id = 0
+        visible = self.icon_view.get_visible_range()
+        if visible is None:
+            return False
+        start, end = visible
+        first = start.get_indices()[0]
+        last = min(end.get_indices()[0] + RENDER_AHEAD, len(self.filter) - 1)
+        theme = Gtk.IconTheme.get_default()
+        scale = self.icon_view.get_scale_factor()
+        window = self.icon_view.get_window()
+        for index in range(first, last + 1):
+            row = self.filter[index]
+            if row[COLUMN_SURFACE] is not None:
+                continue
+            try:
+                surface = theme.load_surface(row[COLUMN_NAME], ICON_SIZE, scale, window, Gtk.IconLookupFlags.FORCE_SIZE)
+            except GLib.GError:
+                surface = None
+            if surface is not None:
+                child = self.filter.convert_iter_to_child_iter(row.iter)
+                self.store[child][COLUMN_SURFACE] = surface
+        return False
+
+    def get_selected_name(self):
+        paths = self.icon_view.get_selected_items()
+        if not paths:
+            return None
+        return self.filter[paths[0]][COLUMN_NAME]
+
+    def on_selection_changed(self, icon_view):
+        self.ok_button.set_sensitive(self.get_selected_name() is not None)
+
+    def on_item_activated(self, icon_view, path):
+        self.dialog.response(Gtk.ResponseType.ACCEPT)
+
+    def on_destroy(self, dialog):
+        self.index.disconnect(self.index_id)
+        if self.render_id:
+            GLib.source_remove(self.render_id)
+            self.render_id = 0
+
+    def run(self):
+        self.dialog.show_all()
+        self.search_entry.grab_focus()
+        response = self.dialog.run()
+        name = self.get_selected_name()
+        self.dialog.destroy()
+        return response, name
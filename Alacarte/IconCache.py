@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Keeps the scaled icons of the menu views in $XDG_CACHE_HOME/alacarte,
+# one file per icon size and scale factor, so a new window doesn't have
+# to decode and scale every icon again.
+#
+# The file holds a header, an index and the raw pixels:
+#   header  magic, version, number of entries
+#   entry   offset, length, rowstride, width, height, last used day,
+#           has alpha, key length, followed by the key
+# Entries are keyed by icon file path, mtime and theme name. When the file
+# grows over MAX_SIZE the entries used least recently are dropped.
+
+import mmap
+import os
+import struct
+import time
+from gi.repository import GdkPixbuf, GLib
+from Alacarte.FileOps import replaceFile
+
+MAGIC = b'ALIC'
+VERSION = 1
+MAX_SIZE = 4 * 1024 * 1024
+
+HEADER = struct.Struct('<4sHI')
+ENTRY = struct.Struct('<QIIHHIBH')
+
+def getCacheHome():
+    return os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache'))
+
+def getToday():
+    return int(time.time() // 86400)
+
+def makeKey(path, theme):
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+    return '%s\0%d\0%s' % (path, mtime, theme or '')
+
+class CacheEntry(object):
+    def __init__(self, width, height, rowstride, has_alpha, last_used, data=None, offset=0, length=0):
+        self.width = width
+        self.height = height
+        self.rowstride = rowstride
+        self.has_alpha = has_alpha
+        self.last_used = last_used
+        self.data = data
+        self.offset = offset
+        self.length = length
+
+class IconCache(object):
+    def __init__(self, size, scale=1, path=None):
+        self.size = size
+        self.scale = scale
+        self.path = path or os.path.join(getCacheHome(), 'alacarte', 'icons-%d@%d.cache' % (size, scale))
+        self.entries = {}
+        self.pixbufs = {}
+        self.mm = None
+        self.bytes = None
+        self.dirty = False
+        self.today = getToday()
+        self.load()
+
+    def load(self):
+        # the file is mapped twice from one fd: as mmap to read the index
+        # and as GBytes the pixbufs use slices of, so the pixels are never
+        # copied; the page cache holds them once either way
+        try:
+            with open(self.path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                mapped = GLib.MappedFile.new_from_fd(f.fileno(), False)
+        except (OSError, ValueError, GLib.Error):
+            return
+        self.mm = mm
+        self.bytes = mapped.get_bytes()
+        try:
+            self.entries = self.readIndex(self.mm)
+        except (struct.error, ValueError, UnicodeDecodeError):
+            #a broken cache is just thrown away on the next save
+            self.entries = {}
+            self.dirty = True
+
+    def readIndex(self, mm):
+        magic, version, count = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not an icon cache")
+        entries = {}
+        pos = HEADER.size
+        for i in range(count):
+            offset, length, rowstride, width, height, last_used, has_alpha, key_length = ENTRY.unpack_from(mm, pos)
+            pos += ENTRY.size
+            key = mm[pos:pos + key_length].decode('utf-8')
+            pos += key_length
+            if offset + length > len(mm):
+                raise ValueError("truncated icon cache")
+            entries[key] = CacheEntry(width, height, rowstride, bool(has_alpha), last_used, offset=offset, length=length)
+        return entries
+
+    def getData(self, entry):
+        if entry.data is None:
+            return memoryview(self.mm)[entry.offset:entry.offset + entry.length]
+        return entry.data
+
+    def getBytes(self, entry):
+        if entry.data is None:
+            return GLib.Bytes.new_from_bytes(self.bytes, entry.offset, entry.length)
+        return GLib.Bytes.new(entry.data)
+
+    def lookup(self, key):
+        pixbuf = self.pixbufs.get(key)
+        if pixbuf is not None:
+            return pixbuf
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry.last_used != self.today:
+            entry.last_used = self.today
+            self.dirty = True
+        pixbuf = GdkPixbuf.Pixbuf.new_from_bytes(self.getBytes(entry),
+                                                 GdkPixbuf.Colorspace.RGB, entry.has_alpha, 8,
+                                                 entry.width, entry.height, entry.rowstride)
+        self.pixbufs[key] = pixbuf
+        return pixbuf
+
+    def insert(self, key, pixbuf):
+        self.pixbufs[key] = pixbuf
+        if pixbuf.get_bits_per_sample() != 8 or pixbuf.get_colorspace() != GdkPixbuf.Colorspace.RGB:
+            return
+        data = pixbuf.get_pixels()
+        self.entries[key] = CacheEntry(pixbuf.get_width(), pixbuf.get_height(), pixbuf.get_rowstride(),
+                                       pixbuf.get_has_alpha(), self.today, data=data, length=len(data))
+        self.dirty = True
+
+    def evict(self):
+        #keep the entries used most recently that fit in MAX_SIZE
+        keys = sorted(self.entries, key=lambda key: self.entries[key].last_used, reverse=True)
+        total = HEADER.size
+        kept = {}
+        for key in keys:
+            entry = self.entries[key]
+            total += ENTRY.size + len(key.encode('utf-8')) + entry.length
+            if total > MAX_SIZE:
+                break
+            kept[key] = entry
+        return kept
+
+    def pack(self, entries):
+        index = []
+        keys = [(key, key.encode('utf-8')) for key in entries]
+        offset = HEADER.size + sum(ENTRY.size + len(raw) for key, raw in keys)
+        for key, raw in keys:
+            entry = entries[key]
+            index.append(ENTRY.pack(offset, entry.length, entry.rowstride, entry.width, entry.height,
+                                    entry.last_used, entry.has_alpha, len(raw)) + raw)
+            offset += entry.length
+        chunks = [HEADER.pack(MAGIC, VERSION, len(keys))] + index
+        chunks += [self.getData(entries[key]) for key, raw in keys]
+        return chunks
+
+    def save(self):
+        if not self.dirty:
+            return
+        entries = self.evict()
+        chunks = self.pack(entries)
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            replaceFile(self.path, lambda f: f.writelines(chunks))
+        except OSError:
+            return
+        self.dirty = False
+        self.entries = entries
+
+caches = {}
+
+def getCache(size, scale=1):
+    cache = caches.get((size, scale))
+    if cache is None:
+        cache = caches[(size, scale)] = IconCache(size, scale)
+    return cache
+
+def saveAll():
+    for cache in caches.values():
+        cache.save()
@@ -22,12 +22,19 @@ import os
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import GLib, GObject, Gtk, Gdk, GdkPixbuf
-from Alacarte import config, util
+from Alacarte import util
+from Alacarte.FileWriter import FileWriter
+from Alacarte.PathIndex import PathIndex
+from Alacarte.IconBrowser import IconBrowser, RESPONSE_FILE
 
 _ = gettext.gettext
 
 EXTENSIONS = (".png", ".xpm", ".svg")
 
+# milliseconds to wait after the last keystroke before validating
+VALIDATE_DELAY = 150
+COMPLETION_LIMIT = 100
+
 def try_icon_name(filename):
     # Detect if the user picked an icon, and make
     # it into an icon name.
@@ -92,7 +99,6 @@ def set_icon_string(image, icon):
 
 DESKTOP_GROUP = GLib.KEY_FILE_DESKTOP_GROUP
 
-# XXX - replace with a better UI eventually
 class IconPicker(object):
     def __init__(self, dialog, button, image):
         self.dialog = dialog
@@ -101,6 +107,13 @@ class IconPicker(object):
         self.image = image
 
     def pick_icon(self, button):
+        response, name = IconBrowser(self.dialog).run()
+        if response == Gtk.ResponseType.ACCEPT and name is not None:
+            self.image.props.icon_name = name
+        elif response == RESPONSE_FILE:
+            self.pick_icon_file()
+
+    def pick_icon_file(self):
         chooser = Gtk.FileChooserDialog(title=_("Choose an icon"),
                                         parent=self.dialog,
                                         buttons=(Gtk.STOCK_CANCEL, Gtk.ResponseType.REJECT,
@@ -117,20 +130,39 @@ class ItemEditor(GObject.GObject):
         'response': (GObject.SIGNAL_RUN_FIRST, None, (bool,))
     }
 
-    def __init__(self, parent, item_path):
+    # hidden editors of each class, waiting to be used for the next item
+    pools = {}
+
+    @classmethod
+    def acquire(cls, parent, item_path, writer=None):
+        pool = cls.pools.setdefault(cls, [])
+        if pool:
+            editor = pool.pop()
+            editor.dialog.set_transient_for(parent)
+            if writer is not None:
+                editor.writer = writer
+        else:
+            editor = cls(parent, writer=writer)
+        editor.reset(item_path)
+        return editor
+
+    def __init__(self, parent, item_path=None, writer=None):
         GObject.GObject.__init__(self)
-        self.builder = Gtk.Builder()
-        self.builder.add_from_file(os.path.join(config.pkgdatadir, self.ui_file))
+        self.writer = writer if writer is not None else FileWriter()
+        self.builder = util.newBuilder(self.ui_file)
 
         self.dialog = self.builder.get_object('editor')
         self.dialog.set_transient_for(parent)
         self.dialog.connect('response', self.on_response)
+        self.dialog.connect('delete-event', self.on_delete_event)
+        self.default_icon = self.builder.get_object('icon-image').props.icon_name
+        self.response_ids = []
 
         self.build_ui()
 
-        self.item_path = item_path
-        self.load()
-        self.resync_validity()
+        self.item_path = None
+        if item_path is not None:
+            self.reset(item_path)
 
     def build_ui(self):
         raise NotImplementedError()
@@ -138,27 +170,41 @@ class ItemEditor(GObject.GObject):
     def get_keyfile_edits(self):
         raise NotImplementedError()
 
+    def reset(self, item_path):
+        self.item_path = item_path
+        self.load()
+        self.resync_validity()
+
+    def connect_response(self, callback, *data):
+        # handlers connected here are dropped when the editor goes back
+        # to the pool
+        self.response_ids.append(self.connect('response', callback, *data))
+
+    def release(self):
+        for handler_id in self.response_ids:
+            self.disconnect(handler_id)
+        self.response_ids = []
+        self.pools.setdefault(type(self), []).append(self)
+
     def set_text(self, ctl, name):
         try:
             val = self.keyfile.get_string(DESKTOP_GROUP, name)
         except GLib.GError:
-            pass
-        else:
-            self.builder.get_object(ctl).set_text(val)
+            val = ''
+        self.builder.get_object(ctl).set_text(val)
 
     def set_check(self, ctl, name):
         try:
             val = self.keyfile.get_boolean(DESKTOP_GROUP, name)
         except GLib.GError:
-            pass
-        else:
-            self.builder.get_object(ctl).set_active(val)
+            val = False
+        self.builder.get_object(ctl).set_active(val)
 
     def set_icon(self, ctl, name):
         try:
             val = self.keyfile.get_string(DESKTOP_GROUP, name)
         except GLib.GError:
-            pass
+            self.builder.get_object(ctl).props.icon_name = self.default_icon
         else:
             set_icon_string(self.builder.get_object(ctl), val)
 
@@ -170,19 +216,28 @@ class ItemEditor(GObject.GObject):
             pass
 
     def save(self):
+        if os.path.isfile(self.item_path):
+            self.writer.patch(self.item_path, self.item_path, self.get_keyfile_edits())
+            return
+
         util.fillKeyFile(self.keyfile, self.get_keyfile_edits())
         contents, length = self.keyfile.to_data()
-        with open(self.item_path, 'w') as f:
-            f.write(contents)
+        self.writer.write(self.item_path, contents)
 
     def run(self):
         self.dialog.present()
 
+    def on_delete_event(self, dialog, event):
+        #keep the dialog around for the next item
+        dialog.response(Gtk.ResponseType.DELETE_EVENT)
+        return True
+
     def on_response(self, dialog, response):
         if response == Gtk.ResponseType.OK:
             self.save()
-        self.dialog.destroy()
+        self.dialog.hide()
         self.emit('response', response == Gtk.ResponseType.OK)
+        self.release()
 
 class LauncherEditor(ItemEditor):
     ui_file = 'launcher-editor.ui'
@@ -194,8 +249,49 @@ class LauncherEditor(ItemEditor):
 
         self.builder.get_object('exec-browse').connect('clicked', self.pick_exec)
 
-        self.builder.get_object('name-entry').connect('changed', self.resync_validity)
-        self.builder.get_object('exec-entry').connect('changed', self.resync_validity)
+        self.path_index = PathIndex.get_default()
+        self.path_index_id = self.path_index.connect('changed', self.resync_validity)
+        self.resync_id = 0
+        self.dialog.connect('destroy', self.on_destroy)
+
+        self.completion_store = Gtk.ListStore(str)
+        completion = Gtk.EntryCompletion()
+        completion.set_model(self.completion_store)
+        completion.set_text_column(0)
+        completion.set_minimum_key_length(2)
+        completion.set_inline_completion(True)
+
+        exec_entry = self.builder.get_object('exec-entry')
+        exec_entry.set_completion(completion)
+        exec_entry.connect('changed', self.update_completion)
+
+        self.builder.get_object('name-entry').connect('changed', self.queue_resync)
+        exec_entry.connect('changed', self.queue_resync)
+
+    def on_destroy(self, dialog):
+        self.path_index.disconnect(self.path_index_id)
+        if self.resync_id:
+            GLib.source_remove(self.resync_id)
+            self.resync_id = 0
+
+    def update_completion(self, entry):
+        self.completion_store.clear()
+        prefix = entry.get_text()
+        # only complete the command itself, not its arguments
+        if len(prefix) < 2 or os.sep in prefix or prefix != prefix.lstrip() or ' ' in prefix:
+            return
+        for name in self.path_index.complete(prefix, COMPLETION_LIMIT):
+            self.completion_store.append((name,))
+
+    def queue_resync(self, *args):
+        if self.resync_id:
+            GLib.source_remove(self.resync_id)
+        self.resync_id = GLib.timeout_add(VALIDATE_DELAY, self.on_resync_timeout)
+
+    def on_resync_timeout(self):
+        self.resync_id = 0
+        self.resync_validity()
+        return False
 
     def exec_line_is_valid(self, exec_text):
         try:
@@ -203,7 +299,7 @@ class LauncherEditor(ItemEditor):
 
             # Make sure program (first part of the command) is in the path
             command = parsed[0]
-            return (GLib.find_program_in_path(command) is not None)
+            return (self.path_index.find_program(command) is not None)
         except GLib.GError:
             return False
 
@@ -279,7 +375,7 @@ def test():
 
     Gtk.Window.set_default_icon_name('alacarte')
     editor = test_editor(sys.argv[1])
-    editor.dialog.connect('destroy', Gtk.main_quit)
+    editor.connect_response(lambda editor, modified: Gtk.main_quit())
     editor.run()
     Gtk.main()
 
@@ -0,0 +1,339 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Finds broken launchers: an Exec or TryExec program that isn't in $PATH,
+# an Icon that isn't installed, and keys or values the desktop entry spec
+# doesn't allow. The main window shows the findings in the item list,
+#
+#   alacarte lint [--menu applications.menu] [--jobs N] [--no-cache]
+#
+# prints them for every launcher of the menu and exits with 1 if there
+# are any.
+#
+# The checks don't use GLib, so the files are checked in worker processes.
+# The results are kept in $XDG_CACHE_HOME/alacarte/lint.json by path,
+# mtime and size of the file; a run only checks the files that changed.
+# The cache is dropped when $PATH or the data dirs change, since the
+# results depend on them.
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import re
+import shlex
+import sys
+import tempfile
+from Alacarte import DesktopFile, xdg
+
+VERSION = 1
+
+Finding = collections.namedtuple('Finding', 'check message')
+
+# the keys of the desktop entry spec, version 1.5
+KEYS = frozenset(('Type', 'Version', 'Name', 'GenericName', 'NoDisplay', 'Comment', 'Icon', 'Hidden',
+                  'OnlyShowIn', 'NotShowIn', 'DBusActivatable', 'TryExec', 'Exec', 'Path', 'Terminal',
+                  'Actions', 'MimeType', 'Categories', 'Implements', 'Keywords', 'StartupNotify',
+                  'StartupWMClass', 'URL', 'PrefersNonDefaultGPU', 'SingleMainWindow',
+                  'Encoding', 'MiniIcon', 'TerminalOptions', 'SwallowTitle', 'SwallowExec',
+                  'SortOrder', 'FilePattern'))
+BOOLEAN_KEYS = ('NoDisplay', 'Hidden', 'DBusActivatable', 'Terminal', 'StartupNotify',
+                'PrefersNonDefaultGPU', 'SingleMainWindow')
+TYPES = ('Application', 'Link', 'Directory')
+KEY_RE = re.compile(r'^[A-Za-z0-9-]+(\[[^\]]+\])?$')
+ICON_EXTENSIONS = ('.png', '.svg', '.svgz', '.xpm')
+
+def getCachePath():
+    cache_home = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser(os.path.join('~', '.cache'))
+    return os.path.join(cache_home, 'alacarte', 'lint.json')
+
+def getEnvironment():
+    # what the results depend on besides the file
+    return '%s\0%s\0%s' % (os.environ.get('PATH', os.defpath), xdg.getDataHome(), os.pathsep.join(xdg.getDataDirs()))
+
+def getStat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_mtime_ns, st.st_size]
+
+# Per process state of the checks, made once and handed to the workers.
+
+path_dirs = None
+icon_names = None
+
+def getPathDirs():
+    global path_dirs
+    if path_dirs is None:
+        path_dirs = []
+        for path in os.environ.get('PATH', os.defpath).split(os.pathsep):
+            path = os.path.abspath(path or os.curdir)
+            if path not in path_dirs:
+                path_dirs.append(path)
+    return path_dirs
+
+def getIconDirs():
+    dirs = [os.path.expanduser(os.path.join('~', '.icons'))]
+    dirs += [os.path.join(path, 'icons') for path in [xdg.getDataHome()] + xdg.getDataDirs()]
+    dirs += ['/usr/share/pixmaps']
+    return dirs
+
+def getIconNames():
+    # names of the icons in all themes, with and without extension
+    global icon_names
+    if icon_names is None:
+        icon_names = set()
+        for path in getIconDirs():
+            for dirpath, dirnames, filenames in os.walk(path, followlinks=True):
+                for filename in filenames:
+                    name, extension = os.path.splitext(filename)
+                    if extension in ICON_EXTENSIONS:
+                        icon_names.add(name)
+                        icon_names.add(filename)
+    return icon_names
+
+def prepare():
+    getPathDirs()
+    getIconNames()
+
+def setState(dirs, names):
+    # the initializer of the workers
+    global path_dirs, icon_names
+    path_dirs = dirs
+    icon_names = names
+
+def findProgram(command):
+    # like PathIndex.find_program
+    if os.sep in command:
+        return command if os.path.isfile(command) and os.access(command, os.X_OK) else None
+    for path in getPathDirs():
+        program = os.path.join(path, command)
+        if os.path.isfile(program) and os.access(program, os.X_OK):
+            return program
+    return None
+
+def checkKeys(values):
+    findings = []
+    for key in values:
+        if not KEY_RE.match(key):
+            findings.append(Finding('key', 'invalid key name %r' % (key,)))
+            continue
+        name = key.split('[', 1)[0]
+        if name not in KEYS and not name.startswith('X-'):
+            findings.append(Finding('key', 'unknown key %s' % (name,)))
+    for key in BOOLEAN_KEYS:
+        if key in values and values[key] not in ('true', 'false'):
+            findings.append(Finding('key', '%s is not a boolean: %r' % (key, values[key])))
+    entry_type = values.get('Type')
+    if entry_type is None:
+        findings.append(Finding('key', 'Type is missing'))
+    elif entry_type not in TYPES:
+        findings.append(Finding('key', 'unknown Type %r' % (entry_type,)))
+    if not values.get('Name'):
+        findings.append(Finding('key', 'Name is missing'))
+    if entry_type == 'Link' and not values.get('URL'):
+        findings.append(Finding('key', 'URL is missing'))
+    return findings
+
+def checkExec(values):
+    if values.get('Type') != 'Application':
+        return []
+    exec_line = values.get('Exec')
+    if not exec_line:
+        if DesktopFile.getBoolean(values, 'DBusActivatable'):
+            return []
+        return [Finding('exec', 'Exec is missing')]
+    try:
+        argv = shlex.split(DesktopFile.unescapeValue(exec_line))
+    except ValueError as e:
+        return [Finding('exec', 'can not parse Exec: %s' % (e,))]
+    if not argv:
+        return [Finding('exec', 'Exec is empty')]
+    if findProgram(argv[0]) is None:
+        return [Finding('exec', '%s is not in PATH' % (argv[0],))]
+    return []
+
+def checkTryExec(values):
+    try_exec = values.get('TryExec')
+    if try_exec and findProgram(DesktopFile.unescapeValue(try_exec)) is None:
+        return [Finding('tryexec', 'TryExec %s is not installed' % (try_exec,))]
+    return []
+
+def checkIcon(values):
+    icon = values.get('Icon')
+    if not icon:
+        return []
+    icon = DesktopFile.unescapeValue(icon)
+    if os.path.isabs(icon):
+        if not os.path.isfile(icon):
+            return [Finding('icon', 'icon file %s is missing' % (icon,))]
+    elif icon not in getIconNames():
+        return [Finding('icon', 'icon %s is not installed' % (icon,))]
+    return []
+
+def checkFile(path):
+    try:
+        values = DesktopFile.parse(path)
+    except OSError as e:
+        return [Finding('file', 'can not read the file: %s' % (e.strerror or e,))]
+    if not values:
+        return [Finding('file', 'no [Desktop Entry] group')]
+    return checkKeys(values) + checkExec(values) + checkTryExec(values) + checkIcon(values)
+
+def checkFileArgs(path):
+    return path, getStat(path), checkFile(path)
+
+class ResultCache(object):
+    def __init__(self, path=None):
+        self.path = path or getCachePath()
+        self.environment = getEnvironment()
+        self.entries = {}
+        self.changed = False
+
+    def load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if not isinstance(data, dict) or data.get('version') != VERSION or data.get('environment') != self.environment:
+            return
+        self.entries = data.get('entries', {})
+
+    def save(self):
+        if not self.changed:
+            return
+        data = dict(version=VERSION, environment=self.environment, entries=self.entries)
+        dirname, basename = os.path.split(self.path)
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix='.' + basename + '.', dir=dirname)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.path)
+        except:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        self.changed = False
+
+    def get(self, path):
+        # the findings for path if it didn't change since they were made
+        entry = self.entries.get(path)
+        if entry is None or entry[0] != getStat(path):
+            return None
+        return [Finding(*finding) for finding in entry[1]]
+
+    def put(self, path, stat, findings):
+        self.entries[path] = [stat, [list(finding) for finding in findings]]
+        self.changed = True
+
+    def prune(self, paths):
+        # forget the files that are no longer in the menu
+        paths = set(paths)
+        for path in list(self.entries):
+            if path not in paths:
+                del self.entries[path]
+                self.changed = True
+
+def lintFiles(paths, processes=None, cache=None):
+    # path -> findings for every .desktop file in paths
+    results = {}
+    todo = []
+    for path in paths:
+        findings = cache.get(path) if cache is not None else None
+        if findings is None:
+            todo.append(path)
+        else:
+            results[path] = findings
+
+    if todo:
+        prepare()
+        if len(todo) < 32 or processes == 1:
+            checked = [checkFileArgs(path) for path in todo]
+        else:
+            #the workers come from a fork server, not from this process:
+            #the main window calls this with the file writer and GLib
+            #threads running, and a fork could copy their locks held
+            context = multiprocessing.get_context('forkserver')
+            pool = context.Pool(processes, setState, (getPathDirs(), getIconNames()))
+            try:
+                checked = pool.map(checkFileArgs, todo, chunksize=16)
+            finally:
+                pool.close()
+                pool.join()
+        for path, stat, findings in checked:
+            results[path] = findings
+            if cache is not None and stat is not None:
+                cache.put(path, stat, findings)
+
+    if cache is not None:
+        try:
+            cache.save()
+        except OSError:
+            pass
+    return results
+
+def collectEntries(tree):
+    # (menu path, file id, file path) of every launcher of a MenuResolver
+    # tree, depth first
+    from Alacarte import MenuResolver
+    entries = []
+    def walk(menu, path):
+        for item, visible in tree.getItems(menu):
+            if isinstance(item, MenuResolver.Directory):
+                walk(item, (path + '/' if path else '') + item.menu_id)
+            elif isinstance(item, MenuResolver.Entry) and item.desktop_file_path:
+                entries.append((path, item.desktop_file_id, item.desktop_file_path))
+    walk(tree.getRoot(), '')
+    return entries
+
+def main(basename=None, processes=None, use_cache=True):
+    from Alacarte import MenuResolver
+    tree = MenuResolver.MenuTree(basename)
+    try:
+        entries = collectEntries(tree)
+    except ValueError as e:
+        sys.stderr.write('alacarte: %s\n' % (e,))
+        return 1
+    cache = None
+    if use_cache:
+        cache = ResultCache()
+        cache.load()
+    paths = sorted(set(path for menu, file_id, path in entries))
+    if cache is not None:
+        cache.prune(paths)
+    results = lintFiles(paths, processes, cache)
+
+    count = 0
+    for menu, file_id, path in entries:
+        for finding in results.get(path, ()):
+            sys.stdout.write('%s/%s: %s: %s\n' % (menu, file_id, finding.check, finding.message))
+            count += 1
+    return 1 if count else 0
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check the launchers of a menu for problems.')
+    parser.add_argument('--menu', help='menu basename, e.g. applications.menu')
+    parser.add_argument('--jobs', type=int, help='number of worker processes')
+    parser.add_argument('--no-cache', action='store_true', help='check every file again')
+    args = parser.parse_args()
+    sys.exit(main(args.menu, args.jobs, not args.no_cache))
@@ -20,28 +20,72 @@
 import gi
 gi.require_version('GMenu', '3.0')
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, GdkPixbuf, Gdk, GMenu
+from gi.repository import Gtk, Gdk, GMenu, GLib
+import cairo
 import sys
 import html
 import os
+import threading
 import gettext
-import shutil
 
 from Alacarte import config
 gettext.bindtextdomain(config.GETTEXT_PACKAGE, config.localedir)
 gettext.textdomain(config.GETTEXT_PACKAGE)
 
 _ = gettext.gettext
-from Alacarte.MenuEditor import MenuEditor
+from Alacarte.MenuEditor import MenuEditor, get_default_menu
+from Alacarte.FileWriter import AsyncFileWriter
+from Alacarte.MenuService import MenuService
+from Alacarte.MenuClient import ServiceError
+from Alacarte.ChangeMonitor import ChangeMonitor, MENU, SETTLE_DELAY as MONITOR_DELAY
 from Alacarte.ItemEditor import LauncherEditor, DirectoryEditor
-from Alacarte import util
+from Alacarte import util, IconCache, Fingerprint, SystemIndex, MemoryStats, Lint
+
+# milliseconds to wait after the last change before updating the views,
+# longer than the monitor takes to report a burst so both are seen
+SETTLE_DELAY = MONITOR_DELAY + 100
+
+#rows of the item list being dragged, within this process
+DRAG_TARGET = 'alacarte-item'
+
+def getItemName(item):
+    if isinstance(item, GMenu.TreeDirectory):
+        return item.get_name()
+    elif isinstance(item, GMenu.TreeEntry):
+        return item.get_app_info().get_display_name()
+    elif isinstance(item, GMenu.TreeSeparator):
+        return '---'
+    else:
+        assert False, 'should not be reached'
+
+def getItemKey(item):
+    if isinstance(item, GMenu.TreeDirectory):
+        return ('Menu', item.get_menu_id())
+    elif isinstance(item, GMenu.TreeEntry):
+        return ('Item', item.get_desktop_file_id())
+    return ('Separator',)
+
+def iconChanged(old, new):
+    old_icon = util.getItemGIcon(old)
+    new_icon = util.getItemGIcon(new)
+    if old_icon is None or new_icon is None:
+        return old_icon is not new_icon
+    return not old_icon.equal(new_icon)
+
+# what the window keeps of every menu it has opened, so switching back to
+# one doesn't load it again
+class MenuState(object):
+    def __init__(self, editor):
+        self.editor = editor
+        self.menu_store = Gtk.TreeStore(cairo.Surface, str, object)
+        self.fingerprint = None
+        self.selected = None
+        self.service = None
 
 class MainWindow(object):
     def __init__(self):
         Gtk.Window.set_default_icon_name('alacarte')
-        self.tree = Gtk.Builder()
-        self.tree.set_translation_domain(config.GETTEXT_PACKAGE)
-        self.tree.add_from_file(os.path.join(config.pkgdatadir, 'alacarte.ui'))
+        self.tree = util.newBuilder('alacarte.ui')
         self.tree.connect_signals(self)
         self.setupMenuTree()
         self.setupItemTree()
@@ -52,24 +96,184 @@ class MainWindow(object):
         self.tree.get_object('new_separator_button').set_sensitive(False)
 
         self.main_window = self.tree.get_object('mainwindow')
-
+        self.scale = self.main_window.get_scale_factor()
+        self.main_window.connect('notify::scale-factor', self.on_scale_factor_changed)
+
+        self.writer = AsyncFileWriter()
+        self.writer.connect('error', self.on_write_error)
+        #the menus share the writer, the file monitors and the caches in
+        #util, IconCache and SystemIndex
+        self.menus = {}
+        self.basename = None
         self.editor = None
+        #the tree the views show
+        self.fingerprint = None
+
+        self.memoryStats = MemoryStats.Sampler() if MemoryStats.isEnabled() else None
+
+        #findings of Lint by .desktop file path, for all menus
+        self.lintResults = {}
+        self.lintCache = Lint.ResultCache()
+        self.lintThread = None
+        self.lintQueued = False
+
+        self.pendingChanges = set()
+        self.settleId = 0
+        self.changeMonitor = ChangeMonitor()
+        self.changeMonitor.connect('changed', self.on_files_changed)
 
     def setMenuBasename(self, menu_basename):
-        if self.editor is not None:
-            self.editor.tree.disconnect(self.menuChangedId)
+        menu_basename = menu_basename or get_default_menu()
+        if menu_basename == self.basename:
+            return
+        if self.basename is not None:
+            self.saveMenuState(self.menus[self.basename])
+
+        state = self.menus.get(menu_basename)
+        self.basename = menu_basename
+        #comes back here and returns above
+        self.tree.get_object('menu_switcher').set_active_id(menu_basename)
+        if state is None:
+            state = self.menus[menu_basename] = MenuState(MenuEditor(menu_basename, self.writer))
+            state.editor.tree.connect("changed", self.menuChanged, menu_basename)
+            self.editor = state.editor
+            self.menu_store = state.menu_store
+            self.loadMenus()
+            self.startService(state)
+            return
 
-        self.editor = MenuEditor(menu_basename)
-        self.menuChangedId = self.editor.tree.connect("changed", self.menuChanged)
-        self.menuChanged()
+        #the views of this menu are still there, only update them if it
+        #changed while another menu was shown
+        self.editor = state.editor
+        self.menu_store = state.menu_store
+        self.fingerprint = state.fingerprint
+        menu_tree = self.tree.get_object('menu_tree')
+        menu_tree.set_model(self.menu_store)
+        menu_tree.get_selection().select_path(state.selected or (0,))
+        if Fingerprint.diff(self.fingerprint, self.editor.getFingerprint()):
+            self.refreshMenus()
+        #the item list is shared, fill it for this menu
+        self.on_menu_tree_cursor_changed(menu_tree)
+
+    def saveMenuState(self, state):
+        state.fingerprint = self.fingerprint
+        menus, iter = self.tree.get_object('menu_tree').get_selection().get_selected()
+        state.selected = menus.get_path(iter) if iter else None
+
+    def setupMenuSwitcher(self):
+        switcher = self.tree.get_object('menu_switcher')
+        basenames = util.getMenuBasenames()
+        if self.basename not in basenames:
+            basenames.append(self.basename)
+        for basename in basenames:
+            switcher.append(basename, basename)
+        switcher.set_active_id(self.basename)
+        switcher.set_visible(len(basenames) > 1)
+
+    def on_menu_switcher_changed(self, switcher):
+        basename = switcher.get_active_id()
+        if basename is not None:
+            self.setMenuBasename(basename)
+
+    def startService(self, state):
+        #let scripts edit through our editor while the window is open, unless
+        #a menu service is already running
+        service = MenuService(state.editor)
+        try:
+            service.start()
+        except (ServiceError, OSError):
+            return
+        state.service = service
 
     def run(self):
-        self.loadMenus()
         self.tree.get_object('mainwindow').show_all()
+        self.setupMenuSwitcher()
         Gtk.main()
 
-    def menuChanged(self, *a):
-        self.loadUpdates()
+    def menuChanged(self, tree, basename):
+        #other menus are brought up to date when they are switched to
+        if basename == self.basename:
+            self.queueSettle()
+
+    def on_files_changed(self, monitor, change):
+        #the shared index may be stale now, or rebuilt
+        SystemIndex.refresh()
+        self.pendingChanges.add(change.kind)
+        self.queueSettle()
+
+    def queueSettle(self):
+        #wait for the tree and the file monitors to calm down, then update
+        #the views once
+        if self.settleId:
+            GLib.source_remove(self.settleId)
+        self.settleId = GLib.timeout_add(SETTLE_DELAY, self.on_settled)
+
+    def on_settled(self):
+        self.settleId = 0
+        kinds = self.pendingChanges
+        self.pendingChanges = set()
+        #when nothing the views show has changed the rows still need the
+        #reloaded objects (e.g. the path of a new override), without a rebuild
+        unchanged = self.fingerprint is not None and not Fingerprint.diff(self.fingerprint, self.editor.getFingerprint())
+        #only .menu changes can move things around, the rest is updated in
+        #place (which still rebuilds if the structure turns out different)
+        if unchanged or self.editor.ownChange or (kinds and MENU not in kinds):
+            self.refreshMenus()
+        else:
+            self.loadUpdates()
+        self.startLint()
+        return False
+
+    def refreshMenus(self):
+        #the tree was reloaded because of our own writes, the views already
+        #show what changed, so swap in the new objects without a rebuild
+        if not self.refreshMenu(None, None):
+            self.loadUpdates()
+            return
+        self.fingerprint = self.editor.getFingerprint()
+        menu_tree = self.tree.get_object('menu_tree')
+        menus, iter = menu_tree.get_selection().get_selected()
+        if iter:
+            self.refreshItems(menus[iter][2])
+        if self.memoryStats is not None:
+            self.memoryStats.report('refresh', self.editor.dom)
+
+    def refreshMenu(self, parent_iter, parent):
+        iter = self.menu_store.iter_children(parent_iter)
+        for menu, show in self.editor.getMenus(parent):
+            if iter is None or self.menu_store[iter][2].get_menu_id() != menu.get_menu_id():
+                return False
+            row = self.menu_store[iter]
+            if iconChanged(row[2], menu):
+                row[0] = util.getIcon(menu, self.scale)
+            row[1] = html.escape(menu.get_name(), quote=False)
+            row[2] = menu
+            if not self.refreshMenu(iter, menu):
+                return False
+            iter = self.menu_store.iter_next(iter)
+        return iter is None
+
+    def refreshItems(self, menu):
+        item_tree = self.tree.get_object('item_tree')
+        items, iter = item_tree.get_selection().get_selected()
+        selected = getItemKey(items[iter][3]) if iter else None
+
+        new_items = list(self.getShownItems(menu))
+        if [getItemKey(item) for item, show in new_items] != [getItemKey(row[3]) for row in self.item_store]:
+            self.loadItems(menu)
+            for row in self.item_store:
+                if selected is not None and getItemKey(row[3]) == selected:
+                    item_tree.get_selection().select_iter(row.iter)
+                    self.on_item_tree_cursor_changed(item_tree)
+                    break
+            return
+
+        for row, (item, show) in zip(self.item_store, new_items):
+            if iconChanged(row[3], item):
+                row[1] = util.getIcon(item, self.scale)
+            row[0] = show
+            row[2] = html.escape(getItemName(item), quote=False)
+            row[3] = item
 
     def loadUpdates(self):
         menu_tree = self.tree.get_object('menu_tree')
@@ -151,18 +355,22 @@ class MainWindow(object):
             return True
 
     def setupMenuTree(self):
-        self.menu_store = Gtk.TreeStore(GdkPixbuf.Pixbuf, str, object)
+        self.menu_store = Gtk.TreeStore(cairo.Surface, str, object)
         menus = self.tree.get_object('menu_tree')
         column = Gtk.TreeViewColumn(_('Name'))
         column.set_spacing(4)
         cell = Gtk.CellRendererPixbuf()
         column.pack_start(cell, False)
-        column.add_attribute(cell, 'pixbuf', 0)
+        column.add_attribute(cell, 'surface', 0)
         cell = Gtk.CellRendererText()
         column.pack_start(cell, True)
         column.add_attribute(cell, 'markup', 1)
         menus.append_column(column)
         menus.get_selection().set_mode(Gtk.SelectionMode.BROWSE)
+        #items dropped on a menu are moved into it
+        targets = [Gtk.TargetEntry.new(DRAG_TARGET, Gtk.TargetFlags.SAME_APP, 0)]
+        menus.enable_model_drag_dest(targets, Gdk.DragAction.MOVE)
+        menus.connect('drag-data-received', self.on_menu_tree_drag_data_received)
 
     def setupItemTree(self):
         items = self.tree.get_object('item_tree')
@@ -178,13 +386,28 @@ class MainWindow(object):
         column.set_spacing(4)
         cell = Gtk.CellRendererPixbuf()
         column.pack_start(cell, False)
-        column.add_attribute(cell, 'pixbuf', 1)
+        column.add_attribute(cell, 'surface', 1)
         cell = Gtk.CellRendererText()
         column.pack_start(cell, True)
         column.add_attribute(cell, 'markup', 2)
         items.append_column(column)
-        self.item_store = Gtk.ListStore(bool, GdkPixbuf.Pixbuf, str, object)
+        column = Gtk.TreeViewColumn()
+        cell = Gtk.CellRendererPixbuf()
+        column.pack_start(cell, False)
+        column.set_cell_data_func(cell, self._cell_data_lint_func)
+        items.append_column(column)
+        items.set_has_tooltip(True)
+        items.connect('query-tooltip', self.on_item_tree_query_tooltip)
+        self.item_store = Gtk.ListStore(bool, cairo.Surface, str, object)
         items.set_model(self.item_store)
+        self.dragItem = None
+        targets = [Gtk.TargetEntry.new(DRAG_TARGET, Gtk.TargetFlags.SAME_APP, 0)]
+        items.enable_model_drag_source(Gdk.ModifierType.BUTTON1_MASK, targets, Gdk.DragAction.MOVE)
+        items.enable_model_drag_dest(targets, Gdk.DragAction.MOVE)
+        items.connect('drag-begin', self.on_item_tree_drag_begin)
+        items.connect('drag-data-get', self.on_item_tree_drag_data_get)
+        items.connect('drag-data-received', self.on_item_tree_drag_data_received)
+        items.connect('drag-end', self.on_item_tree_drag_end)
 
     def _cell_data_toggle_func(self, tree_column, renderer, model, treeiter, data=None):
         if isinstance(model[treeiter][3], GMenu.TreeSeparator):
@@ -192,7 +415,75 @@ class MainWindow(object):
         else:
             renderer.set_property('visible', True)
 
+    def _cell_data_lint_func(self, tree_column, renderer, model, treeiter, data=None):
+        findings = self.getFindings(model[treeiter][3])
+        renderer.set_property('icon-name', 'dialog-warning' if findings else None)
+
+    def getFindings(self, item):
+        if not isinstance(item, GMenu.TreeEntry):
+            return None
+        return self.lintResults.get(item.get_desktop_file_path())
+
+    def getShownItems(self, menu):
+        #with the filter on only the launchers with problems are listed
+        only_problems = self.tree.get_object('lint_filter').get_active()
+        for item, show in self.editor.getItems(menu):
+            if not only_problems or self.getFindings(item):
+                yield item, show
+
+    def collectLintPaths(self, menu, paths):
+        for item, show in self.editor.getItems(menu):
+            if isinstance(item, GMenu.TreeDirectory):
+                self.collectLintPaths(item, paths)
+            elif isinstance(item, GMenu.TreeEntry) and item.get_desktop_file_path():
+                paths.add(item.get_desktop_file_path())
+        return paths
+
+    def startLint(self):
+        #the checks run in a thread that feeds a process pool, the cache
+        #keeps reruns down to the files that changed
+        if self.lintThread is not None:
+            self.lintQueued = True
+            return
+        paths = sorted(self.collectLintPaths(self.editor.getRoot(), set()))
+        self.lintThread = threading.Thread(target=self.lintThreadFunc, args=(paths,))
+        self.lintThread.daemon = True
+        self.lintThread.start()
+
+    def lintThreadFunc(self, paths):
+        if not self.lintCache.entries:
+            self.lintCache.load()
+        results = Lint.lintFiles(paths, None, self.lintCache)
+        GLib.idle_add(self.on_lint_finished, results)
+
+    def on_lint_finished(self, results):
+        self.lintThread = None
+        self.lintResults.update(results)
+        if self.tree.get_object('lint_filter').get_active():
+            self.on_menu_tree_cursor_changed(self.tree.get_object('menu_tree'))
+        else:
+            self.tree.get_object('item_tree').queue_draw()
+        if self.lintQueued:
+            self.lintQueued = False
+            self.startLint()
+        return False
+
+    def on_lint_filter_toggled(self, button):
+        self.on_menu_tree_cursor_changed(self.tree.get_object('menu_tree'))
+
+    def on_item_tree_query_tooltip(self, item_tree, x, y, keyboard_mode, tooltip):
+        found, x, y, model, path, iter = item_tree.get_tooltip_context(x, y, keyboard_mode)
+        if not found:
+            return False
+        findings = self.getFindings(model[iter][3])
+        if not findings:
+            return False
+        tooltip.set_text('\n'.join(finding.message for finding in findings))
+        item_tree.set_tooltip_row(tooltip, path)
+        return True
+
     def loadMenus(self):
+        self.fingerprint = self.editor.getFingerprint()
         self.menu_store.clear()
         self.loadMenu({ None: None })
 
@@ -202,32 +493,31 @@ class MainWindow(object):
             menu_tree.expand_to_path(menu.path)
         menu_tree.get_selection().select_path((0,))
         self.on_menu_tree_cursor_changed(menu_tree)
+        if self.memoryStats is not None:
+            self.memoryStats.report('load', self.editor.dom)
+        self.startLint()
 
     def loadMenu(self, iters, parent=None):
         for menu, show in self.editor.getMenus(parent):
             name = html.escape(menu.get_name(), quote=False)
 
-            icon = util.getIcon(menu)
+            icon = util.getIcon(menu, self.scale)
             iters[menu] = self.menu_store.append(iters[parent], (icon, name, menu))
             self.loadMenu(iters, menu)
 
     def loadItems(self, menu):
         self.item_store.clear()
-        for item, show in self.editor.getItems(menu):
-            icon = util.getIcon(item)
-            if isinstance(item, GMenu.TreeDirectory):
-                name = item.get_name()
-            elif isinstance(item, GMenu.TreeEntry):
-                name = item.get_app_info().get_display_name()
-            elif isinstance(item, GMenu.TreeSeparator):
-                name = '---'
-            else:
-                assert False, 'should not be reached'
-
-            name = html.escape(name, quote=False)
+        for item, show in self.getShownItems(menu):
+            icon = util.getIcon(item, self.scale)
+            name = html.escape(getItemName(item), quote=False)
 
             self.item_store.append((show, icon, name, item))
 
+    def on_scale_factor_changed(self, window, pspec):
+        #the icons are rendered for one scale factor, draw them again
+        self.scale = window.get_scale_factor()
+        self.loadUpdates()
+
     def on_delete_event(self, widget, event):
         self.quit()
 
@@ -243,15 +533,13 @@ class MainWindow(object):
         file_name = util.getUniqueFileId('alacarte-made', '.directory')
         file_path = os.path.join(util.getUserDirectoryPath(), file_name)
 
-        editor = DirectoryEditor(self.main_window, file_path)
-        editor.file_name = file_name;
-        editor.parent = parent.get_menu_id()
-        editor.connect('response', self.on_directory_created)
+        editor = DirectoryEditor.acquire(self.main_window, file_path, self.writer)
+        editor.connect_response(self.on_directory_created, file_name, parent.get_menu_id())
         editor.run()
 
-    def on_directory_created(self, editor, response):
+    def on_directory_created(self, editor, response, file_name, parent_id):
         if response:
-            self.editor.insertExternalMenu(editor.file_name, editor.parent)
+            self.editor.insertExternalMenu(file_name, parent_id)
 
     def on_new_item_button_clicked(self, button):
         menu_tree = self.tree.get_object('menu_tree')
@@ -265,15 +553,13 @@ class MainWindow(object):
         file_name = util.getUniqueFileId('alacarte-made', '.desktop')
         file_path = os.path.join(util.getUserItemPath(), file_name)
 
-        editor = LauncherEditor(self.main_window, file_path)
-        editor.file_name = file_name;
-        editor.parent = parent.get_menu_id()
-        editor.connect('response', self.on_item_created)
+        editor = LauncherEditor.acquire(self.main_window, file_path, self.writer)
+        editor.connect_response(self.on_item_created, file_name, parent.get_menu_id())
         editor.run()
 
-    def on_item_created(self, editor, response):
+    def on_item_created(self, editor, response, file_name, parent_id):
         if response:
-            self.editor.insertExternalItem(editor.file_name, editor.parent)
+            self.editor.insertExternalItem(file_name, parent_id)
 
     def on_new_separator_button_clicked(self, button):
         item_tree = self.tree.get_object('item_tree')
@@ -318,18 +604,36 @@ class MainWindow(object):
             file_type = 'Menu'
             Editor = DirectoryEditor
 
-        copied = False
-        if not os.path.isfile(file_path):
-            shutil.copy(item.get_desktop_file_path(), file_path)
-            copied = True
+        self.openEditor(Editor, item.get_desktop_file_path(), file_path)
+
+    def openEditor(self, Editor, system_path, file_path):
+        #the editor can only read the copy once it has been written, a
+        #copy or removal still in the queue is waited for
+        if self.writer.isPending(file_path):
+            self.writer.wait(self.openEditor, Editor, system_path, file_path)
+        elif not os.path.isfile(file_path):
+            self.writer.copy(system_path, file_path, self.runEditor, Editor, file_path, True)
+        else:
+            self.runEditor(Editor, file_path, False)
 
-        editor = Editor(self.main_window, file_path)
-        editor.connect('response', self.on_editor_response, file_path if copied else None)
+    def runEditor(self, Editor, file_path, copied):
+        editor = Editor.acquire(self.main_window, file_path, self.writer)
+        editor.connect_response(self.on_editor_response, file_path, copied)
         editor.run()
 
-    def on_editor_response(self, editor, modified, file_path):
-        if not modified and file_path is not None:
-            os.remove(file_path)
+    def on_editor_response(self, editor, modified, file_path, copied):
+        if not modified and copied:
+            self.writer.remove(file_path)
+
+    def on_write_error(self, writer, path, message):
+        dialog = Gtk.MessageDialog(transient_for=self.main_window,
+                                   modal=True,
+                                   message_type=Gtk.MessageType.ERROR,
+                                   buttons=Gtk.ButtonsType.CLOSE,
+                                   text=_("Could not save %s") % (path,))
+        dialog.format_secondary_text(message)
+        dialog.connect('response', lambda dialog, response: dialog.destroy())
+        dialog.show()
 
     def on_menu_tree_cursor_changed(self, treeview):
         selection = treeview.get_selection()
@@ -440,6 +744,63 @@ class MainWindow(object):
         after = items[path][3]
         self.editor.moveItem(item.get_parent(), item, after=after)
 
+    def on_item_tree_drag_begin(self, item_tree, context):
+        items, iter = item_tree.get_selection().get_selected()
+        self.dragItem = items[iter][3] if iter else None
+
+    def on_item_tree_drag_data_get(self, item_tree, context, selection, info, time):
+        #the item itself stays in self.dragItem
+        selection.set(selection.get_target(), 8, DRAG_TARGET.encode('ascii'))
+
+    def on_item_tree_drag_end(self, item_tree, context):
+        self.dragItem = None
+
+    def on_item_tree_drag_data_received(self, item_tree, context, x, y, selection, info, time):
+        #the editor does the move, not the model
+        item_tree.stop_emission_by_name('drag-data-received')
+        item = self.dragItem
+        menus, iter = self.tree.get_object('menu_tree').get_selection().get_selected()
+        if item is None or iter is None:
+            context.finish(False, False, time)
+            return
+        parent = menus[iter][2]
+        before = after = None
+        dest = item_tree.get_dest_row_at_pos(x, y)
+        if dest is not None:
+            path, position = dest
+            target = self.item_store[path][3]
+            into = (Gtk.TreeViewDropPosition.INTO_OR_BEFORE, Gtk.TreeViewDropPosition.INTO_OR_AFTER)
+            if position in into and isinstance(target, GMenu.TreeDirectory) and self.editor.canPlaceItem(item, target):
+                parent = target
+            elif target is item:
+                context.finish(False, False, time)
+                return
+            elif position in (Gtk.TreeViewDropPosition.BEFORE, Gtk.TreeViewDropPosition.INTO_OR_BEFORE):
+                before = target
+            else:
+                after = target
+        if before is None and after is None and self.isInMenu(item, parent):
+            #would only move it to the end of its menu
+            context.finish(False, False, time)
+            return
+        context.finish(self.editor.placeItem(item, parent, before, after), False, time)
+
+    def on_menu_tree_drag_data_received(self, menu_tree, context, x, y, selection, info, time):
+        menu_tree.stop_emission_by_name('drag-data-received')
+        dest = menu_tree.get_dest_row_at_pos(x, y)
+        if self.dragItem is None or dest is None:
+            context.finish(False, False, time)
+            return
+        path, position = dest
+        menu = self.menu_store[path][2]
+        if self.isInMenu(self.dragItem, menu):
+            context.finish(False, False, time)
+            return
+        context.finish(self.editor.placeItem(self.dragItem, menu), False, time)
+
+    def isInMenu(self, item, menu):
+        return self.editor.getPath(item.get_parent()) == self.editor.getPath(menu)
+
     def on_restore_button_clicked(self, button):
         self.editor.restoreToSystem()
 
@@ -452,6 +813,15 @@ class MainWindow(object):
         self.on_edit_delete_activate(None)
 
     def quit(self):
+        self.changeMonitor.stop()
+        if self.settleId:
+            GLib.source_remove(self.settleId)
+            self.settleId = 0
+        for state in self.menus.values():
+            if state.service is not None:
+                state.service.stop()
+        IconCache.saveAll()
+        self.writer.flush()
         Gtk.main_quit()
 
 def main():
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Memory use across menu reloads. With ALACARTE_MEMORY_STATS set in the
+# environment the main window prints a line to stderr every time it loads
+# or refreshes its views:
+#
+#   memory: load #3  python 2.9 MiB (+18.2 KiB)  rss 61.4 MiB  gi 412  dom 318
+#
+# python is what tracemalloc sees, gi the number of live PyGObject
+# wrappers and dom the nodes in the user menu document. The soak test in
+# tests/MemorySoak.py uses the same samples.
+
+import collections
+import gc
+import os
+import sys
+import tracemalloc
+
+ENV = 'ALACARTE_MEMORY_STATS'
+
+Sample = collections.namedtuple('Sample', 'label cycle traced rss gi_objects dom_nodes')
+
+def isEnabled():
+    return bool(os.environ.get(ENV))
+
+def getRss():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def countGiObjects():
+    # live wrappers of GObjects and boxed types, by type name
+    counts = collections.Counter()
+    for obj in gc.get_objects():
+        if type(obj).__module__.startswith('gi.repository.'):
+            counts[type(obj).__name__] += 1
+    return counts
+
+def countDomNodes(node):
+    count = 0
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.childNodes)
+    return count
+
+def formatSize(size):
+    if size is None:
+        return '?'
+    if abs(size) < 1024:
+        return '%d B' % (size,)
+    if abs(size) < 1024 * 1024:
+        return '%.1f KiB' % (size / 1024.0,)
+    return '%.1f MiB' % (size / 1048576.0,)
+
+class Sampler(object):
+    def __init__(self, frames=1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.cycle = 0
+        self.last = None
+        self.snapshot = None
+
+    def sample(self, label, dom=None):
+        self.cycle += 1
+        traced, peak = tracemalloc.get_traced_memory()
+        gi_objects = sum(countGiObjects().values())
+        dom_nodes = countDomNodes(dom) if dom is not None else None
+        sample = Sample(label, self.cycle, traced, getRss(), gi_objects, dom_nodes)
+        previous = self.last
+        self.last = sample
+        return sample, previous
+
+    def format(self, sample, previous=None):
+        growth = ''
+        if previous is not None:
+            growth = ' (%s%s)' % ('+' if sample.traced >= previous.traced else '', formatSize(sample.traced - previous.traced))
+        line = 'memory: %s #%d  python %s%s  rss %s  gi %d' % (sample.label, sample.cycle, formatSize(sample.traced),
+                                                             growth, formatSize(sample.rss), sample.gi_objects)
+        if sample.dom_nodes is not None:
+            line += '  dom %d' % (sample.dom_nodes,)
+        return line
+
+    def report(self, label, dom=None, out=sys.stderr):
+        sample, previous = self.sample(label, dom)
+        out.write(self.format(sample, previous) + '\n')
+        return sample
+
+    def markBaseline(self):
+        self.snapshot = tracemalloc.take_snapshot()
+
+    def topGrowth(self, limit=10):
+        # where the memory allocated since markBaseline comes from
+        if self.snapshot is None:
+            return []
+        stats = tracemalloc.take_snapshot().compare_to(self.snapshot, 'lineno')
+        return [stat for stat in stats if stat.size_diff > 0][:limit]
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Client side of the menu service (see MenuService). This doesn't import
+# GLib or Gtk, so a command only pays for starting the interpreter and
+# one round trip over the socket.
+#
+# Requests and replies are JSON objects, one per line:
+#   {"command": "list", "args": {"parent": "Office"}}
+#   {"result": [...]} or {"error": "..."}
+
+import argparse
+import json
+import socket
+import sys
+import time
+from Alacarte import xdg
+
+COMMANDS = ('daemon', 'stop', 'ping', 'menus', 'list', 'show', 'hide', 'create', 'delete', 'move', 'restore', 'export', 'lint')
+
+class ServiceError(Exception):
+    pass
+
+class MenuClient(object):
+    def __init__(self, basename=None, path=None):
+        self.path = path or xdg.getSocketPath(basename)
+        self.sock = None
+        self.file = None
+
+    def connect(self):
+        if self.sock is not None:
+            return
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError as e:
+            sock.close()
+            raise ServiceError("menu service is not running at %s: %s" % (self.path, e.strerror or e))
+        self.sock = sock
+        self.file = sock.makefile('rwb')
+
+    def close(self):
+        if self.sock is not None:
+            self.file.close()
+            self.sock.close()
+            self.sock = self.file = None
+
+    def call(self, command, **args):
+        self.connect()
+        request = json.dumps(dict(command=command, args=args))
+        self.file.write(request.encode('utf-8') + b'\n')
+        self.file.flush()
+        line = self.file.readline()
+        if not line:
+            self.close()
+            raise ServiceError("menu service closed the connection")
+        reply = json.loads(line.decode('utf-8'))
+        if 'error' in reply:
+            raise ServiceError(reply['error'])
+        return reply.get('result')
+
+def printItems(items, out):
+    for item in items:
+        flags = '' if item['visible'] else ' (hidden)'
+        if item['type'] == 'Separator':
+            out.write('---\n')
+        else:
+            out.write('%s\t%s\t%s%s\n' % (item['type'], item['id'], item['name'], flags))
+
+def main(argv=None):
+    #the options go after the command, the first argument picks the mode
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('--menu', help='menu basename, e.g. applications.menu')
+    common.add_argument('--repeat', type=int, default=1, help='send the request this many times and print the latency')
+    parser = argparse.ArgumentParser(prog='alacarte', description='Query and edit menus through the menu service.')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+    add_parser = lambda name, **kwargs: commands.add_parser(name, parents=[common], **kwargs)
+    add_parser('daemon', help='run the menu service')
+    add_parser('stop', help='stop the menu service')
+    add_parser('ping', help='check that the menu service is running')
+    add_parser('menus', help='list all menus')
+    command = add_parser('list', help='list the contents of a menu')
+    command.add_argument('parent', nargs='?', help='menu id, the root menu if not given')
+    for name in ('show', 'hide', 'delete'):
+        command = add_parser(name, help='%s an item or menu' % (name,))
+        command.add_argument('parent', help='menu id of the parent')
+        command.add_argument('item', help='desktop file id or menu id')
+    command = add_parser('create', help='create a launcher')
+    command.add_argument('parent', help='menu id of the parent')
+    command.add_argument('name')
+    command.add_argument('exec')
+    command.add_argument('--icon')
+    command.add_argument('--comment')
+    command.add_argument('--terminal', action='store_true')
+    command = add_parser('move', help='move an item within its menu')
+    command.add_argument('parent', help='menu id of the parent')
+    command.add_argument('item', help='desktop file id or menu id')
+    position = command.add_mutually_exclusive_group()
+    position.add_argument('--before', help='id of the item to move in front of')
+    position.add_argument('--after', help='id of the item to move behind')
+    command = add_parser('restore', help='remove all customizations')
+    command.add_argument('--dry-run', action='store_true', help='only print what would be removed')
+    command = add_parser('export', help='write the whole menu tree as JSON Lines')
+    command.add_argument('--output', help='file to write to, standard output if not given')
+    command = add_parser('lint', help='check the launchers of the menu for problems')
+    command.add_argument('--jobs', type=int, help='number of worker processes')
+    command.add_argument('--no-cache', action='store_true', help='check every file again')
+    args = vars(parser.parse_args(argv))
+
+    name = args.pop('command')
+    basename = args.pop('menu')
+    repeat = args.pop('repeat')
+    if name == 'daemon':
+        #only the service needs GLib and GMenu
+        from Alacarte import MenuService
+        return MenuService.main(basename)
+    elif name == 'export':
+        #reads the menus itself, the service isn't needed
+        from Alacarte import Export
+        return Export.main(basename, args['output'])
+    elif name == 'lint':
+        from Alacarte import Lint
+        return Lint.main(basename, args['jobs'], not args['no_cache'])
+
+    client = MenuClient(basename)
+    try:
+        start = time.perf_counter()
+        for i in range(repeat):
+            result = client.call(name, **args)
+        elapsed = time.perf_counter() - start
+    except ServiceError as e:
+        sys.stderr.write('alacarte: %s\n' % (e,))
+        return 1
+    finally:
+        client.close()
+
+    if name in ('menus', 'list'):
+        printItems(result, sys.stdout)
+    elif name == 'restore':
+        for path in result:
+            sys.stdout.write('%s\n' % (path,))
+    elif result is not None:
+        sys.stdout.write('%s\n' % (result,))
+    if repeat > 1:
+        sys.stderr.write('%d requests, %.3f ms each\n' % (repeat, elapsed * 1000 / repeat))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
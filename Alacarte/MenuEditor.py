@@ -16,94 +16,266 @@
 #   License along with this library; if not, write to the Free Software
 #   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
-import codecs
 import os
 import xml.dom.minidom
 import xml.parsers.expat
 from gi.repository import GMenu, GLib
-from Alacarte import util
+from Alacarte import util, xdg, Fingerprint, MenuMerge, SystemIndex
+from Alacarte.FileOps import readText
+from Alacarte.FileWriter import FileWriter
+from Alacarte.WriteTracker import getStamp
 
 def get_default_menu():
     prefix = os.environ.get('XDG_MENU_PREFIX', '')
     return prefix + 'applications.menu'
 
 class MenuEditor(object):
-    def __init__(self, basename=None):
+    def __init__(self, basename=None, writer=None, sharded=None):
         basename = basename or get_default_menu()
 
+        self.writer = writer if writer is not None else FileWriter()
+        self.tracker = self.writer.tracker
+        self.ownChange = False
+        self.stale = False
+        self.batching = 0
+        self.dirty = False
+        self.merged = False
+
         self.tree = GMenu.Tree.new(basename, GMenu.TreeFlags.SHOW_EMPTY|GMenu.TreeFlags.INCLUDE_EXCLUDED|GMenu.TreeFlags.INCLUDE_NODISPLAY|GMenu.TreeFlags.SHOW_ALL_SEPARATORS|GMenu.TreeFlags.SORT_DISPLAY_NAME)
         self.tree.connect('changed', self.menuChanged)
         self.load()
 
         self.path = os.path.join(util.getUserMenuPath(), self.tree.props.menu_basename)
+        self.sharded = sharded
         self.loadDOM()
 
-    def loadDOM(self):
+    def readDOM(self):
+        # the user menu on disk with the shards merged in, the text of the
+        # file and the contents of the shards, or None if there is none
         try:
-            self.dom = xml.dom.minidom.parse(self.path)
-        except (IOError, xml.parsers.expat.ExpatError) as e:
+            text = readText(self.path)
+            dom = xml.dom.minidom.parseString(text) if text is not None else None
+        except (IOError, xml.parsers.expat.ExpatError):
+            dom = None
+        if dom is None:
+            return None
+        util.removeWhitespaceNodes(dom)
+        shards = xdg.loadShards(dom, os.path.dirname(self.path), self.tree.props.menu_basename)
+        return dom, text, shards
+
+    def loadDOM(self):
+        self.unlinkDOM()
+        #the version on disk our edits are made on: its stamp, the text of
+        #the file and the whole menu, see save and mergeFromDisk
+        self.stamp = getStamp(self.path)
+        disk = self.readDOM()
+        if disk is not None:
+            self.dom, self.base, self.shards = disk
+        else:
             self.dom = xml.dom.minidom.parseString(util.getUserMenuXml(self.tree))
+            util.removeWhitespaceNodes(self.dom)
+            self.base = None
+            self.shards = {}
+        self.baseMenu = self.dom.toprettyxml()
+        if self.sharded is None:
+            self.sharded = bool(self.shards)
+
+    def resetDOM(self):
+        self.ensureLoaded()
+        self.unlinkDOM()
+        self.dom = xml.dom.minidom.parseString(util.getUserMenuXml(self.tree))
         util.removeWhitespaceNodes(self.dom)
+        self.shards = {}
+        self.stamp = None
+        self.base = None
+        self.baseMenu = self.dom.toprettyxml()
+
+    def isChangedOnDisk(self):
+        # somebody else wrote the user menu since we last read or wrote it
+        if self.writer.isPending(self.path):
+            return False
+        return getStamp(self.path) != self.stamp
+
+    def mergeFromDisk(self):
+        # brings the edits made to the user menu on disk into ours,
+        # without dropping what we changed since baseMenu
+        disk = self.readDOM()
+        if disk is None:
+            return
+        theirs, text, shards = disk
+        theirs_text = theirs.toprettyxml()
+        theirs.unlink()
+        merged = MenuMerge.mergeText(self.baseMenu, self.dom.toprettyxml(), theirs_text)
+        self.unlinkDOM()
+        self.dom = MenuMerge.parseMenu(merged)
+        self.stamp = getStamp(self.path)
+        self.base = text
+        self.baseMenu = theirs_text
+        self.shards = shards
+
+    def unlinkDOM(self):
+        #minidom nodes point at their parents, breaking the cycles lets the
+        #old document go right away instead of on the next collection
+        dom = getattr(self, 'dom', None)
+        if dom is not None:
+            dom.unlink()
+            self.dom = None
 
     def load(self):
+        self.stale = False
         if not self.tree.load_sync():
             raise ValueError("can not load menu tree %r" % (self.tree.props.menu_basename,))
+        self.fingerprint = Fingerprint.build(self.tree.get_root_directory(), self.describeChildren)
 
-    def menuChanged(self, *a):
-        self.load()
+    def describeChildren(self, menu):
+        # what Fingerprint hashes of each child
+        for item, visible in self.getItems(menu):
+            icon = util.getItemGIcon(item)
+            icon = icon.to_string() if icon is not None else None
+            if isinstance(item, GMenu.TreeDirectory):
+                yield ('Menu', item.get_menu_id(), (item.get_name(), visible, icon), item)
+            elif isinstance(item, GMenu.TreeEntry):
+                yield ('Item', item.get_desktop_file_id(), (item.get_app_info().get_display_name(), visible, icon), None)
+            elif isinstance(item, GMenu.TreeSeparator):
+                yield ('Separator', None, (visible,), None)
 
-    def save(self):
-        with codecs.open(self.path, 'w', 'utf8') as f:
-            f.write(self.dom.toprettyxml())
+    def getFingerprint(self):
+        # hashes of the tree as of the last load, see Fingerprint.diff
+        self.ensureLoaded()
+        return self.fingerprint
 
-    def restoreToSystem(self):
-        self.restoreTree(self.tree.get_root_directory())
-        try:
-            os.remove(self.path)
-        except OSError:
-            pass
+    def ensureLoaded(self):
+        if self.stale:
+            self.load()
 
-        self.loadDOM()
+    def getRoot(self):
+        self.ensureLoaded()
+        return self.tree.get_root_directory()
 
-    def restoreTree(self, menu):
-        item_iter = menu.iter()
-        item_type = item_iter.next()
-        while item_type != GMenu.TreeItemType.INVALID:
-            if item_type == GMenu.TreeItemType.DIRECTORY:
-                item = item_iter.get_directory()
-                self.restoreTree(item)
-            elif item_type == GMenu.TreeItemType.ENTRY:
-                item = item_iter.get_entry()
-                self.restoreItem(item)
-            item_type = item_iter.next()
-        self.restoreMenu(menu)
+    def menuChanged(self, *a):
+        #the tree watches the app dirs, so the shared index may be stale
+        #now, or rebuilt; this keeps long running users like the menu
+        #service from missing new system files
+        SystemIndex.refresh()
+        #if all we see are our own writes, listeners can skip a full rebuild
+        self.ownChange = self.tracker.consume()
+        if not self.ownChange and self.isChangedOnDisk():
+            self.mergeFromDisk()
+        #reload when the tree is used next, so a burst of changes costs
+        #one reload
+        self.stale = True
+
+    def beginBatch(self):
+        #saves are put off until the matching endBatch
+        self.batching += 1
+
+    def endBatch(self):
+        self.batching -= 1
+        if not self.batching and self.dirty:
+            self.save()
 
-    def restoreItem(self, item):
-        if not self.canRevert(item):
+    def save(self):
+        if self.batching:
+            self.dirty = True
             return
-        try:
-            os.remove(item.get_desktop_file_path())
-        except OSError:
-            pass
-        self.save()
+        self.dirty = False
 
-    def restoreMenu(self, menu):
-        if not self.canRevert(menu):
+        if not self.sharded:
+            contents = self.dom.toprettyxml()
+            self.commit(contents, contents)
+            self.removeShards(self.shards)
             return
-        #wtf happened here? oh well, just bail
-        if not menu.get_desktop_file_path():
+
+        basename = self.tree.props.menu_basename
+        menu = self.dom.toprettyxml()
+        contents, shards = xdg.splitShards(self.dom, basename)
+        #write the shards first, the user menu must not refer to missing files
+        menu_dir = os.path.dirname(self.path)
+        shard_dir = os.path.join(menu_dir, xdg.getShardDir(basename))
+        if shards and not os.path.isdir(shard_dir):
+            os.makedirs(shard_dir)
+        for path, shard in shards.items():
+            if self.shards.get(path) != shard:
+                self.writer.commit(os.path.join(menu_dir, path), self.shards.get(path), shard,
+                                   MenuMerge.mergeText, self.shardCommitted, path, shard)
+                self.shards[path] = shard
+        self.commit(contents, menu)
+        self.removeShards([path for path in self.shards if path not in shards])
+
+    def commit(self, contents, menu):
+        # writes the user menu, merged with what somebody else wrote since
+        # our base version; FileWriter.commit does that under a lock
+        base = self.base
+        self.base = contents
+        self.baseMenu = menu
+        self.writer.commit(self.path, base, contents, MenuMerge.mergeText, self.committed, contents)
+
+    def committed(self, result, contents):
+        if result.get('merged'):
+            self.merged = True
+        if self.base != contents:
+            #a newer version is on its way, it gets merged in turn
             return
-        file_id = os.path.split(menu.get_desktop_file_path())[1]
-        path = os.path.join(util.getUserDirectoryPath(), file_id)
-        try:
-            os.remove(path)
-        except OSError:
-            pass
+        self.base = result['contents']
+        self.stamp = getStamp(self.path)
+        if self.merged:
+            #somebody else's edits are in the file now, take them in
+            self.merged = False
+            self.mergeFromDisk()
+
+    def shardCommitted(self, result, path, shard):
+        if self.shards.get(path) == shard:
+            self.shards[path] = result['contents']
+        if result.get('merged'):
+            self.merged = True
+
+    def removeShards(self, paths):
+        menu_dir = os.path.dirname(self.path)
+        for path in list(paths):
+            self.writer.remove(os.path.join(menu_dir, path))
+            del self.shards[path]
+
+    def setSharded(self, sharded):
+        #migrates the user menu to or from the sharded layout
+        self.sharded = sharded
         self.save()
 
+    def getUniqueFileId(self, name, extension):
+        return util.getUniqueFileId(name, extension, self.writer.isPending)
+
+    def getOverrides(self):
+        # file ids in the user dirs that shadow a system file
+        items = util.listFileIds(util.getUserItemPath(), '.desktop')
+        items &= util.getSystemFileIds('applications', '.desktop')
+        menus = util.listFileIds(util.getUserDirectoryPath(), '.directory')
+        menus &= util.getSystemFileIds('desktop-directories', '.directory')
+        return items, menus
+
+    def planRestore(self):
+        items, menus = self.getOverrides()
+        plan = [os.path.join(util.getUserItemPath(), file_id) for file_id in sorted(items)]
+        plan += [os.path.join(util.getUserDirectoryPath(), file_id) for file_id in sorted(menus)]
+        menu_dir = os.path.dirname(self.path)
+        plan += [os.path.join(menu_dir, path) for path in xdg.listShardFiles(menu_dir, self.tree.props.menu_basename)]
+        if os.path.isfile(self.path):
+            plan.append(self.path)
+        return plan
+
+    def restoreToSystem(self, dry_run=False):
+        plan = self.planRestore()
+        if dry_run:
+            return plan
+
+        for path in plan:
+            self.writer.remove(path)
+
+        #the removals may still be queued, don't read the old file back
+        self.resetDOM()
+        return plan
+
     def getMenus(self, parent):
         if parent is None:
-            yield (self.tree.get_root_directory(), True)
+            yield (self.getRoot(), True)
             return
 
         item_iter = parent.iter()
@@ -190,6 +362,7 @@ class MenuEditor(object):
             menu_xml = self.getXmlMenu(self.getPath(item), dom.documentElement, dom)
             for node in self.getXmlNodesByName(['Deleted', 'NotDeleted'], menu_xml):
                 node.parentNode.removeChild(node)
+                node.unlink()
             self.writeMenu(item, NoDisplay=not visible)
             self.addXmlTextElement(menu_xml, 'DirectoryDir', util.getUserDirectoryPath(), dom)
         self.save()
@@ -250,19 +423,12 @@ class MenuEditor(object):
     def copyItem(self, item, new_parent, before=None, after=None):
         dom = self.dom
         file_path = item.get_desktop_file_path()
-        keyfile = GLib.KeyFile()
-        keyfile.load_from_file(file_path, util.KEY_FILE_FLAGS)
-
-        util.fillKeyFile(keyfile, dict(Categories=[], Hidden=False))
 
         app_info = item.get_app_info()
-        file_id = util.getUniqueFileId(app_info.get_name().replace(os.sep, '-'), '.desktop')
+        file_id = self.getUniqueFileId(app_info.get_name().replace(os.sep, '-'), '.desktop')
         out_path = os.path.join(util.getUserItemPath(), file_id)
 
-        contents, length = keyfile.to_data()
-
-        with open(out_path, 'w') as f:
-            f.write(contents)
+        self.writer.patch(file_path, out_path, dict(Categories=[], Hidden=False))
 
         self.addItem(new_parent, file_id, dom)
         self.positionItem(new_parent, ('Item', file_id), before, after)
@@ -273,6 +439,10 @@ class MenuEditor(object):
         self.writeItem(item, Hidden=True)
         self.save()
 
+    def deleteItems(self, items):
+        self.writeItems(items, Hidden=True)
+        self.save()
+
     def deleteMenu(self, menu):
         dom = self.dom
         menu_xml = self.getXmlMenu(self.getPath(menu), dom.documentElement, dom)
@@ -291,7 +461,7 @@ class MenuEditor(object):
 
     def findMenu(self, menu_id, parent=None):
         if parent is None:
-            parent = self.tree.get_root_directory()
+            parent = self.getRoot()
 
         if menu_id == parent.get_menu_id():
             return parent
@@ -364,6 +534,7 @@ class MenuEditor(object):
         for node in self.getXmlNodesByName(['Include', 'Exclude'], element):
             if node.childNodes[0].nodeName == 'Filename' and node.childNodes[0].childNodes[0].nodeValue == filename:
                 element.removeChild(node)
+                node.unlink()
 
         # add new filename
         node = dom.createElement(type)
@@ -392,31 +563,46 @@ class MenuEditor(object):
         else:
             file_path = None
 
+        if file_path is not None and 'KeyFile' not in kwargs:
+            #only rewrite the keys we change, keep the rest of the file as is
+            file_id = item.get_desktop_file_id()
+            path = os.path.join(util.getUserItemPath(), file_id)
+            self.writer.patch(file_path, path, kwargs)
+            return file_id
+
         keyfile = self.makeKeyFile(file_path, kwargs)
 
         if item is not None:
             file_id = item.get_desktop_file_id()
         else:
-            file_id = util.getUniqueFileId(keyfile.get_string(GLib.KEY_FILE_DESKTOP_GROUP, 'Name'), '.desktop')
+            file_id = self.getUniqueFileId(keyfile.get_string(GLib.KEY_FILE_DESKTOP_GROUP, 'Name'), '.desktop')
 
         contents, length = keyfile.to_data()
 
         path = os.path.join(util.getUserItemPath(), file_id)
-        with open(path, 'w') as f:
-            f.write(contents)
+        self.writer.write(path, contents)
 
         return file_id
 
+    def writeItems(self, items, **kwargs):
+        #bulk version of writeItem, all items get the same keys
+        path = util.getUserItemPath()
+        file_ids = [item.get_desktop_file_id() for item in items]
+        jobs = [(item.get_desktop_file_path(), os.path.join(path, file_id)) for item, file_id in zip(items, file_ids)]
+        self.writer.patchMany(jobs, kwargs)
+        return file_ids
+
     def writeMenu(self, menu, **kwargs):
         if menu is not None:
             file_id = os.path.split(menu.get_desktop_file_path())[1]
             file_path = menu.get_desktop_file_path()
-            keyfile = GLib.KeyFile()
-            keyfile.load_from_file(file_path, util.KEY_FILE_FLAGS)
+            path = os.path.join(util.getUserDirectoryPath(), file_id)
+            self.writer.patch(file_path, path, kwargs)
+            return file_id
         elif menu is None and 'Name' not in kwargs:
             raise Exception('New menus need a name')
         else:
-            file_id = util.getUniqueFileId(kwargs['Name'], '.directory')
+            file_id = self.getUniqueFileId(kwargs['Name'], '.directory')
             keyfile = GLib.KeyFile()
 
         util.fillKeyFile(keyfile, kwargs)
@@ -424,8 +610,7 @@ class MenuEditor(object):
         contents, length = keyfile.to_data()
 
         path = os.path.join(util.getUserDirectoryPath(), file_id)
-        with open(path, 'w') as f:
-            f.write(contents)
+        self.writer.write(path, contents)
         return file_id
 
     def getXmlNodesByName(self, name, element):
@@ -449,6 +634,7 @@ class MenuEditor(object):
         # remove old layout
         for node in self.getXmlNodesByName('Layout', element):
             element.removeChild(node)
+            node.unlink()
 
         # add new layout
         node = dom.createElement('Layout')
@@ -470,6 +656,7 @@ class MenuEditor(object):
         # remove old default layout
         for node in self.getXmlNodesByName('DefaultLayout', element):
             element.removeChild(node)
+            node.unlink()
 
         # add new layout
         node = dom.createElement('DefaultLayout')
@@ -499,6 +686,43 @@ class MenuEditor(object):
         self.positionItem(parent, item, before=before, after=after)
         self.save()
 
+    def canPlaceItem(self, item, new_parent):
+        if isinstance(item, GMenu.TreeSeparator):
+            return self.getPath(item.get_parent()) == self.getPath(new_parent)
+        if isinstance(item, GMenu.TreeDirectory):
+            #not into itself or one of its submenus
+            path = self.getPath(item)
+            return self.getPath(new_parent)[:len(path)] != path
+        return isinstance(item, GMenu.TreeEntry)
+
+    def placeItem(self, item, new_parent, before=None, after=None):
+        # puts item next to before/after in new_parent, which may be another
+        # menu than the one it is in, with one <Layout> and one save; the
+        # old parent's <Layout> may keep naming it, that is ignored
+        if not self.canPlaceItem(item, new_parent):
+            return False
+        old_parent = item.get_parent()
+        if self.getPath(old_parent) == self.getPath(new_parent):
+            self.positionItem(new_parent, item, before, after)
+            self.save()
+            return True
+
+        dom = self.dom
+        if isinstance(item, GMenu.TreeEntry):
+            file_id = item.get_desktop_file_id()
+            old_xml = self.getXmlMenu(self.getPath(old_parent), dom.documentElement, dom)
+            self.addXmlFilename(old_xml, dom, file_id, 'Exclude')
+            self.addItem(new_parent, file_id, dom)
+            self.positionItem(new_parent, ('Filename', file_id), before, after)
+        else:
+            menu_id = item.get_menu_id()
+            old_path = '/'.join(self.getPath(item))
+            new_path = '/'.join(self.getPath(new_parent) + [menu_id])
+            self.addXmlMove(dom.documentElement, old_path, new_path, dom)
+            self.positionItem(new_parent, ('Menuname', menu_id), before, after)
+        self.save()
+        return True
+
     def positionItem(self, parent, item, before=None, after=None):
         contents = self.getContents(parent)
         if after:
@@ -522,51 +746,43 @@ class MenuEditor(object):
         self.addXmlLayout(menu_xml, layout, dom)
 
     def undoMoves(self, element, old, new, dom):
-        nodes = []
-        matches = []
-        original_old = old
-        final_old = old
-        #get all <Move> elements
-        for node in self.getXmlNodesByName(['Move'], element):
-            nodes.insert(0, node)
-        #if the <New> matches our old parent we've found a stage to undo
-        for node in nodes:
-            xml_old = node.getElementsByTagName('Old')[0]
-            xml_new = node.getElementsByTagName('New')[0]
-            if xml_new.childNodes[0].nodeValue == old:
-                matches.append(node)
-                #we should end up with this path when completed
-                final_old = xml_old.childNodes[0].nodeValue
-        #undoing <Move>s
-        for node in matches:
-            element.removeChild(node)
-        if len(matches) > 0:
-            for node in nodes:
-                xml_old = node.getElementsByTagName('Old')[0]
-                xml_new = node.getElementsByTagName('New')[0]
-                path = os.path.split(xml_new.childNodes[0].nodeValue)
-                if path[0] == original_old:
-                    element.removeChild(node)
-                    for node in dom.getElementsByTagName('Menu'):
-                        name_node = node.getElementsByTagName('Name')[0]
-                        name = name_node.childNodes[0].nodeValue
-                        if name == os.path.split(new)[1]:
-                            #copy app and dir directory info from old <Menu>
-                            root_path = dom.getElementsByTagName('Menu')[0].getElementsByTagName('Name')[0].childNodes[0].nodeValue
-                            xml_menu = self.getXmlMenu(root_path + '/' + new, dom.documentElement, dom)
-                            for app_dir in node.getElementsByTagName('AppDir'):
-                                xml_menu.appendChild(app_dir)
-                            for dir_dir in node.getElementsByTagName('DirectoryDir'):
-                                xml_menu.appendChild(dir_dir)
-                            parent = node.parentNode
-                            parent.removeChild(node)
-                    node = dom.createElement('Move')
-                    node.appendChild(self.addXmlTextElement(node, 'Old', xml_old.childNodes[0].nodeValue, dom))
-                    node.appendChild(self.addXmlTextElement(node, 'New', os.path.join(new, path[1]), dom))
-                    element.appendChild(node)
-            if final_old == new:
-                return True
-            node = dom.createElement('Move')
-            node.appendChild(self.addXmlTextElement(node, 'Old', final_old, dom))
-            node.appendChild(self.addXmlTextElement(node, 'New', new, dom))
-            return element.appendChild(node)
+        # a menu that got to old by our own <Move>s goes on from where those
+        # started: their <New>, and those of the menus moved into it, are
+        # pointed at new in place, so they keep their order
+        prefix = old + '/'
+        found = False
+        for node in list(self.getXmlNodesByName(['Move'], element)):
+            xml_old = node.getElementsByTagName('Old')[0].childNodes[0]
+            xml_new = node.getElementsByTagName('New')[0].childNodes[0]
+            if xml_new.nodeValue == old:
+                found = True
+                xml_new.nodeValue = new
+            elif xml_new.nodeValue.startswith(prefix):
+                xml_new.nodeValue = new + xml_new.nodeValue[len(old):]
+            else:
+                continue
+            if xml_new.nodeValue == xml_old.nodeValue:
+                element.removeChild(node)
+                node.unlink()
+        if found:
+            self.moveXmlMenu(element, old.split('/'), new.split('/'), dom)
+        return found
+
+    def moveXmlMenu(self, element, old, new, dom):
+        # our edits to the menu at old no longer get there by a <Move>,
+        # they go along to new
+        menu = element
+        for name in old:
+            menu = self.getXmlMenuPart(menu, name)
+            if menu is None:
+                return
+        menu.parentNode.removeChild(menu)
+        target = self.getXmlMenu(new, element, dom)
+        for child in list(menu.childNodes):
+            if child.nodeName in ('Layout', 'DefaultLayout'):
+                for node in list(self.getXmlNodesByName(child.nodeName, target)):
+                    target.removeChild(node)
+                    node.unlink()
+            if child.nodeName != 'Name':
+                target.appendChild(child)
+        menu.unlink()
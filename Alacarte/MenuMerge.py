@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Three-way merge of user .menu files, for when somebody else (another
+# alacarte, a provisioning script) changed the file since we read it.
+# The edits of both sides are kept; where both changed the same thing
+# ours wins and the path of the menu is reported as a conflict.
+#
+# <Menu>s are matched by <Name> and merged recursively. The other
+# children of a menu are matched by a key: the elements a menu has at
+# most one of by their name (a <Deleted> and a <NotDeleted> are the same
+# thing), <Include>/<Exclude> of one <Filename> by the file id, so
+# showing and hiding a launcher are two versions of one thing, and
+# everything else by its contents.
+
+import collections
+import xml.dom.minidom
+import xml.parsers.expat
+from Alacarte import xdg
+
+SINGLE = {
+    'Name': 'Name',
+    'Directory': 'Directory',
+    'Layout': 'Layout',
+    'DefaultLayout': 'DefaultLayout',
+    'OnlyUnallocated': 'OnlyUnallocated',
+    'NotOnlyUnallocated': 'OnlyUnallocated',
+    'Deleted': 'Deleted',
+    'NotDeleted': 'Deleted',
+}
+
+def getKey(node):
+    if node.nodeType == node.ELEMENT_NODE:
+        if node.nodeName == 'Menu':
+            return ('Menu', xdg.getMenuName(node))
+        if node.nodeName in SINGLE:
+            return (SINGLE[node.nodeName],)
+        if node.nodeName in ('Include', 'Exclude'):
+            children = list(xdg.getChildElements(node, ('Filename', 'Category', 'All', 'And', 'Or', 'Not')))
+            if len(children) == 1 and children[0].nodeName == 'Filename':
+                return ('Filename', (xdg.getText(children[0]) or '').strip())
+    return ('Node', node.toxml())
+
+def getChildren(menu):
+    children = collections.OrderedDict()
+    if menu is not None:
+        for node in menu.childNodes:
+            #a later rule for the same key overrides an earlier one
+            children[getKey(node)] = node
+    return children
+
+def isSame(a, b):
+    if a is None or b is None:
+        return a is b
+    return a.toxml() == b.toxml()
+
+def mergeMenu(base, ours, theirs, out, dom, path, conflicts):
+    base_children = getChildren(base)
+    our_children = getChildren(ours)
+    their_children = getChildren(theirs)
+    keys = list(our_children) + [key for key in their_children if key not in our_children]
+    for key in keys:
+        base_node = base_children.get(key)
+        our_node = our_children.get(key)
+        their_node = their_children.get(key)
+        if key[0] == 'Menu' and our_node is not None and their_node is not None:
+            node = dom.createElement('Menu')
+            mergeMenu(base_node, our_node, their_node, node, dom, path + (key[1],), conflicts)
+        elif isSame(our_node, their_node) or isSame(base_node, their_node):
+            node = our_node
+        elif isSame(base_node, our_node):
+            node = their_node
+        else:
+            conflicts.append('/'.join(path))
+            node = our_node
+        if node is None:
+            continue
+        if node.ownerDocument is not dom:
+            node = dom.importNode(node, True)
+        out.appendChild(node)
+
+def mergeDocuments(base, ours, theirs):
+    # returns the merged document and the menus with conflicting edits;
+    # base is None when the file didn't exist before
+    dom = xml.dom.minidom.parseString(xdg.MENU_DOCTYPE + '<Menu/>')
+    conflicts = []
+    base_root = base.documentElement if base is not None else None
+    mergeMenu(base_root, ours.documentElement, theirs.documentElement, dom.documentElement, dom, (), conflicts)
+    return dom, conflicts
+
+def parseMenu(text):
+    dom = xml.dom.minidom.parseString(text)
+    xdg.removeWhitespaceNodes(dom)
+    return dom
+
+def mergeText(base, ours, theirs):
+    # the same on serialized menus, as FileWriter.commit wants it
+    try:
+        their_dom = parseMenu(theirs)
+    except xml.parsers.expat.ExpatError:
+        #nothing to keep of a broken file
+        return ours
+    our_dom = parseMenu(ours)
+    try:
+        base_dom = parseMenu(base) if base is not None else None
+    except xml.parsers.expat.ExpatError:
+        base_dom = None
+    dom, conflicts = mergeDocuments(base_dom, our_dom, their_dom)
+    text = dom.toprettyxml()
+    for document in (dom, base_dom, our_dom, their_dom):
+        if document is not None:
+            document.unlink()
+    return text
@@ -0,0 +1,518 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# A resolver for the freedesktop.org menu spec that doesn't need GMenu.
+# It produces the same tree MenuEditor gets from GMenu.Tree with the flags
+# it uses (empty menus, excluded and NoDisplay entries and all separators
+# shown, sorted by display name), as plain immutable records that can be
+# pickled and sent between processes.
+#
+# Legacy dirs and OnlyShowIn/NotShowIn/TryExec are not handled.
+
+import collections
+import os
+import xml.dom.minidom
+import xml.parsers.expat
+from Alacarte import xdg, DesktopFile, SystemIndex
+
+Entry = collections.namedtuple('Entry', 'desktop_file_id desktop_file_path parent name display_name comment icon exec_ terminal nodisplay is_excluded categories')
+Directory = collections.namedtuple('Directory', 'menu_id path name comment icon desktop_file_path is_nodisplay contents')
+Separator = collections.namedtuple('Separator', 'parent index')
+
+DEFAULT_LAYOUT = (('Merge', 'menus'), ('Merge', 'files'))
+
+class Menu(object):
+    # a <Menu> while the files are being merged
+    def __init__(self, name):
+        self.name = name
+        self.app_dirs = []
+        self.directory_dirs = []
+        self.directories = []
+        self.rules = []
+        self.deleted = None
+        self.only_unallocated = None
+        self.moves = []
+        self.layout = None
+        self.default_layout = None
+        self.submenus = []
+
+    def merge(self, other):
+        self.app_dirs += other.app_dirs
+        self.directory_dirs += other.directory_dirs
+        self.directories += other.directories
+        self.rules += other.rules
+        if other.deleted is not None:
+            self.deleted = other.deleted
+        if other.only_unallocated is not None:
+            self.only_unallocated = other.only_unallocated
+        self.moves += other.moves
+        if other.layout is not None:
+            self.layout = other.layout
+        if other.default_layout is not None:
+            self.default_layout = other.default_layout
+        self.submenus += other.submenus
+
+    def consolidate(self):
+        submenus = collections.OrderedDict()
+        for menu in self.submenus:
+            if menu.name in submenus:
+                submenus[menu.name].merge(menu)
+            else:
+                submenus[menu.name] = menu
+        self.submenus = list(submenus.values())
+        for menu in self.submenus:
+            menu.consolidate()
+
+    def find(self, path, create=False):
+        menu = self
+        for name in path:
+            for submenu in menu.submenus:
+                if submenu.name == name:
+                    menu = submenu
+                    break
+            else:
+                if not create:
+                    return None
+                submenu = Menu(name)
+                menu.submenus.append(submenu)
+                menu = submenu
+        return menu
+
+def splitPath(path):
+    return [name for name in path.split('/') if name]
+
+def parseRule(element):
+    # rules are (kind, value), kind being Filename, Category, All, And, Or
+    # or Not; the children of And/Or/Not are a tuple of rules
+    name = element.nodeName
+    if name in ('Filename', 'Category'):
+        return (name, xdg.getText(element).strip())
+    elif name == 'All':
+        return ('All', None)
+    elif name in ('And', 'Or', 'Not'):
+        children = tuple(parseRule(child) for child in element.childNodes if child.nodeType == child.ELEMENT_NODE)
+        return (name, tuple(child for child in children if child is not None))
+    return None
+
+def matchRule(rule, file_id, categories):
+    kind, value = rule
+    if kind == 'Filename':
+        return file_id == value
+    elif kind == 'Category':
+        return value in categories
+    elif kind == 'All':
+        return True
+    elif kind == 'And':
+        return all(matchRule(child, file_id, categories) for child in value)
+    elif kind == 'Or':
+        return any(matchRule(child, file_id, categories) for child in value)
+    elif kind == 'Not':
+        return not any(matchRule(child, file_id, categories) for child in value)
+    return False
+
+def getFileIds(rule):
+    # the only file ids rule can match, or None if it isn't just
+    # <Filename>s, as in the <Include>s and <Exclude>s alacarte writes
+    kind, value = rule
+    if kind == 'Filename':
+        return [value]
+    elif kind == 'Or':
+        file_ids = []
+        for child in value:
+            child_ids = getFileIds(child)
+            if child_ids is None:
+                return None
+            file_ids += child_ids
+        return file_ids
+    return None
+
+def parseLayout(element):
+    layout = []
+    for child in element.childNodes:
+        if child.nodeType != child.ELEMENT_NODE:
+            continue
+        if child.nodeName in ('Filename', 'Menuname'):
+            layout.append((child.nodeName, xdg.getText(child).strip()))
+        elif child.nodeName == 'Separator':
+            layout.append(('Separator',))
+        elif child.nodeName == 'Merge':
+            layout.append(('Merge', child.getAttribute('type')))
+    return tuple(layout)
+
+class MenuTree(object):
+    def __init__(self, basename=None, home=None, locale=None):
+        self.basename = basename or xdg.getDefaultMenu()
+        self.config_dirs = [os.path.join(xdg.getConfigHome(home), 'menus')]
+        self.config_dirs += [os.path.join(path, 'menus') for path in xdg.getConfigDirs()]
+        self.data_dirs = [xdg.getDataHome(home)] + xdg.getDataDirs()
+        self.languages = DesktopFile.getLanguages(locale)
+        self.root = None
+
+    # loading the .menu files
+
+    def load(self):
+        #the files being merged, a file is merged again at every reference
+        #that doesn't loop back into itself
+        self.loading = set()
+        self.app_dir_cache = {}
+        self.entry_cache = {}
+        self.directory_cache = {}
+        for path in self.config_dirs:
+            file_path = os.path.join(path, self.basename)
+            if os.path.isfile(file_path):
+                break
+        else:
+            raise ValueError("can not load menu tree %r" % (self.basename,))
+
+        root = self.parseFile(file_path)
+        if root is None:
+            raise ValueError("can not load menu tree %r" % (self.basename,))
+        root.consolidate()
+        self.applyMoves(root)
+        self.root = self.resolve(root)
+        return self.root
+
+    def parseFile(self, file_path, menu=None):
+        file_path = os.path.realpath(file_path)
+        if file_path in self.loading:
+            return menu
+        try:
+            dom = xml.dom.minidom.parse(file_path)
+        except (IOError, xml.parsers.expat.ExpatError):
+            return menu
+        root = dom.documentElement
+        if root is None or root.nodeName != 'Menu':
+            dom.unlink()
+            return menu
+        if menu is None:
+            menu = Menu(xdg.getMenuName(root))
+        self.loading.add(file_path)
+        try:
+            self.parseChildren(root, menu, file_path)
+        finally:
+            self.loading.discard(file_path)
+            dom.unlink()
+        return menu
+
+    def parseChildren(self, element, menu, file_path):
+        base = os.path.dirname(file_path)
+        for child in element.childNodes:
+            if child.nodeType != child.ELEMENT_NODE:
+                continue
+            name = child.nodeName
+            text = (xdg.getText(child) or '').strip()
+            if name == 'Menu':
+                submenu = Menu(xdg.getMenuName(child))
+                self.parseChildren(child, submenu, file_path)
+                menu.submenus.append(submenu)
+            elif name == 'AppDir':
+                menu.app_dirs.append(os.path.join(base, text))
+            elif name == 'DefaultAppDirs':
+                menu.app_dirs += [os.path.join(path, 'applications') for path in reversed(self.data_dirs)]
+            elif name == 'DirectoryDir':
+                menu.directory_dirs.append(os.path.join(base, text))
+            elif name == 'DefaultDirectoryDirs':
+                menu.directory_dirs += [os.path.join(path, 'desktop-directories') for path in reversed(self.data_dirs)]
+            elif name == 'Directory':
+                menu.directories.append(text)
+            elif name in ('Include', 'Exclude'):
+                rules = [parseRule(rule) for rule in child.childNodes if rule.nodeType == rule.ELEMENT_NODE]
+                menu.rules.append((name, ('Or', tuple(rule for rule in rules if rule is not None))))
+            elif name in ('Deleted', 'NotDeleted'):
+                menu.deleted = name == 'Deleted'
+            elif name in ('OnlyUnallocated', 'NotOnlyUnallocated'):
+                menu.only_unallocated = name == 'OnlyUnallocated'
+            elif name == 'Move':
+                old = new = None
+                for node in xdg.getChildElements(child, ('Old',)):
+                    old = xdg.getText(node).strip()
+                for node in xdg.getChildElements(child, ('New',)):
+                    new = xdg.getText(node).strip()
+                if old and new:
+                    menu.moves.append((old, new))
+            elif name == 'Layout':
+                menu.layout = parseLayout(child)
+            elif name == 'DefaultLayout':
+                menu.default_layout = parseLayout(child)
+            elif name == 'MergeFile':
+                if child.getAttribute('type') == 'parent':
+                    parent = self.getParentFile(file_path)
+                    if parent is not None:
+                        self.parseFile(parent, menu)
+                elif text:
+                    self.parseFile(os.path.join(base, text), menu)
+            elif name == 'MergeDir':
+                self.parseMergeDir(os.path.join(base, text), menu)
+            elif name == 'DefaultMergeDirs':
+                merge_dir = os.path.splitext(self.basename)[0] + '-merged'
+                for path in reversed(self.config_dirs):
+                    self.parseMergeDir(os.path.join(path, merge_dir), menu)
+
+    def parseMergeDir(self, path, menu):
+        try:
+            names = sorted(os.listdir(path))
+        except OSError:
+            return
+        for name in names:
+            if name.endswith('.menu'):
+                self.parseFile(os.path.join(path, name), menu)
+
+    def getParentFile(self, file_path):
+        # the same file in the config dirs after the one file_path is in
+        for index, path in enumerate(self.config_dirs):
+            path = os.path.realpath(path)
+            if file_path.startswith(path + os.sep):
+                relative = os.path.relpath(file_path, path)
+                for parent in self.config_dirs[index + 1:]:
+                    parent_path = os.path.join(parent, relative)
+                    if os.path.isfile(parent_path):
+                        return parent_path
+                return None
+        return None
+
+    def applyMoves(self, menu):
+        for old, new in menu.moves:
+            old_path = splitPath(old)
+            source = menu.find(old_path)
+            if source is None or not old_path:
+                continue
+            parent = menu.find(old_path[:-1])
+            parent.submenus.remove(source)
+            new_path = splitPath(new)
+            target = menu.find(new_path[:-1], True)
+            source.name = new_path[-1]
+            target.submenus.append(source)
+            target.consolidate()
+        for submenu in menu.submenus:
+            self.applyMoves(submenu)
+
+    # building the tree
+
+    def getAppDir(self, path):
+        if path not in self.app_dir_cache:
+            index = SystemIndex.getDefault()
+            if index.isFresh(path):
+                file_ids = index.listFileIds(path)
+                self.app_dir_cache[path] = dict((file_id, file_path) for file_id, file_path in file_ids.items()
+                                                if file_id.endswith('.desktop'))
+            else:
+                self.app_dir_cache[path] = xdg.scanFileIds(path, '.desktop')
+        return self.app_dir_cache[path]
+
+    def parseEntry(self, file_path):
+        if file_path not in self.entry_cache:
+            values = SystemIndex.getDefault().getValues(file_path)
+            if values is None:
+                values = DesktopFile.parse(file_path)
+            self.entry_cache[file_path] = values
+        return self.entry_cache[file_path]
+
+    def getPool(self, app_dirs):
+        # desktop file id -> path, later dirs take precedence
+        pool = {}
+        for path in app_dirs:
+            pool.update(self.getAppDir(path))
+        return pool
+
+    def findDirectory(self, directories, directory_dirs):
+        for file_id in reversed(directories):
+            for path in reversed(directory_dirs):
+                file_path = os.path.join(path, file_id)
+                if file_path not in self.directory_cache:
+                    self.directory_cache[file_path] = os.path.isfile(file_path)
+                if self.directory_cache[file_path]:
+                    return file_path
+        return None
+
+    def resolve(self, root):
+        # first pass: matching, allocating the entries of the menus that
+        # don't have <OnlyUnallocated>
+        # the inherited dirs and layout are kept by path for building
+        matches = {}
+        states = {}
+        allocated = set()
+        pending = []
+        def walk(menu, path, app_dirs, directory_dirs, default_layout):
+            app_dirs = app_dirs + menu.app_dirs
+            directory_dirs = directory_dirs + menu.directory_dirs
+            default_layout = menu.default_layout or default_layout
+            states[path] = (app_dirs, directory_dirs, default_layout)
+            if menu.only_unallocated:
+                pending.append((menu, path))
+            else:
+                matches[path] = self.matchEntries(menu, app_dirs, None)
+                allocated.update(file_id for file_id, excluded in matches[path].items() if not excluded)
+            for submenu in menu.submenus:
+                walk(submenu, path + (submenu.name,), app_dirs, directory_dirs, default_layout)
+        walk(root, (), [], [], None)
+
+        # second pass: the <OnlyUnallocated> menus get what is left
+        for menu, path in pending:
+            matches[path] = self.matchEntries(menu, states[path][0], allocated)
+
+        return self.build(root, (), None, matches, states)
+
+    def matchEntries(self, menu, app_dirs, allocated):
+        # desktop file id -> is excluded
+        pool = self.getPool(app_dirs)
+        entries = collections.OrderedDict()
+        for kind, rule in menu.rules:
+            file_ids = getFileIds(rule)
+            if file_ids is not None:
+                #only these files can match, no need to go over the pool
+                candidates = [(file_id, pool[file_id]) for file_id in file_ids if file_id in pool]
+            else:
+                candidates = pool.items()
+            for file_id, file_path in candidates:
+                values = self.parseEntry(file_path)
+                if DesktopFile.getBoolean(values, 'Hidden'):
+                    continue
+                if allocated is not None and file_id in allocated:
+                    continue
+                if not matchRule(rule, file_id, DesktopFile.getList(values, 'Categories')):
+                    continue
+                if kind == 'Include':
+                    entries[file_id] = False
+                elif file_id in entries:
+                    entries[file_id] = True
+        return entries
+
+    def build(self, menu, path, parent, matches, states):
+        app_dirs, directory_dirs, default_layout = states[path]
+        pool = self.getPool(app_dirs)
+        languages = self.languages
+
+        entries = {}
+        for file_id, excluded in matches[path].items():
+            file_path = pool[file_id]
+            values = self.parseEntry(file_path)
+            name = DesktopFile.getLocaleString(values, 'Name', languages, file_id)
+            display_name = DesktopFile.getLocaleString(values, 'X-GNOME-FullName', languages, name)
+            entries[file_id] = Entry(file_id, file_path, path,
+                                     name, display_name,
+                                     DesktopFile.getLocaleString(values, 'Comment', languages),
+                                     DesktopFile.getLocaleString(values, 'Icon', languages),
+                                     DesktopFile.getString(values, 'Exec'),
+                                     DesktopFile.getBoolean(values, 'Terminal'),
+                                     DesktopFile.getBoolean(values, 'NoDisplay'),
+                                     excluded,
+                                     tuple(DesktopFile.getList(values, 'Categories')))
+
+        submenus = collections.OrderedDict()
+        for submenu in menu.submenus:
+            if submenu.deleted:
+                continue
+            directory = self.build(submenu, path + (submenu.name,), path, matches, states)
+            submenus[submenu.name] = directory
+
+        layout = menu.layout or default_layout or DEFAULT_LAYOUT
+        contents = self.applyLayout(layout, path, submenus, entries)
+
+        directory_path = self.findDirectory(menu.directories, directory_dirs)
+        values = DesktopFile.parse(directory_path) if directory_path else {}
+        return Directory(menu.name, path,
+                         DesktopFile.getLocaleString(values, 'Name', languages, menu.name),
+                         DesktopFile.getLocaleString(values, 'Comment', languages),
+                         DesktopFile.getLocaleString(values, 'Icon', languages),
+                         directory_path,
+                         DesktopFile.getBoolean(values, 'NoDisplay'),
+                         tuple(contents))
+
+    def applyLayout(self, layout, path, submenus, entries):
+        menu_names = set(item[1] for item in layout if item[0] == 'Menuname')
+        file_ids = set(item[1] for item in layout if item[0] == 'Filename')
+        sorted_menus = sorted((menu for name, menu in submenus.items() if name not in menu_names), key=sortKey)
+        sorted_entries = sorted((entry for file_id, entry in entries.items() if file_id not in file_ids), key=sortKey)
+
+        contents = []
+        placed = set()
+        def place(item):
+            if id(item) not in placed:
+                placed.add(id(item))
+                contents.append(item)
+        for item in layout:
+            if item[0] == 'Filename':
+                if item[1] in entries:
+                    place(entries[item[1]])
+            elif item[0] == 'Menuname':
+                if item[1] in submenus:
+                    place(submenus[item[1]])
+            elif item[0] == 'Separator':
+                contents.append(Separator(path, len(contents)))
+            elif item[0] == 'Merge':
+                if item[1] == 'menus':
+                    items = sorted_menus
+                elif item[1] == 'files':
+                    items = sorted_entries
+                else:
+                    items = sorted(sorted_menus + sorted_entries, key=sortKey)
+                for child in items:
+                    place(child)
+        return contents
+
+    # the query interface of MenuEditor
+
+    def getRoot(self):
+        if self.root is None:
+            self.load()
+        return self.root
+
+    def getMenus(self, parent):
+        if parent is None:
+            yield (self.getRoot(), True)
+            return
+        for item in parent.contents:
+            if isinstance(item, Directory):
+                yield (item, self.isVisible(item))
+
+    def getContents(self, item):
+        return list(item.contents)
+
+    def getItems(self, menu):
+        for item in menu.contents:
+            yield (item, self.isVisible(item))
+
+    def isVisible(self, item):
+        if isinstance(item, Entry):
+            return not (item.is_excluded or item.nodisplay)
+        elif isinstance(item, Directory):
+            return not item.is_nodisplay
+        return True
+
+    def findMenu(self, menu_id, parent=None):
+        if parent is None:
+            parent = self.getRoot()
+        if parent.menu_id == menu_id:
+            return parent
+        for item in parent.contents:
+            if isinstance(item, Directory):
+                menu = self.findMenu(menu_id, item)
+                if menu is not None:
+                    return menu
+        return None
+
+    def getPath(self, menu):
+        return list(menu.path)
+
+def sortKey(item):
+    if isinstance(item, Entry):
+        return item.display_name.casefold()
+    return item.name.casefold()
+
+def resolveMenu(basename=None, home=None, locale=None):
+    # for process pools: resolve the menu of one user into plain records
+    return MenuTree(basename, home, locale).load()
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Serves a loaded MenuEditor over a Unix socket, so scripts don't have to
+# load GMenu and the user menu for every change. It runs on its own as
+# 'alacarte daemon' or inside the main window.
+#
+# Connections are read on threads, but all requests run on the main loop:
+# the requests that arrived together run as one batch, and the user menu
+# is written once at the end of the batch.
+
+import json
+import os
+import socketserver
+import stat
+import sys
+import threading
+import traceback
+from gi.repository import GLib, GMenu
+from Alacarte.MenuClient import MenuClient, ServiceError
+from Alacarte.MenuEditor import MenuEditor
+from Alacarte.FileWriter import AsyncFileWriter
+from Alacarte import util, xdg
+
+EDIT_COMMANDS = ('show', 'hide', 'create', 'delete', 'move', 'restore')
+COMMANDS = ('stop', 'ping', 'menus', 'list') + EDIT_COMMANDS
+
+STRING = (str, type(None))
+BOOLEAN = (bool,)
+
+# command -> the arguments it takes, their types and if they are required;
+# a menu id of None is the root menu
+ARGUMENTS = {
+    'stop': {},
+    'ping': {},
+    'menus': {},
+    'list': dict(parent=(STRING, False)),
+    'show': dict(parent=(STRING, True), item=((str,), True)),
+    'hide': dict(parent=(STRING, True), item=((str,), True)),
+    'create': dict(parent=(STRING, True), name=((str,), True), exec=((str,), True),
+                   icon=(STRING, False), comment=(STRING, False), terminal=(BOOLEAN, False)),
+    'delete': dict(parent=(STRING, True), item=((str,), True)),
+    'move': dict(parent=(STRING, True), item=((str,), True), before=(STRING, False), after=(STRING, False)),
+    'restore': dict(dry_run=(BOOLEAN, False)),
+}
+
+INTERNAL_ERROR = 'internal error in the menu service, see its output'
+
+def checkArguments(command, args):
+    arguments = ARGUMENTS[command]
+    for name, value in args.items():
+        if name not in arguments:
+            raise ServiceError("%r takes no argument %r" % (command, name))
+        types, required = arguments[name]
+        if not isinstance(value, types):
+            raise ServiceError("bad value for %r of %r: %r" % (name, command, value))
+    for name, (types, required) in arguments.items():
+        if required and name not in args:
+            raise ServiceError("%r needs the argument %r" % (command, name))
+
+def checkPrivateDir(path):
+    # the fallback runtime dir is in /tmp, where somebody else could have
+    # made it first; only put the socket in a dir nobody else can get at
+    st = os.lstat(path)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise ServiceError("%s is not a private directory of this user" % (path,))
+
+def getItemId(item):
+    if isinstance(item, GMenu.TreeDirectory):
+        return item.get_menu_id()
+    elif isinstance(item, GMenu.TreeEntry):
+        return item.get_desktop_file_id()
+    return None
+
+def describeItem(item, visible):
+    if isinstance(item, GMenu.TreeDirectory):
+        return dict(type='Menu', id=item.get_menu_id(), name=item.get_name(), visible=visible)
+    elif isinstance(item, GMenu.TreeEntry):
+        return dict(type='Item', id=item.get_desktop_file_id(), name=item.get_app_info().get_display_name(), visible=visible)
+    return dict(type='Separator', id=None, name=None, visible=visible)
+
+class Request(object):
+    def __init__(self, command, args):
+        self.command = command
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        service = self.server.service
+        for line in self.rfile:
+            try:
+                data = json.loads(line.decode('utf-8'))
+                request = Request(str(data['command']), dict(data.get('args') or {}))
+            except (ValueError, KeyError, TypeError) as e:
+                reply = dict(error='bad request: %s' % (e,))
+            else:
+                service.submit(request)
+                request.done.wait()
+                if request.error is not None:
+                    reply = dict(error=request.error)
+                else:
+                    reply = dict(result=request.result)
+            self.wfile.write(json.dumps(reply).encode('utf-8') + b'\n')
+            self.wfile.flush()
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class MenuService(object):
+    def __init__(self, editor, path=None, loop=None):
+        self.editor = editor
+        self.path = path or xdg.getSocketPath(editor.tree.props.menu_basename)
+        self.loop = loop
+        self.lock = threading.Lock()
+        self.requests = []
+        self.scheduled = False
+        self.server = None
+
+    def start(self):
+        #a socket nobody answers on is left over from a crash
+        if os.path.exists(self.path):
+            try:
+                MenuClient(path=self.path).connect()
+            except ServiceError:
+                os.remove(self.path)
+            else:
+                raise ServiceError("menu service is already running at %s" % (self.path,))
+        dirname = os.path.dirname(self.path)
+        for path in (os.path.dirname(dirname), dirname):
+            os.makedirs(path, mode=0o700, exist_ok=True)
+            checkPrivateDir(path)
+        self.server = Server(self.path, RequestHandler)
+        self.server.service = self
+        os.chmod(self.path, 0o600)
+        thread = threading.Thread(target=self.server.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def stop(self):
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self.server = None
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+    def submit(self, request):
+        # called on the connection threads
+        with self.lock:
+            self.requests.append(request)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        GLib.idle_add(self.runRequests)
+
+    def runRequests(self):
+        with self.lock:
+            requests = self.requests
+            self.requests = []
+
+        try:
+            self.runBatch(requests)
+        except Exception:
+            traceback.print_exc()
+            for request in requests:
+                request.error = request.error or INTERNAL_ERROR
+        finally:
+            #the clients wait for their requests, whatever happened
+            for request in requests:
+                request.done.set()
+        #flushing the writer runs the main loop, requests that came in
+        #meanwhile are run next instead of inside this batch
+        with self.lock:
+            self.scheduled = bool(self.requests)
+            return self.scheduled
+
+    def runBatch(self, requests):
+        edits = [request for request in requests if request.command in EDIT_COMMANDS]
+        writer = self.editor.writer
+        errors = []
+        handler = None
+        if edits and isinstance(writer, AsyncFileWriter):
+            #the failures of earlier writes aren't ours to report
+            writer.flush()
+            handler = writer.connect('error', lambda writer, path, message: errors.append(message))
+        try:
+            self.editor.beginBatch()
+            try:
+                for request in requests:
+                    self.runRequest(request)
+            finally:
+                try:
+                    self.editor.endBatch()
+                except (IOError, OSError) as e:
+                    errors.append(e.strerror or str(e))
+            #later requests must see the changes on disk, don't wait for
+            #the writer or the monitors
+            if edits:
+                writer.flush()
+                self.editor.load()
+        finally:
+            if handler is not None:
+                writer.disconnect(handler)
+        if errors:
+            for request in edits:
+                request.error = request.error or 'could not save the menu: %s' % ('; '.join(errors),)
+
+    def runRequest(self, request):
+        if request.command not in COMMANDS:
+            request.error = 'unknown command %r' % (request.command,)
+            return
+        method = getattr(self, 'do_' + request.command)
+        try:
+            checkArguments(request.command, request.args)
+            request.result = method(**request.args)
+        except ServiceError as e:
+            request.error = str(e)
+        except (IOError, OSError, GLib.Error) as e:
+            request.error = str(e)
+        except Exception:
+            #a bug, not a bad request; the other requests still run
+            traceback.print_exc()
+            request.error = INTERNAL_ERROR
+
+    def getMenu(self, menu_id):
+        menu = self.editor.findMenu(menu_id) if menu_id else self.editor.getRoot()
+        if menu is None:
+            raise ServiceError("no menu %r" % (menu_id,))
+        return menu
+
+    def getItem(self, menu, item_id):
+        for item in self.editor.getContents(menu):
+            if getItemId(item) == item_id:
+                return item
+        raise ServiceError("no item %r in %r" % (item_id, menu.get_menu_id()))
+
+    def do_ping(self):
+        return 'pong'
+
+    def do_stop(self):
+        if self.loop is None:
+            raise ServiceError("the service runs inside the menu editor, close it instead")
+        GLib.idle_add(self.loop.quit)
+
+    def do_menus(self):
+        menus = []
+        def walk(parent):
+            for menu, visible in self.editor.getMenus(parent):
+                if parent is not None:
+                    menus.append(describeItem(menu, visible))
+                walk(menu)
+        walk(None)
+        return menus
+
+    def do_list(self, parent=None):
+        menu = self.getMenu(parent)
+        return [describeItem(item, visible) for item, visible in self.editor.getItems(menu)]
+
+    def do_show(self, parent, item):
+        self.editor.setVisible(self.getItem(self.getMenu(parent), item), True)
+
+    def do_hide(self, parent, item):
+        self.editor.setVisible(self.getItem(self.getMenu(parent), item), False)
+
+    def do_create(self, parent, name, exec, icon=None, comment=None, terminal=False):
+        menu = self.getMenu(parent)
+        keyfile = self.editor.makeKeyFile(None, dict(Type='Application', Name=name, Exec=exec, Icon=icon, Comment=comment, Terminal=terminal))
+        file_id = self.editor.getUniqueFileId('alacarte-made', '.desktop')
+        contents, length = keyfile.to_data()
+        self.editor.writer.write(os.path.join(util.getUserItemPath(), file_id), contents)
+        self.editor.insertExternalItem(file_id, menu.get_menu_id())
+        return file_id
+
+    def do_delete(self, parent, item):
+        item = self.getItem(self.getMenu(parent), item)
+        if isinstance(item, GMenu.TreeDirectory):
+            self.editor.deleteMenu(item)
+        else:
+            self.editor.deleteItem(item)
+
+    def do_move(self, parent, item, before=None, after=None):
+        menu = self.getMenu(parent)
+        item = self.getItem(menu, item)
+        before = self.getItem(menu, before) if before else None
+        after = self.getItem(menu, after) if after else None
+        self.editor.moveItem(menu, item, before, after)
+
+    def do_restore(self, dry_run=False):
+        return self.editor.restoreToSystem(dry_run)
+
+def main(basename=None):
+    loop = GLib.MainLoop()
+    editor = MenuEditor(basename)
+    service = MenuService(editor, loop=loop)
+    try:
+        service.start()
+    except (ServiceError, OSError) as e:
+        sys.stderr.write('alacarte: %s\n' % (e,))
+        return 1
+    try:
+        loop.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.stop()
+        editor.writer.flush()
+    return 0
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Finds the launchers and directories we created that the user .menu no
+# longer uses, and the <Include>, <Exclude>, <Layout> and <Directory>
+# entries that point at files which aren't installed anymore.
+#
+# This doesn't use GLib or GMenu, so it can scan many home directories
+# in worker processes.
+
+import argparse
+import collections
+import multiprocessing
+import os
+import sys
+import xml.parsers.expat
+from Alacarte import xdg, MenuMerge
+from Alacarte.FileOps import readText, commitFile
+
+MADE_PREFIX = 'alacarte-made'
+
+ScanReport = collections.namedtuple('ScanReport', 'home menu_path orphans dead_references cleaned')
+DeadReference = collections.namedtuple('DeadReference', 'menu element file_id')
+
+system_ids = None
+
+def getSystemIds():
+    # the system dirs are the same for every home, scan them once per process
+    global system_ids
+    if system_ids is None:
+        system_ids = (set(xdg.scanSystemFileIds('applications', '.desktop')),
+                      set(xdg.scanSystemFileIds('desktop-directories', '.directory', False)))
+    return system_ids
+
+def walkMenus(menu, path=()):
+    path = path + (xdg.getMenuName(menu),)
+    yield menu, path
+    for child in xdg.getChildElements(menu, ('Menu',)):
+        for item in walkMenus(child, path):
+            yield item
+
+def collectReferences(dom):
+    # returns (menu path, <Filename>/<Directory> node, element kind, file id)
+    # for everything the user menu refers to
+    references = []
+    for menu, path in walkMenus(dom.documentElement):
+        name = '/'.join(path[1:])
+        for node in xdg.getChildElements(menu, ('Include', 'Exclude', 'Layout')):
+            for filename in xdg.getChildElements(node, ('Filename',)):
+                references.append((name, filename, node.nodeName, xdg.getText(filename)))
+        for node in xdg.getChildElements(menu, ('Directory',)):
+            references.append((name, node, 'Directory', xdg.getText(node)))
+    return references
+
+def removeReference(node):
+    parent = node.parentNode
+    parent.removeChild(node)
+    #drop <Include>/<Exclude> elements that are left empty
+    if parent.nodeName in ('Include', 'Exclude') and not parent.childNodes:
+        parent.parentNode.removeChild(parent)
+
+def scanHome(home=None, basename=None, clean=False):
+    basename = basename or xdg.getDefaultMenu()
+    data_home = xdg.getDataHome(home)
+    menu_path = os.path.join(xdg.getConfigHome(home), 'menus', basename)
+    user_items = xdg.scanFileIds(os.path.join(data_home, 'applications'), '.desktop')
+    user_menus = xdg.scanFileIds(os.path.join(data_home, 'desktop-directories'), '.directory', False)
+    system_items, system_menus = getSystemIds()
+
+    try:
+        text = readText(menu_path)
+        dom = MenuMerge.parseMenu(text) if text is not None else None
+    except (IOError, xml.parsers.expat.ExpatError):
+        dom = None
+    shards = xdg.loadShards(dom, os.path.dirname(menu_path), basename) if dom is not None else {}
+
+    references = collectReferences(dom) if dom is not None else []
+    included = set(file_id for menu, node, kind, file_id in references if kind in ('Include', 'Layout'))
+    directories = set(file_id for menu, node, kind, file_id in references if kind == 'Directory')
+
+    orphans = [user_items[file_id] for file_id in sorted(set(user_items) - included) if file_id.startswith(MADE_PREFIX)]
+    orphans += [user_menus[file_id] for file_id in sorted(set(user_menus) - directories) if file_id.startswith(MADE_PREFIX)]
+
+    known_items = system_items.union(user_items)
+    known_menus = system_menus.union(user_menus)
+    #files from other <AppDir>s and <DirectoryDir>s the user menu adds
+    if dom is not None:
+        menu_dir = os.path.dirname(menu_path)
+        for node in dom.getElementsByTagName('AppDir'):
+            known_items.update(xdg.scanFileIds(os.path.join(menu_dir, xdg.getText(node)), '.desktop'))
+        for node in dom.getElementsByTagName('DirectoryDir'):
+            known_menus.update(xdg.scanFileIds(os.path.join(menu_dir, xdg.getText(node)), '.directory', False))
+    dead = []
+    for menu, node, kind, file_id in references:
+        known = known_menus if kind == 'Directory' else known_items
+        if file_id not in known:
+            dead.append((DeadReference(menu, kind, file_id), node))
+
+    if clean:
+        for path in orphans:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if dead:
+            for reference, node in dead:
+                removeReference(node)
+            #written like MenuEditor does, so the edits of a running
+            #alacarte made since the scan are merged in, not lost
+            menu_dir = os.path.dirname(menu_path)
+            if shards:
+                contents, new_shards = xdg.splitShards(dom, basename)
+                for path, shard in new_shards.items():
+                    commitFile(os.path.join(menu_dir, path), shards.get(path), shard, MenuMerge.mergeText, {})
+            else:
+                contents = dom.toprettyxml()
+            commitFile(menu_path, text, contents, MenuMerge.mergeText, {})
+
+    return ScanReport(home, menu_path, orphans, [reference for reference, node in dead], clean)
+
+def scanHomeArgs(args):
+    return scanHome(*args)
+
+def scanHomes(homes, basename=None, clean=False, processes=None):
+    jobs = [(home, basename, clean) for home in homes]
+    if len(jobs) < 2 or processes == 1:
+        return [scanHome(*job) for job in jobs]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(scanHomeArgs, jobs, chunksize=16)
+    finally:
+        pool.close()
+        pool.join()
+
+def printReport(report, out):
+    out.write('%s\n' % (report.menu_path,))
+    for path in report.orphans:
+        out.write('  orphan: %s\n' % (path,))
+    for reference in report.dead_references:
+        out.write('  dead %s in %r: %s\n' % (reference.element, reference.menu or '/', reference.file_id))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Find unused launchers and dead references in user menus.')
+    parser.add_argument('homes', nargs='*', help='home directories to scan, the current user if none')
+    parser.add_argument('--menu', help='menu basename, e.g. applications.menu')
+    parser.add_argument('--clean', action='store_true', help='remove what was found')
+    parser.add_argument('--jobs', type=int, help='number of worker processes')
+    args = parser.parse_args(argv)
+
+    reports = scanHomes(args.homes or [None], args.menu, args.clean, args.jobs)
+    for report in reports:
+        if report.orphans or report.dead_references:
+            printReport(report, sys.stdout)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import bisect
+import itertools
+import os
+import threading
+from gi.repository import GLib, GObject, Gio
+
+def scan_dir(path):
+    names = set()
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    if entry.is_dir():
+                        continue
+                except OSError:
+                    continue
+                if os.access(entry.path, os.X_OK):
+                    names.add(entry.name)
+    except OSError:
+        pass
+    return frozenset(names)
+
+# Index of the programs in $PATH. The directories are scanned once in a
+# worker thread and kept up to date with file monitors, so lookups don't
+# stat every $PATH entry. Until the first scan is done we ask GLib.
+class PathIndex(GObject.GObject):
+    __gsignals__ = {
+        'changed': (GObject.SIGNAL_RUN_FIRST, None, ())
+    }
+
+    default = None
+
+    @classmethod
+    def get_default(cls):
+        if cls.default is None:
+            cls.default = cls()
+        return cls.default
+
+    def __init__(self):
+        GObject.GObject.__init__(self)
+        self.dirs = []
+        for path in os.environ.get('PATH', os.defpath).split(os.pathsep):
+            path = os.path.abspath(path or os.curdir)
+            if path not in self.dirs:
+                self.dirs.append(path)
+
+        self.contents = {}
+        self.names = []
+        self.ready = False
+        self.monitors = []
+        for path in self.dirs:
+            try:
+                monitor = Gio.File.new_for_path(path).monitor_directory(Gio.FileMonitorFlags.NONE, None)
+            except GLib.GError:
+                continue
+            monitor.connect('changed', self.on_dir_changed, path)
+            self.monitors.append(monitor)
+
+        self.rescan(self.dirs)
+
+    def rescan(self, dirs):
+        thread = threading.Thread(target=self.scan_thread, args=(list(dirs),))
+        thread.daemon = True
+        thread.start()
+
+    def scan_thread(self, dirs):
+        contents = dict((path, scan_dir(path)) for path in dirs)
+        GLib.idle_add(self.scan_finished, contents)
+
+    def scan_finished(self, contents):
+        self.contents.update(contents)
+        names = set()
+        for entries in self.contents.values():
+            names.update(entries)
+        self.names = sorted(names)
+        self.ready = True
+        self.emit('changed')
+        return False
+
+    def on_dir_changed(self, monitor, file, other_file, event_type, path):
+        if event_type in (Gio.FileMonitorEvent.CREATED,
+                          Gio.FileMonitorEvent.DELETED,
+                          Gio.FileMonitorEvent.MOVED_IN,
+                          Gio.FileMonitorEvent.MOVED_OUT,
+                          Gio.FileMonitorEvent.RENAMED,
+                          Gio.FileMonitorEvent.ATTRIBUTE_CHANGED):
+            self.rescan([path])
+
+    def find_program(self, command):
+        if os.sep in command or not self.ready:
+            return GLib.find_program_in_path(command)
+        for path in self.dirs:
+            if command in self.contents.get(path, ()):
+                return os.path.join(path, command)
+        return None
+
+    def complete(self, prefix, limit=None):
+        start = bisect.bisect_left(self.names, prefix)
+        matches = []
+        for name in itertools.islice(self.names, start, None):
+            if not name.startswith(prefix):
+                break
+            matches.append(name)
+            if limit is not None and len(matches) >= limit:
+                break
+        return matches
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Index of the .desktop and .directory files in the system data dirs,
+# shared by all users of the host. Run
+#
+#   python3 -m Alacarte.SystemIndex
+#
+# as root after packages are installed (from a package manager trigger on
+# share/applications) and every alacarte process maps the file read only,
+# so the sessions on a host share one copy in the page cache instead of
+# each scanning and parsing the same files.
+#
+# The file holds, little endian:
+#   header   magic, version, number of dirs, number of entries
+#   dirs     path, mtime and root of every indexed directory, each root
+#            (e.g. /usr/share/applications) first, then its subdirectories
+#   entries  root, file id, path, Desktop Entry keys and mtime of every
+#            file, sorted by root and file id
+#   strings  what the dirs and entries point at
+# A root is only used while none of its directories changed since it was
+# indexed; for the rest the callers scan the file system as before.
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from Alacarte import config, DesktopFile, xdg
+
+MAGIC = b'ALSX'
+VERSION = 1
+
+HEADER = struct.Struct('<4sHII')
+DIR = struct.Struct('<IIqI')
+ENTRY = struct.Struct('<IIIIIIIq')
+MISSING = -1
+
+ROOTS = (('applications', '.desktop'), ('desktop-directories', '.directory'))
+
+def getIndexPath():
+    return os.path.join(config.localstatedir, 'cache', 'alacarte', 'system.index')
+
+def getMtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return MISSING
+
+def encode(string):
+    return string.encode(DesktopFile.ENCODING, DesktopFile.ERRORS)
+
+def decode(data):
+    return data.decode(DesktopFile.ENCODING, DesktopFile.ERRORS)
+
+def scanRoots(data_dirs):
+    # returns the dirs as (path, mtime, root) and the entries as
+    # (root, file id, path, keys, mtime)
+    roots = []
+    dirs = []
+    entries = []
+    for data_dir in data_dirs:
+        for subdir, extension in ROOTS:
+            root = os.path.normpath(os.path.join(data_dir, subdir))
+            if root in roots:
+                continue
+            root_index = len(roots)
+            roots.append(root)
+            #the mtimes are taken first, changes made during the scan leave
+            #the root stale
+            dirs.append((root, getMtime(root), root_index))
+            for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+                if dirpath != root:
+                    dirs.append((dirpath, getMtime(dirpath), root_index))
+            for file_id, file_path in xdg.scanFileIds(root, extension).items():
+                try:
+                    mtime = os.stat(file_path).st_mtime_ns
+                    values = DesktopFile.readGroup(DesktopFile.readLines(file_path))
+                except OSError:
+                    continue
+                keys = ''.join('%s=%s\n' % item for item in values.items())
+                entries.append((root_index, encode(file_id), encode(file_path), encode(keys), mtime))
+    entries.sort(key=lambda entry: (entry[0], entry[1]))
+    return dirs, entries
+
+def pack(dirs, entries):
+    strings = bytearray()
+    base = HEADER.size + len(dirs) * DIR.size + len(entries) * ENTRY.size
+    def add(data):
+        offset = base + len(strings)
+        strings.extend(data)
+        return offset, len(data)
+
+    chunks = [HEADER.pack(MAGIC, VERSION, len(dirs), len(entries))]
+    for path, mtime, root in dirs:
+        chunks.append(DIR.pack(*(add(encode(path)) + (mtime, root))))
+    for root, file_id, path, keys, mtime in entries:
+        chunks.append(ENTRY.pack(*((root,) + add(file_id) + add(path) + add(keys) + (mtime,))))
+    chunks.append(bytes(strings))
+    return chunks
+
+def build(path=None, data_dirs=None):
+    path = path or getIndexPath()
+    dirs, entries = scanRoots(data_dirs or xdg.getDataDirs())
+    chunks = pack(dirs, entries)
+
+    dirname, basename = os.path.split(path)
+    os.makedirs(dirname, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + basename + '.', dir=dirname)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.writelines(chunks)
+            f.flush()
+            #everybody reads it
+            os.fchmod(f.fileno(), 0o644)
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+    return len(dirs), len(entries)
+
+class SystemIndex(object):
+    def __init__(self, path=None):
+        self.path = path or getIndexPath()
+        self.mm = None
+        self.load()
+
+    def load(self):
+        if self.mm is not None:
+            self.mm.close()
+        self.mm = None
+        self.stat = None
+        self.roots = {}
+        self.dirs = []
+        self.fresh = {}
+        self.entries = 0
+        self.count = 0
+        try:
+            with open(self.path, 'rb') as f:
+                self.stat = os.fstat(f.fileno())
+                self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+        try:
+            self.readHeader()
+        except (struct.error, ValueError, IndexError):
+            #as good as no index
+            self.mm.close()
+            self.mm = None
+            self.roots = {}
+            self.dirs = []
+            self.count = 0
+
+    def readHeader(self):
+        mm = self.mm
+        magic, version, dir_count, count = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("not a system index")
+        pos = HEADER.size
+        for i in range(dir_count):
+            offset, length, mtime, root = DIR.unpack_from(mm, pos)
+            pos += DIR.size
+            path = decode(mm[offset:offset + length])
+            if root == len(self.dirs):
+                self.roots[path] = root
+                self.dirs.append([])
+            self.dirs[root].append((path, mtime))
+        if pos + count * ENTRY.size > len(mm):
+            raise ValueError("truncated system index")
+        self.entries = pos
+        self.count = count
+
+    def refresh(self):
+        # called when files changed, freshness is checked again and a
+        # rebuilt index is mapped in place of the old one
+        self.fresh = {}
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            stat = None
+        if stat is None or self.stat is None or (stat.st_ino, stat.st_mtime_ns) != (self.stat.st_ino, self.stat.st_mtime_ns):
+            self.load()
+
+    def getRoot(self, root):
+        # the number of root if it is indexed and up to date, else None
+        index = self.roots.get(os.path.normpath(root))
+        if index is None:
+            return None
+        fresh = self.fresh.get(index)
+        if fresh is None:
+            fresh = self.fresh[index] = all(getMtime(path) == mtime for path, mtime in self.dirs[index])
+        return index if fresh else None
+
+    def isFresh(self, root):
+        return self.getRoot(root) is not None
+
+    def readEntry(self, i):
+        return ENTRY.unpack_from(self.mm, self.entries + i * ENTRY.size)
+
+    def getString(self, offset, length):
+        return self.mm[offset:offset + length]
+
+    def bisect(self, root, file_id):
+        # the first entry not before (root, file_id)
+        lo = 0
+        hi = self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = self.readEntry(mid)
+            if (entry[0], self.getString(entry[1], entry[2])) < (root, file_id):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def findEntry(self, root, file_id):
+        index = self.getRoot(root)
+        if index is None:
+            return None
+        file_id = encode(file_id)
+        i = self.bisect(index, file_id)
+        if i < self.count:
+            entry = self.readEntry(i)
+            if entry[0] == index and self.getString(entry[1], entry[2]) == file_id:
+                return entry
+        return None
+
+    def lookup(self, root, file_id):
+        # the path of file_id in root, for a root that isFresh
+        entry = self.findEntry(root, file_id)
+        if entry is None:
+            return None
+        return decode(self.getString(entry[3], entry[4]))
+
+    def listFileIds(self, root):
+        # file id -> path of a root that isFresh, like xdg.scanFileIds
+        index = self.getRoot(root)
+        file_ids = {}
+        if index is None:
+            return file_ids
+        for i in range(self.bisect(index, b''), self.count):
+            entry = self.readEntry(i)
+            if entry[0] != index:
+                break
+            file_ids[decode(self.getString(entry[1], entry[2]))] = decode(self.getString(entry[3], entry[4]))
+        return file_ids
+
+    def getValues(self, file_path):
+        # the raw Desktop Entry keys of file_path like DesktopFile.parse, or
+        # None if it isn't indexed or changed since
+        file_path = os.path.normpath(file_path)
+        dirname = os.path.dirname(file_path)
+        while dirname not in self.roots:
+            parent = os.path.dirname(dirname)
+            if parent == dirname:
+                return None
+            dirname = parent
+        file_id = os.path.relpath(file_path, dirname).replace(os.sep, '-')
+        entry = self.findEntry(dirname, file_id)
+        if entry is None or self.getString(entry[3], entry[4]) != encode(file_path):
+            return None
+        if getMtime(file_path) != entry[7]:
+            return None
+        values = {}
+        for line in decode(self.getString(entry[5], entry[6])).splitlines():
+            key, sep, value = line.partition('=')
+            values[key] = value
+        return values
+
+default = None
+
+def getDefault():
+    global default
+    if default is None:
+        default = SystemIndex()
+    return default
+
+def refresh():
+    if default is not None:
+        default.refresh()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Index the applications and menu directories of the system data dirs.')
+    parser.add_argument('--output', help='where to write the index (default: %s)' % (getIndexPath(),))
+    parser.add_argument('--data-dirs', help='data dirs to index, separated by colons (default: $XDG_DATA_DIRS)')
+    args = parser.parse_args(argv)
+
+    data_dirs = None
+    if args.data_dirs:
+        data_dirs = [path for path in args.data_dirs.split(os.pathsep) if path]
+    try:
+        dir_count, count = build(args.output, data_dirs)
+    except OSError as e:
+        sys.stderr.write('can not write the index: %s\n' % (e,))
+        return 1
+    sys.stdout.write('indexed %d files in %d directories\n' % (count, dir_count))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,582 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Menu templates for many users. A template is a JSON file with the edits
+# to make to the system menu, in order:
+#
+#   {"menu": "applications.menu",
+#    "actions": [
+#      {"action": "hide", "menu": "Office", "item": "writer.desktop"},
+#      {"action": "show", "menu": "Office", "item": "calc.desktop"},
+#      {"action": "delete", "menu": "Games", "item": "mines.desktop"},
+#      {"action": "hide-menu", "menu": "Games"},
+#      {"action": "show-menu", "menu": "Office"},
+#      {"action": "delete-menu", "menu": "Games"},
+#      {"action": "move", "menu": "Office", "item": "calc.desktop", "before": "writer.desktop"}]}
+#
+# "menu" of an action is the path of menu ids from the root, "" for the
+# root, and "before"/"after" of a move name an item or menu of the same
+# menu. Each action makes the user .menu and override files the matching
+# MenuEditor call (setVisible, deleteItem, deleteMenu, moveItem) makes on
+# a home without customizations, byte for byte.
+#
+# The template is compiled once, against the system menu resolved with
+# MenuResolver, into the text of the user .menu and the contents of the
+# override files. Writing it into a home only puts in the home's paths,
+# there is no GMenu load or DOM per user.
+#
+#   python3 -m Alacarte.Template SPEC [HOME ...] [--jobs N]
+#
+# writes the result into the given home dirs (the current user if none),
+# replacing their user menu, in worker processes. Run as root, each home
+# is written by a child process running as the owner of the home.
+#
+#   python3 -m Alacarte.Template --verify SPEC
+#
+# runs the same edits through MenuEditor in a scratch home and compares
+# the files with what the template writes; it needs GLib and GMenu.
+
+import argparse
+import collections
+import json
+import multiprocessing
+import os
+import pwd
+import shutil
+import subprocess
+import sys
+import tempfile
+import xml.dom.minidom
+from Alacarte import xdg, DesktopFile, FileOps, MenuResolver
+
+ACTIONS = ('hide', 'show', 'hide-menu', 'show-menu', 'delete', 'delete-menu', 'move')
+
+# stands for the data home of the user in the compiled menu
+DATA_HOME = '\0'
+
+Template = collections.namedtuple('Template', 'basename menu files')
+
+class TemplateError(Exception):
+    pass
+
+# The writer. It writes what minidom's toprettyxml() writes for the same
+# tree; the escaping is minidom's own, which differs between Python
+# versions.
+
+XML_HEADER = '<?xml version="1.0" ?>\n'
+
+escape_document = xml.dom.minidom.Document()
+text_escapes = {}
+attr_escapes = {}
+
+def escapeText(text):
+    if text not in text_escapes:
+        text_escapes[text] = escape_document.createTextNode(text).toxml()
+    return text_escapes[text]
+
+def escapeAttr(value):
+    if value not in attr_escapes:
+        element = escape_document.createElement('a')
+        element.setAttribute('v', value)
+        attr_escapes[value] = element.toxml()[len('<a v="'):-len('"/>')]
+    return attr_escapes[value]
+
+def getDoctype():
+    dom = xml.dom.minidom.parseString(xdg.MENU_DOCTYPE + '<Menu/>')
+    text = dom.toprettyxml()
+    dom.unlink()
+    return text[len(XML_HEADER):text.index('<Menu/>')]
+
+class Element(object):
+    __slots__ = ('name', 'text', 'attrs', 'children')
+
+    def __init__(self, name, text=None, attrs=(), children=()):
+        self.name = name
+        self.text = text
+        self.attrs = list(attrs)
+        self.children = list(children)
+
+def writeElement(out, element, indent):
+    out.append(indent + '<' + element.name)
+    for name, value in element.attrs:
+        out.append(' %s="%s"' % (name, escapeAttr(value)))
+    if element.text is not None:
+        out.append('>%s</%s>\n' % (escapeText(element.text), element.name))
+    elif element.children:
+        out.append('>\n')
+        for child in element.children:
+            writeElement(out, child, indent + '\t')
+        out.append('%s</%s>\n' % (indent, element.name))
+    else:
+        out.append('/>\n')
+
+def writeDocument(root):
+    out = [XML_HEADER, getDoctype()]
+    writeElement(out, root, '')
+    return ''.join(out)
+
+# The edits, as MenuEditor makes them on its DOM.
+
+def getMenuElement(root, path):
+    # getXmlMenu
+    element = root
+    for name in path:
+        for child in element.children:
+            if child.name == 'Menu' and any(node.name == 'Name' and node.text == name for node in child.children):
+                element = child
+                break
+        else:
+            child = Element('Menu', children=[Element('Name', name)])
+            element.children.append(child)
+            element = child
+    return element
+
+def addTextElement(element, name, text):
+    # addXmlTextElement
+    for child in element.children:
+        if child.name == name and child.text == text:
+            return
+    element.children.append(Element(name, text))
+
+def addFilename(element, file_id, kind):
+    # addXmlFilename
+    element.children = [child for child in element.children
+                        if not (child.name in ('Include', 'Exclude') and child.children
+                                and child.children[0].name == 'Filename' and child.children[0].text == file_id)]
+    element.children.append(Element(kind, children=[Element('Filename', file_id)]))
+
+def setLayout(element, layout):
+    # addXmlLayout
+    element.children = [child for child in element.children if child.name != 'Layout']
+    node = Element('Layout')
+    for order in layout:
+        if order[0] == 'Separator':
+            node.children.append(Element('Separator'))
+        elif order[0] in ('Filename', 'Menuname'):
+            addTextElement(node, order[0], order[1])
+        elif order[0] == 'Merge':
+            node.children.append(Element('Merge', attrs=[('type', order[1])]))
+    element.children.append(node)
+
+def getItemKey(item):
+    if isinstance(item, MenuResolver.Directory):
+        return ('Menu', item.menu_id)
+    elif isinstance(item, MenuResolver.Entry):
+        return ('Item', item.desktop_file_id)
+    return ('Separator', item.parent, item.index)
+
+def createLayout(items):
+    layout = [('Merge', 'menus')]
+    for item in items:
+        if isinstance(item, MenuResolver.Directory):
+            layout.append(('Menuname', item.menu_id))
+        elif isinstance(item, MenuResolver.Entry):
+            layout.append(('Filename', item.desktop_file_id))
+        else:
+            layout.append(('Separator',))
+    layout.append(('Merge', 'files'))
+    return layout
+
+def getSystemMenuPath(basename):
+    for path in xdg.getConfigDirs():
+        file_path = os.path.join(path, 'menus', basename)
+        if os.path.isfile(file_path):
+            return file_path
+    return None
+
+def writeFile(path, contents):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    FileOps.writeFile(path, contents)
+
+# Compiles a template in a scratch home: the edits so far are written
+# there so the system menu can be resolved again with them, like the
+# GMenu tree is reloaded after every edit in the editor.
+class Compiler(object):
+    def __init__(self, basename, scratch):
+        self.basename = basename
+        self.home = scratch
+        self.data_home = xdg.getDataHome(scratch)
+        self.menu_path = os.path.join(xdg.getConfigHome(scratch), 'menus', basename)
+        self.files = {}
+        self.saved = False
+        self.tree = None
+
+        system_path = getSystemMenuPath(basename)
+        if system_path is None:
+            raise TemplateError("can not find the system menu %r" % (basename,))
+        #the user menu MenuEditor starts from, see util.getUserMenuXml
+        root = self.getTree().getRoot()
+        self.root = Element('Menu', children=[Element('Name', root.menu_id),
+                                              Element('MergeFile', system_path, [('type', 'parent')])])
+
+    def getTree(self):
+        if self.tree is None:
+            tree = MenuResolver.MenuTree(self.basename, self.home)
+            try:
+                tree.load()
+            except ValueError as e:
+                raise TemplateError(str(e))
+            self.tree = tree
+        return self.tree
+
+    def changed(self):
+        if self.saved:
+            writeFile(self.menu_path, writeDocument(self.root))
+        self.tree = None
+
+    def save(self):
+        self.saved = True
+
+    def patch(self, src_path, subdir, file_id, items):
+        # writeItem/writeMenu of an existing file
+        relative = os.path.join(subdir, file_id)
+        lines = DesktopFile.patchLines(DesktopFile.readLines(src_path), DesktopFile.formatItems(items))
+        contents = ''.join(lines)
+        self.files[relative] = contents
+        writeFile(os.path.join(self.data_home, relative), contents)
+
+    def findMenu(self, path):
+        menu = self.getTree().getRoot()
+        for menu_id in [name for name in (path or '').split('/') if name]:
+            for item in menu.contents:
+                if isinstance(item, MenuResolver.Directory) and item.menu_id == menu_id:
+                    menu = item
+                    break
+            else:
+                raise TemplateError("no menu %r" % (path,))
+        return menu
+
+    def findItem(self, menu, item_id):
+        for item in menu.contents:
+            if isinstance(item, MenuResolver.Entry) and item.desktop_file_id == item_id:
+                return item
+            if isinstance(item, MenuResolver.Directory) and item.menu_id == item_id:
+                return item
+        raise TemplateError("no item %r in menu %r" % (item_id, '/'.join(menu.path)))
+
+    def apply(self, action):
+        kind = action.get('action')
+        if kind not in ACTIONS:
+            raise TemplateError("unknown action %r" % (kind,))
+        menu = self.findMenu(action.get('menu'))
+        if kind in ('hide', 'show'):
+            self.setItemVisible(self.findItem(menu, action.get('item')), kind == 'show')
+        elif kind in ('hide-menu', 'show-menu'):
+            self.setMenuVisible(menu, kind == 'show-menu')
+        elif kind == 'delete':
+            self.deleteItem(self.findItem(menu, action.get('item')))
+        elif kind == 'delete-menu':
+            self.deleteMenu(menu)
+        elif kind == 'move':
+            item = self.findItem(menu, action.get('item'))
+            before = self.findItem(menu, action['before']) if action.get('before') else None
+            after = self.findItem(menu, action['after']) if action.get('after') else None
+            self.moveItem(menu, item, before, after)
+        self.changed()
+
+    def setItemVisible(self, item, visible):
+        if not isinstance(item, MenuResolver.Entry):
+            raise TemplateError("%r is not a launcher" % (item.menu_id,))
+        menu_xml = getMenuElement(self.root, item.parent)
+        if visible:
+            addFilename(menu_xml, item.desktop_file_id, 'Include')
+            self.patch(item.desktop_file_path, 'applications', item.desktop_file_id, dict(NoDisplay=False))
+        else:
+            addFilename(menu_xml, item.desktop_file_id, 'Exclude')
+        addTextElement(menu_xml, 'AppDir', os.path.join(self.data_home, 'applications'))
+        self.save()
+
+    def setMenuVisible(self, menu, visible):
+        #don't mess with it if it's empty
+        if not menu.contents:
+            return
+        if menu.desktop_file_path is None:
+            raise TemplateError("menu %r has no .directory file" % ('/'.join(menu.path),))
+        menu_xml = getMenuElement(self.root, menu.path)
+        menu_xml.children = [child for child in menu_xml.children if child.name not in ('Deleted', 'NotDeleted')]
+        self.patch(menu.desktop_file_path, 'desktop-directories', os.path.basename(menu.desktop_file_path),
+                   dict(NoDisplay=not visible))
+        addTextElement(menu_xml, 'DirectoryDir', os.path.join(self.data_home, 'desktop-directories'))
+        self.save()
+
+    def deleteItem(self, item):
+        if not isinstance(item, MenuResolver.Entry):
+            raise TemplateError("%r is not a launcher" % (item.menu_id,))
+        self.patch(item.desktop_file_path, 'applications', item.desktop_file_id, dict(Hidden=True))
+        self.save()
+
+    def deleteMenu(self, menu):
+        getMenuElement(self.root, menu.path).children.append(Element('Deleted'))
+        self.save()
+
+    def moveItem(self, parent, item, before=None, after=None):
+        # positionItem
+        contents = list(parent.contents)
+        keys = [getItemKey(child) for child in contents]
+        key = getItemKey(item)
+        if after:
+            index = keys.index(getItemKey(after)) + 1
+        elif before:
+            index = keys.index(getItemKey(before))
+        else:
+            index = len(contents)
+        if key in keys:
+            if (before and (keys.index(key) < index)) \
+                    or (after and (keys.index(key) < index - 1)):
+                index -= 1
+            del contents[keys.index(key)]
+        contents.insert(index, item)
+        setLayout(getMenuElement(self.root, parent.path), createLayout(contents))
+        self.save()
+
+    def getTemplate(self):
+        menu = writeDocument(self.root) if self.saved else None
+        if menu is not None:
+            #the paths in the scratch home become the ones of each user
+            menu = menu.replace(escapeText(self.data_home), DATA_HOME)
+        return Template(self.basename, menu, dict(self.files))
+
+def loadSpec(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            spec = json.load(f)
+    except (OSError, ValueError) as e:
+        raise TemplateError("can not read %s: %s" % (path, e))
+    if not isinstance(spec, dict) or not isinstance(spec.get('actions', []), list):
+        raise TemplateError("%s is not a menu template" % (path,))
+    return spec
+
+def compileSpec(spec, basename=None):
+    basename = basename or spec.get('menu') or xdg.getDefaultMenu()
+    scratch = tempfile.mkdtemp(prefix='alacarte-template-')
+    try:
+        compiler = Compiler(basename, scratch)
+        for action in spec.get('actions', []):
+            compiler.apply(action)
+        return compiler.getTemplate()
+    finally:
+        shutil.rmtree(scratch)
+
+def renderHome(template, home=None):
+    data_home = xdg.getDataHome(home)
+    paths = []
+    if template.menu is not None:
+        path = os.path.join(xdg.getConfigHome(home), 'menus', template.basename)
+        writeFile(path, template.menu.replace(DATA_HOME, escapeText(data_home)))
+        paths.append(path)
+    for relative, contents in sorted(template.files.items()):
+        path = os.path.join(data_home, relative)
+        writeFile(path, contents)
+        paths.append(path)
+    return len(paths)
+
+def dropPrivileges(uid, gid):
+    try:
+        groups = os.getgrouplist(pwd.getpwuid(uid).pw_name, gid)
+    except KeyError:
+        groups = [gid]
+    os.setgroups(groups)
+    os.setgid(gid)
+    os.setuid(uid)
+
+def renderHomeAsOwner(template, home):
+    # root doesn't touch anything in the home itself: the dirs in it are
+    # the user's, and a link there could send root's writes anywhere. A
+    # child running as the owner writes the files, they are the user's
+    # from the start
+    st = os.stat(home)
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        status = 1
+        try:
+            os.close(read_fd)
+            try:
+                dropPrivileges(st.st_uid, st.st_gid)
+                reply = [renderHome(template, home), None]
+            except Exception as e:
+                reply = [0, str(e)]
+            os.write(write_fd, json.dumps(reply).encode('utf-8'))
+            status = 0
+        finally:
+            os._exit(status)
+    os.close(write_fd)
+    with os.fdopen(read_fd, 'rb') as f:
+        data = f.read()
+    os.waitpid(pid, 0)
+    try:
+        count, error = json.loads(data.decode('utf-8'))
+    except ValueError:
+        raise OSError("the writer process failed")
+    if error is not None:
+        raise OSError(error)
+    return count
+
+shared_template = None
+
+def setTemplate(template):
+    global shared_template
+    shared_template = template
+
+def renderHomeArgs(home):
+    try:
+        if home is not None and os.geteuid() == 0:
+            return home, renderHomeAsOwner(shared_template, home), None
+        return home, renderHome(shared_template, home), None
+    except OSError as e:
+        return home, 0, str(e)
+
+def renderHomes(template, homes, processes=None):
+    # (home, files written, error) for every home
+    if len(homes) < 2 or processes == 1:
+        setTemplate(template)
+        return [renderHomeArgs(home) for home in homes]
+    #the template goes to every worker once, not with every home
+    pool = multiprocessing.Pool(processes, setTemplate, (template,))
+    try:
+        return pool.map(renderHomeArgs, homes, chunksize=16)
+    finally:
+        pool.close()
+        pool.join()
+
+# Verification against MenuEditor.
+
+def replay(spec, basename=None):
+    # makes the edits of spec with MenuEditor, in the home of the
+    # environment; GLib reads the XDG dirs once, so this runs in its own
+    # process
+    from gi.repository import GMenu
+    from Alacarte.MenuEditor import MenuEditor
+
+    editor = MenuEditor(basename or spec.get('menu'))
+    def findMenu(path):
+        menu = editor.getRoot()
+        for menu_id in [name for name in (path or '').split('/') if name]:
+            for item in editor.getContents(menu):
+                if isinstance(item, GMenu.TreeDirectory) and item.get_menu_id() == menu_id:
+                    menu = item
+                    break
+            else:
+                raise TemplateError("no menu %r" % (path,))
+        return menu
+    def findItem(menu, item_id):
+        for item in editor.getContents(menu):
+            if isinstance(item, GMenu.TreeEntry) and item.get_desktop_file_id() == item_id:
+                return item
+            if isinstance(item, GMenu.TreeDirectory) and item.get_menu_id() == item_id:
+                return item
+        raise TemplateError("no item %r" % (item_id,))
+
+    for action in spec.get('actions', []):
+        kind = action.get('action')
+        menu = findMenu(action.get('menu'))
+        if kind in ('hide', 'show'):
+            editor.setVisible(findItem(menu, action.get('item')), kind == 'show')
+        elif kind in ('hide-menu', 'show-menu'):
+            editor.setVisible(menu, kind == 'show-menu')
+        elif kind == 'delete':
+            editor.deleteItem(findItem(menu, action.get('item')))
+        elif kind == 'delete-menu':
+            editor.deleteMenu(menu)
+        elif kind == 'move':
+            before = findItem(menu, action['before']) if action.get('before') else None
+            after = findItem(menu, action['after']) if action.get('after') else None
+            editor.moveItem(menu, findItem(menu, action.get('item')), before, after)
+        else:
+            raise TemplateError("unknown action %r" % (kind,))
+        editor.writer.flush()
+        #as the window would after the change notification
+        editor.load()
+
+def collectFiles(home, basename):
+    files = {}
+    menu_path = os.path.join(xdg.getConfigHome(home), 'menus', basename)
+    if os.path.isfile(menu_path):
+        with open(menu_path, 'rb') as f:
+            files[os.path.relpath(menu_path, home)] = f.read()
+    data_home = xdg.getDataHome(home)
+    for subdir in ('applications', 'desktop-directories'):
+        for dirpath, dirnames, filenames in os.walk(os.path.join(data_home, subdir)):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                with open(path, 'rb') as f:
+                    files[os.path.relpath(path, home)] = f.read()
+    return files
+
+def verify(spec_path, basename=None, out=sys.stdout):
+    # returns the paths that differ between MenuEditor and the template
+    spec = loadSpec(spec_path)
+    basename = basename or spec.get('menu') or xdg.getDefaultMenu()
+    home = tempfile.mkdtemp(prefix='alacarte-verify-')
+    try:
+        env = dict(os.environ, HOME=home,
+                   XDG_CONFIG_HOME=xdg.getConfigHome(home), XDG_DATA_HOME=xdg.getDataHome(home))
+        command = [sys.executable, '-m', 'Alacarte.Template', '--replay', '--menu', basename, spec_path]
+        subprocess.check_call(command, env=env)
+        expected = collectFiles(home, basename)
+
+        shutil.rmtree(home)
+        os.mkdir(home)
+        renderHome(compileSpec(spec, basename), home)
+        actual = collectFiles(home, basename)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+
+    different = sorted(path for path in set(expected) | set(actual) if expected.get(path) != actual.get(path))
+    for path in different:
+        if path not in actual:
+            out.write('missing %s\n' % (path,))
+        elif path not in expected:
+            out.write('extra %s\n' % (path,))
+        else:
+            out.write('differs %s\n' % (path,))
+    return different
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a menu template into home directories.')
+    parser.add_argument('spec', help='JSON file with the edits')
+    parser.add_argument('homes', nargs='*', help='home directories to write to, the current user if none')
+    parser.add_argument('--menu', help='menu basename, e.g. applications.menu')
+    parser.add_argument('--jobs', type=int, help='number of worker processes')
+    parser.add_argument('--verify', action='store_true', help='compare the output with what MenuEditor writes')
+    parser.add_argument('--replay', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    try:
+        if args.replay:
+            replay(loadSpec(args.spec), args.menu)
+            return 0
+        if args.verify:
+            different = verify(args.spec, args.menu)
+            if different:
+                return 1
+            sys.stdout.write('ok  the template writes what MenuEditor writes\n')
+            return 0
+        template = compileSpec(loadSpec(args.spec), args.menu)
+    except TemplateError as e:
+        sys.stderr.write('alacarte: %s\n' % (e,))
+        return 1
+
+    failed = 0
+    for home, count, error in renderHomes(template, args.homes or [None], args.jobs):
+        if error is not None:
+            sys.stderr.write('alacarte: can not write to %s: %s\n' % (home or '~', error))
+            failed += 1
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import os
+
+PENDING = object()
+
+def getStamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+# Remembers the files this process wrote or removed, so that a change
+# notification caused only by our own writes can be told apart from one
+# caused by somebody else.
+class WriteTracker(object):
+    def __init__(self):
+        self.writes = {}
+
+    def record(self, path):
+        self.writes[path] = getStamp(path)
+
+    def recordStamp(self, path, stamp):
+        self.writes[path] = stamp
+
+    def recordPending(self, path):
+        #the write is queued but not done yet, whatever happens to the
+        #file until then is ours
+        self.writes[path] = PENDING
+
+    def isOwnChange(self):
+        if not self.writes:
+            return False
+        for path, stamp in self.writes.items():
+            if stamp is not PENDING and getStamp(path) != stamp:
+                return False
+        return True
+
+    def consume(self):
+        own = self.isOwnChange()
+        self.writes.clear()
+        return own
@@ -17,16 +17,35 @@
 #   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
 import os
-import xml.dom.minidom
 from collections import Sequence
 
 import gi
 gi.require_version('Gtk', '3.0')
-from gi.repository import Gtk, GdkPixbuf, GMenu, GLib
+from gi.repository import Gtk, Gdk, GdkPixbuf, GMenu, GLib, Gio
+from Alacarte.xdg import removeWhitespaceNodes, MENU_DOCTYPE
+from Alacarte import config, IconCache, SystemIndex
 
 DESKTOP_GROUP = GLib.KEY_FILE_DESKTOP_GROUP
 KEY_FILE_FLAGS = GLib.KeyFileFlags.KEEP_COMMENTS | GLib.KeyFileFlags.KEEP_TRANSLATIONS
 
+RESOURCE_PATH = '/org/gnome/alacarte/'
+resource = None
+
+def loadResource():
+    # the .ui files are compiled into one bundle, mapped once per process
+    global resource
+    if resource is None:
+        resource = Gio.Resource.load(os.path.join(config.pkgdatadir, 'alacarte.gresource'))
+        resource._register()
+    return resource
+
+def newBuilder(ui_file):
+    loadResource()
+    builder = Gtk.Builder()
+    builder.set_translation_domain(config.GETTEXT_PACKAGE)
+    builder.add_from_resource(RESOURCE_PATH + ui_file)
+    return builder
+
 def fillKeyFile(keyfile, items):
     for key, item in items.items():
         if item is None:
@@ -39,7 +58,7 @@ def fillKeyFile(keyfile, items):
         elif isinstance(item, Sequence):
             keyfile.set_string_list(DESKTOP_GROUP, key, item)
 
-def getUniqueFileId(name, extension):
+def getUniqueFileId(name, extension, is_pending=None):
     append = 0
     while 1:
         if append == 0:
@@ -47,13 +66,15 @@ def getUniqueFileId(name, extension):
         else:
             filename = name + '-' + str(append) + extension
         if extension == '.desktop':
-            path = getUserItemPath()
-            if not os.path.isfile(os.path.join(path, filename)) and not getItemPath(filename):
-                break
+            path = os.path.join(getUserItemPath(), filename)
+            if not os.path.isfile(path) and not getItemPath(filename):
+                if is_pending is None or not is_pending(path):
+                    break
         elif extension == '.directory':
-            path = getUserDirectoryPath()
-            if not os.path.isfile(os.path.join(path, filename)) and not getDirectoryPath(filename):
-                break
+            path = os.path.join(getUserDirectoryPath(), filename)
+            if not os.path.isfile(path) and not getDirectoryPath(filename):
+                if is_pending is None or not is_pending(path):
+                    break
         append += 1
     return filename
 
@@ -84,13 +105,48 @@ def getUniqueUndoFile(filepath):
             append += 1
     return new_filepath
 
-def getItemPath(file_id):
+def getSystemFilePath(subdir, file_id):
+    index = SystemIndex.getDefault()
     for path in GLib.get_system_data_dirs():
-        file_path = os.path.join(path, 'applications', file_id)
+        root = os.path.join(path, subdir)
+        if index.isFresh(root):
+            #only the files right in root, like below
+            file_path = index.lookup(root, file_id)
+            if file_path is not None and os.path.dirname(file_path) == os.path.normpath(root):
+                return file_path
+            continue
+        file_path = os.path.join(root, file_id)
         if os.path.isfile(file_path):
             return file_path
     return None
 
+def getItemPath(file_id):
+    return getSystemFilePath('applications', file_id)
+
+def listFileIds(path, extension):
+    file_ids = set()
+    try:
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.name.endswith(extension) and entry.is_file():
+                    file_ids.add(entry.name)
+    except OSError:
+        pass
+    return file_ids
+
+def getSystemFileIds(subdir, extension):
+    index = SystemIndex.getDefault()
+    file_ids = set()
+    for path in GLib.get_system_data_dirs():
+        root = os.path.join(path, subdir)
+        if index.isFresh(root):
+            root = os.path.normpath(root)
+            file_ids.update(file_id for file_id, file_path in index.listFileIds(root).items()
+                            if file_id.endswith(extension) and os.path.dirname(file_path) == root)
+        else:
+            file_ids.update(listFileIds(root, extension))
+    return file_ids
+
 def getUserItemPath():
     item_dir = os.path.join(GLib.get_user_data_dir(), 'applications')
     if not os.path.isdir(item_dir):
@@ -98,11 +154,7 @@ def getUserItemPath():
     return item_dir
 
 def getDirectoryPath(file_id):
-    for path in GLib.get_system_data_dirs():
-        file_path = os.path.join(path, 'desktop-directories', file_id)
-        if os.path.isfile(file_path):
-            return file_path
-    return None
+    return getSystemFilePath('desktop-directories', file_id)
 
 def getUserDirectoryPath():
     menu_dir = os.path.join(GLib.get_user_data_dir(), 'desktop-directories')
@@ -123,52 +175,74 @@ def getSystemMenuPath(file_id):
             return file_path
     return None
 
+def getMenuBasenames():
+    # the menus that can be edited
+    basenames = []
+    for path in GLib.get_system_config_dirs():
+        for file_id in sorted(listFileIds(os.path.join(path, 'menus'), '.menu')):
+            if file_id not in basenames:
+                basenames.append(file_id)
+    return basenames
+
 def getUserMenuXml(tree):
     system_file = getSystemMenuPath(os.path.basename(tree.get_canonical_menu_path()))
     name = tree.get_root_directory().get_menu_id()
-    menu_xml = "<!DOCTYPE Menu PUBLIC '-//freedesktop//DTD Menu 1.0//EN' 'http://standards.freedesktop.org/menu-spec/menu-1.0.dtd'>\n"
+    menu_xml = MENU_DOCTYPE
     menu_xml += "<Menu>\n  <Name>" + name + "</Name>\n  "
     menu_xml += "<MergeFile type=\"parent\">" + system_file +    "</MergeFile>\n</Menu>\n"
     return menu_xml
 
-def getIcon(item):
-    pixbuf = None
-    if item is None:
-        return None
+ICON_SIZE = 24
 
+def getItemGIcon(item):
     if isinstance(item, GMenu.TreeDirectory):
-        gicon = item.get_icon()
+        return item.get_icon()
     elif isinstance(item, GMenu.TreeEntry):
-        app_info = item.get_app_info()
-        gicon = app_info.get_icon()
-    else:
-        return None
-
-    if gicon is None:
-        return None
+        return item.get_app_info().get_icon()
+    return None
 
-    icon_theme = Gtk.IconTheme.get_default()
-    info = icon_theme.lookup_by_gicon(gicon, 24, 0)
-    if info is None:
-        return None
+def renderIcon(info, pixel_size, interp=GdkPixbuf.InterpType.BILINEAR):
     try:
         pixbuf = info.load_icon()
     except GLib.GError:
         return None
     if pixbuf is None:
         return None
-    if pixbuf.get_width() != 24 or pixbuf.get_height() != 24:
-        pixbuf = pixbuf.scale_simple(24, 24, GdkPixbuf.InterpType.HYPER)
+    if pixbuf.get_width() != pixel_size or pixbuf.get_height() != pixel_size:
+        pixbuf = pixbuf.scale_simple(pixel_size, pixel_size, interp)
+    return pixbuf
+
+def loadIcon(gicon, size, scale=1):
+    # asks the theme for the icon at the device pixel size, so SVGs are
+    # rendered at that size instead of being scaled afterwards
+    icon_theme = Gtk.IconTheme.get_default()
+    info = icon_theme.lookup_by_gicon_for_scale(gicon, size, scale, Gtk.IconLookupFlags.FORCE_SIZE)
+    if info is None:
+        return None
+
+    #icons that come from a file are cached scaled, by path and mtime
+    cache = IconCache.getCache(size, scale)
+    key = None
+    if info.get_filename():
+        key = IconCache.makeKey(info.get_filename(), Gtk.Settings.get_default().props.gtk_icon_theme_name)
+        if key is not None:
+            pixbuf = cache.lookup(key)
+            if pixbuf is not None:
+                return pixbuf
+
+    pixbuf = renderIcon(info, size * scale)
+    if pixbuf is not None and key is not None:
+        cache.insert(key, pixbuf)
     return pixbuf
 
-def removeWhitespaceNodes(node):
-    remove_list = []
-    for child in node.childNodes:
-        if child.nodeType == xml.dom.minidom.Node.TEXT_NODE:
-            child.data = child.data.strip()
-            if not child.data.strip():
-                remove_list.append(child)
-        elif child.hasChildNodes():
-            removeWhitespaceNodes(child)
-    for node in remove_list:
-        node.parentNode.removeChild(node)
+def getIcon(item, scale=1):
+    # returns a cairo surface at the device scale of the view
+    if item is None:
+        return None
+    gicon = getItemGIcon(item)
+    if gicon is None:
+        return None
+    pixbuf = loadIcon(gicon, ICON_SIZE, scale)
+    if pixbuf is None:
+        return None
+    return Gdk.cairo_surface_create_from_pixbuf(pixbuf, scale, None)
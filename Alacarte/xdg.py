@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# XDG base directory and menu file helpers that don't need GLib, for code
+# that runs in worker processes or on other users' home directories.
+
+import collections
+import os
+import tempfile
+import urllib.parse
+import xml.dom.minidom
+import xml.parsers.expat
+
+MENU_DOCTYPE = "<!DOCTYPE Menu PUBLIC '-//freedesktop//DTD Menu 1.0//EN' 'http://standards.freedesktop.org/menu-spec/menu-1.0.dtd'>\n"
+SHARD_PREFIX = 'alacarte-'
+
+def getDataHome(home=None):
+    if home is None:
+        return os.environ.get('XDG_DATA_HOME') or os.path.expanduser(os.path.join('~', '.local', 'share'))
+    return os.path.join(home, '.local', 'share')
+
+def getConfigHome(home=None):
+    if home is None:
+        return os.environ.get('XDG_CONFIG_HOME') or os.path.expanduser(os.path.join('~', '.config'))
+    return os.path.join(home, '.config')
+
+def getDataDirs():
+    dirs = os.environ.get('XDG_DATA_DIRS') or '/usr/local/share/:/usr/share/'
+    return [path for path in dirs.split(os.pathsep) if path]
+
+def getConfigDirs():
+    dirs = os.environ.get('XDG_CONFIG_DIRS') or '/etc/xdg'
+    return [path for path in dirs.split(os.pathsep) if path]
+
+def getDefaultMenu():
+    return os.environ.get('XDG_MENU_PREFIX', '') + 'applications.menu'
+
+def getRuntimeDir():
+    return os.environ.get('XDG_RUNTIME_DIR') or os.path.join(tempfile.gettempdir(), 'alacarte-%d' % os.getuid())
+
+def getSocketPath(basename=None):
+    return os.path.join(getRuntimeDir(), 'alacarte', (basename or getDefaultMenu()) + '.socket')
+
+def scanFileIds(path, extension, recursive=True):
+    # maps desktop file ids to paths, files in subdirectories get the
+    # subdirectory names as a prefix as the menu spec says
+    file_ids = {}
+    stack = [(path, '')]
+    while stack:
+        dir_path, prefix = stack.pop()
+        try:
+            with os.scandir(dir_path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            if recursive:
+                                stack.append((entry.path, prefix + entry.name + '-'))
+                            continue
+                    except OSError:
+                        continue
+                    if entry.name.endswith(extension):
+                        file_ids.setdefault(prefix + entry.name, entry.path)
+        except OSError:
+            pass
+    return file_ids
+
+def scanSystemFileIds(subdir, extension, recursive=True):
+    file_ids = {}
+    for path in getDataDirs():
+        for file_id, file_path in scanFileIds(os.path.join(path, subdir), extension, recursive).items():
+            file_ids.setdefault(file_id, file_path)
+    return file_ids
+
+def removeWhitespaceNodes(node):
+    remove_list = []
+    for child in node.childNodes:
+        if child.nodeType == xml.dom.minidom.Node.TEXT_NODE:
+            child.data = child.data.strip()
+            if not child.data.strip():
+                remove_list.append(child)
+        elif child.hasChildNodes():
+            removeWhitespaceNodes(child)
+    for node in remove_list:
+        node.parentNode.removeChild(node)
+
+def parseMenuFile(path):
+    dom = xml.dom.minidom.parse(path)
+    removeWhitespaceNodes(dom)
+    return dom
+
+def getText(node):
+    if node.firstChild is None:
+        return ''
+    return node.firstChild.nodeValue
+
+def getChildElements(element, names):
+    for child in element.childNodes:
+        if child.nodeType == child.ELEMENT_NODE and child.nodeName in names:
+            yield child
+
+def getMenuName(menu):
+    for name in getChildElements(menu, ('Name',)):
+        return getText(name)
+    return ''
+
+# In the sharded layout the customizations of each top-level submenu live
+# in their own file under <basename>-merged/, included from the user menu
+# with <MergeFile>, so a change only rewrites the files it touches.
+
+def getShardDir(basename):
+    return os.path.splitext(basename)[0] + '-merged'
+
+def getShardFile(basename, name):
+    return getShardDir(basename) + '/' + SHARD_PREFIX + urllib.parse.quote(name, safe='') + '.menu'
+
+def isShardFile(basename, path):
+    return path.startswith(getShardDir(basename) + '/' + SHARD_PREFIX)
+
+def listShardFiles(menu_dir, basename):
+    shard_dir = getShardDir(basename)
+    try:
+        names = os.listdir(os.path.join(menu_dir, shard_dir))
+    except OSError:
+        return []
+    return [shard_dir + '/' + name for name in sorted(names) if name.startswith(SHARD_PREFIX) and name.endswith('.menu')]
+
+def loadShards(dom, menu_dir, basename):
+    # replaces the <MergeFile>s of our shards with the <Menu>s they hold,
+    # returns the contents of the shard files by their relative path
+    shards = {}
+    root = dom.documentElement
+    for node in list(getChildElements(root, ('MergeFile',))):
+        path = getText(node)
+        if not isShardFile(basename, path):
+            continue
+        try:
+            with open(os.path.join(menu_dir, path), encoding='utf-8') as f:
+                contents = f.read()
+            shard = xml.dom.minidom.parseString(contents)
+        except (IOError, xml.parsers.expat.ExpatError):
+            shard = None
+        if shard is not None:
+            removeWhitespaceNodes(shard)
+            for child in list(getChildElements(shard.documentElement, ('Menu',))):
+                root.insertBefore(dom.importNode(child, True), node)
+            shards[path] = contents
+            shard.unlink()
+        root.removeChild(node)
+        node.unlink()
+    return shards
+
+def splitShards(dom, basename):
+    # serializes dom in the sharded layout, returns the contents of the
+    # user menu and of each shard file by its relative path
+    root = dom.documentElement
+    groups = collections.OrderedDict()
+    for node in getChildElements(root, ('Menu',)):
+        groups.setdefault(getShardFile(basename, getMenuName(node)), []).append(node)
+
+    name = getMenuName(root)
+    shards = {}
+    for path, nodes in groups.items():
+        shard = xml.dom.minidom.parseString(MENU_DOCTYPE + '<Menu><Name></Name></Menu>')
+        shard.documentElement.firstChild.appendChild(shard.createTextNode(name))
+        for node in nodes:
+            shard.documentElement.appendChild(shard.importNode(node, True))
+        shards[path] = shard.toprettyxml()
+        shard.unlink()
+
+    #swap the submenus for <MergeFile>s while serializing the user menu
+    placeholders = []
+    for path, nodes in groups.items():
+        merge = dom.createElement('MergeFile')
+        merge.appendChild(dom.createTextNode(path))
+        root.insertBefore(merge, nodes[0])
+        for node in nodes:
+            root.removeChild(node)
+        placeholders.append((merge, nodes))
+    try:
+        contents = dom.toprettyxml()
+    finally:
+        for merge, nodes in placeholders:
+            for node in nodes:
+                root.insertBefore(node, merge)
+            root.removeChild(merge)
+            merge.unlink()
+    return contents, shards
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# The soak test for memory use across menu reloads. It builds a synthetic
+# menu, then edits, reloads and refills a tree store like the main window
+# does, over and over.
+#
+#   python3 -m tests.MemorySoak [--cycles 2000] [--limit 1024]
+#
+# from the top of the source tree, after configure made Alacarte/config.py.
+# Exits with 1 if the memory after the warm up cycles grows by more than
+# --limit KiB or the number of gi wrappers keeps growing.
+
+import argparse
+import gc
+import shutil
+import sys
+import tempfile
+from Alacarte.MemoryStats import Sampler, countGiObjects, formatSize
+
+def collect():
+    gc.collect()
+    gc.collect()
+
+def soak(cycles, warmup, report_every, out):
+    # runs after the fixture is set up, GLib caches the XDG dirs
+    from gi.repository import GMenu, Gtk
+    from Alacarte.MenuEditor import MenuEditor
+
+    editor = MenuEditor()
+    store = Gtk.TreeStore(object, str, bool)
+    sampler = Sampler()
+
+    def fill(iters, parent=None):
+        for menu, show in editor.getMenus(parent):
+            iters[menu] = store.append(iters[parent], (menu, menu.get_name(), show))
+            fill(iters, menu)
+
+    def cycle(i):
+        #edit, reload the tree and the DOM, rebuild the views
+        menu = list(editor.getMenus(editor.getRoot()))[0][0]
+        entries = [item for item in editor.getContents(menu) if isinstance(item, GMenu.TreeEntry)]
+        editor.setVisible(entries[0], i % 2 == 1)
+        editor.load()
+        editor.loadDOM()
+        store.clear()
+        fill({ None: None })
+        for item, show in editor.getItems(menu):
+            pass
+
+    for i in range(warmup):
+        cycle(i)
+    collect()
+    sampler.markBaseline()
+    baseline, previous = sampler.sample('baseline', editor.dom)
+    gi_baseline = countGiObjects()
+    out.write(sampler.format(baseline) + '\n')
+
+    for i in range(warmup, warmup + cycles):
+        cycle(i)
+        if report_every and (i - warmup + 1) % report_every == 0:
+            collect()
+            sampler.report('cycle %d' % (i + 1,), editor.dom, out)
+    collect()
+    final, previous = sampler.sample('final', editor.dom)
+    out.write(sampler.format(final, baseline) + '\n')
+    gi_growth = countGiObjects() - gi_baseline
+    return baseline, final, gi_growth, sampler.topGrowth()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Reload a menu many times and check that memory use stays bounded.')
+    parser.add_argument('--cycles', type=int, default=2000, help='number of measured reload cycles')
+    parser.add_argument('--warmup', type=int, default=50, help='cycles to run before measuring')
+    parser.add_argument('--items', type=int, default=200, help='number of launchers in the fixture')
+    parser.add_argument('--menus', type=int, default=10, help='number of submenus in the fixture')
+    parser.add_argument('--limit', type=int, default=1024, help='allowed growth in KiB')
+    parser.add_argument('--report', type=int, default=500, help='print a sample every this many cycles')
+    args = parser.parse_args(argv)
+
+    from tools import OperationBudget
+    root = tempfile.mkdtemp(prefix='alacarte-soak-')
+    try:
+        OperationBudget.writeFixture(root, args.items, max(args.menus, 1))
+        baseline, final, gi_growth, top = soak(args.cycles, args.warmup, args.report, sys.stdout)
+    finally:
+        shutil.rmtree(root)
+
+    failed = False
+    growth = final.traced - baseline.traced
+    if growth > args.limit * 1024:
+        failed = True
+        sys.stdout.write('FAIL python memory grew by %s over %d cycles, allowed %d KiB\n' % (formatSize(growth), args.cycles, args.limit))
+        for stat in top:
+            sys.stdout.write('  %s\n' % (stat,))
+    #a few wrappers may come and go, a leak grows with the cycles
+    leaking = [(name, count) for name, count in gi_growth.items() if count > 10]
+    if leaking:
+        failed = True
+        sys.stdout.write('FAIL gi wrappers keep growing: %s\n' % (', '.join('%s +%d' % item for item in sorted(leaking)),))
+    if not failed:
+        sys.stdout.write('ok  python memory grew by %s over %d cycles\n' % (formatSize(growth), args.cycles))
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
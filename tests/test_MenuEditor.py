@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Drags menus around with MenuEditor.placeItem on the fixture menu of
+# tools/OperationBudget.py and checks the tree GMenu loads afterwards.
+#
+#   python3 -m unittest discover tests
+#
+# Needs GMenu; the tests are skipped without it. GLib reads the XDG dirs
+# once, so the edits are made in a child process.
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ITEMS = 12
+MENUS = 3
+
+TOP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+root = None
+
+def setUpModule():
+    global root
+    try:
+        import gi
+        gi.require_version('GMenu', '3.0')
+    except (ImportError, ValueError) as e:
+        raise unittest.SkipTest('GMenu is not available: %s' % (e,))
+    from tools import OperationBudget
+    root = tempfile.mkdtemp(prefix='alacarte-test-')
+    OperationBudget.writeFixture(root, ITEMS, MENUS)
+
+def tearDownModule():
+    if root is not None:
+        shutil.rmtree(root)
+
+def describe(editor, menu):
+    from gi.repository import GMenu
+    items = []
+    for item, visible in editor.getItems(menu):
+        if isinstance(item, GMenu.TreeDirectory):
+            items.append(describe(editor, item))
+        elif isinstance(item, GMenu.TreeEntry):
+            items.append([item.get_desktop_file_id(), visible])
+    return [menu.get_menu_id(), items]
+
+def moveMenus():
+    # moves Category0 into Category1, hides an item in it there, moves
+    # Category2 into it and then moves it back to the top; prints the
+    # tree and the menu names in the user menu
+    from gi.repository import GMenu
+    from Alacarte.MenuEditor import MenuEditor
+
+    editor = MenuEditor()
+    def find(*path):
+        menu = editor.getRoot()
+        for menu_id in path:
+            menu = [item for item in editor.getContents(menu)
+                    if isinstance(item, GMenu.TreeDirectory) and item.get_menu_id() == menu_id][0]
+        return menu
+    def step(func, *args):
+        func(*args)
+        editor.writer.flush()
+        editor.load()
+
+    step(editor.placeItem, find('Category0'), find('Category1'))
+    menu = find('Category1', 'Category0')
+    item = [item for item in editor.getContents(menu) if isinstance(item, GMenu.TreeEntry)][0]
+    step(editor.setVisible, item, False)
+    step(editor.placeItem, find('Category2'), find('Category1', 'Category0'))
+    step(editor.placeItem, find('Category1', 'Category0'), editor.getRoot())
+
+    names = [node.getElementsByTagName('Name')[0].childNodes[0].nodeValue
+             for node in editor.dom.getElementsByTagName('Menu')]
+    json.dump(dict(tree=describe(editor, editor.getRoot()), names=names), sys.stdout)
+
+class MoveTest(unittest.TestCase):
+    def test_move_back_a_moved_menu(self):
+        command = [sys.executable, '-c', 'from tests import test_MenuEditor; test_MenuEditor.moveMenus()']
+        result = json.loads(subprocess.check_output(command, cwd=TOP).decode('utf-8'))
+
+        # the items of CategoryN are appN, appN+MENUS, ...
+        category0 = [['app%d.desktop' % (index,), index != 0] for index in range(0, ITEMS, MENUS)]
+        category2 = [['app%d.desktop' % (index,), True] for index in range(2, ITEMS, MENUS)]
+        tree = result['tree']
+        self.assertEqual(sorted(menu[0] for menu in tree[1]), ['Category0', 'Category1'])
+        for menu in tree[1]:
+            if menu[0] == 'Category1':
+                self.assertEqual([item for item in menu[1] if item[0] == 'Category0'], [])
+            else:
+                self.assertEqual(sorted(item for item in menu[1] if item[0] != 'Category2'), sorted(category0))
+                self.assertEqual([item for item in menu[1] if item[0] == 'Category2'], [['Category2', category2]])
+        self.assertEqual([name for name in result['names'] if len(name) == 1], [])
+
+if __name__ == '__main__':
+    unittest.main()
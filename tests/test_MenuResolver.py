@@ -0,0 +1,330 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Resolves fixture menus with MenuResolver and with GMenu.Tree, using the
+# flags of MenuEditor, and checks that both give the same tree.
+#
+#   python3 -m unittest discover tests
+#
+# Needs GMenu; the tests are skipped without it.
+
+import os
+import shutil
+import tempfile
+import unittest
+import xml.dom.minidom
+
+DOCTYPE = "<!DOCTYPE Menu PUBLIC '-//freedesktop//DTD Menu 1.0//EN' 'http://standards.freedesktop.org/menu-spec/menu-1.0.dtd'>\n"
+
+# file id -> keys of the launchers in the system applications dir
+ENTRIES = {
+    'editor.desktop': 'Name=Editor\nExec=true\nCategories=Utility;TextEditor;\n',
+    'calc.desktop': 'Name=Calculator\nX-GNOME-FullName=A Calculator\nExec=true\nCategories=Utility;Office;\n',
+    'writer.desktop': 'Name=Writer\nExec=true\nCategories=Office;\n',
+    'game.desktop': 'Name=Game\nExec=true\nCategories=Game;\n',
+    'hidden.desktop': 'Name=Hidden\nExec=true\nHidden=true\nCategories=Utility;\n',
+    'nodisplay.desktop': 'Name=Not Shown\nExec=true\nNoDisplay=true\nCategories=Utility;\n',
+    'plain.desktop': 'Name=zzz Plain\nExec=true\n',
+    'kde/konsole.desktop': 'Name=Konsole\nExec=true\nCategories=System;\n',
+    'Name.desktop': 'Name=Uppercase\nName[de]=Grossbuchstaben\nExec=true\nCategories=Game;Office;\n',
+}
+
+DIRECTORIES = {
+    'utility.directory': 'Name=Accessories\n',
+    'office.directory': 'Name=Office\nNoDisplay=true\n',
+    'games.directory': 'Name=Games\n',
+}
+
+# menu basename -> contents, each is compared on its own
+MENUS = {
+    'rules.menu': """<Menu>
+  <Name>Applications</Name>
+  <DefaultAppDirs/>
+  <DefaultDirectoryDirs/>
+  <Menu>
+    <Name>Utility</Name>
+    <Directory>utility.directory</Directory>
+    <Include><And><Category>Utility</Category><Not><Category>Office</Category></Not></And></Include>
+  </Menu>
+  <Menu>
+    <Name>Office</Name>
+    <Directory>office.directory</Directory>
+    <Include><Or><Category>Office</Category><Filename>kde-konsole.desktop</Filename></Or></Include>
+    <Exclude><Filename>writer.desktop</Filename></Exclude>
+  </Menu>
+  <Menu>
+    <Name>Games</Name>
+    <Directory>games.directory</Directory>
+    <Include><Category>Game</Category></Include>
+  </Menu>
+  <Menu>
+    <Name>Empty</Name>
+    <Include><Filename>missing.desktop</Filename></Include>
+  </Menu>
+</Menu>
+""",
+    'unallocated.menu': """<Menu>
+  <Name>Applications</Name>
+  <DefaultAppDirs/>
+  <DefaultDirectoryDirs/>
+  <Menu>
+    <Name>Office</Name>
+    <Include><Category>Office</Category></Include>
+  </Menu>
+  <Menu>
+    <Name>Other</Name>
+    <OnlyUnallocated/>
+    <Include><All/></Include>
+  </Menu>
+  <Menu>
+    <Name>Gone</Name>
+    <Deleted/>
+    <Include><All/></Include>
+  </Menu>
+</Menu>
+""",
+    'layout.menu': """<Menu>
+  <Name>Applications</Name>
+  <DefaultAppDirs/>
+  <DefaultDirectoryDirs/>
+  <DefaultLayout>
+    <Merge type="files"/>
+    <Separator/>
+    <Merge type="menus"/>
+  </DefaultLayout>
+  <Include><Filename>plain.desktop</Filename><Filename>game.desktop</Filename></Include>
+  <Layout>
+    <Filename>plain.desktop</Filename>
+    <Separator/>
+    <Menuname>Utility</Menuname>
+    <Merge type="all"/>
+  </Layout>
+  <Menu>
+    <Name>Utility</Name>
+    <Directory>utility.directory</Directory>
+    <Include><Category>Utility</Category></Include>
+  </Menu>
+  <Menu>
+    <Name>Games</Name>
+    <Directory>games.directory</Directory>
+    <Include><Category>Game</Category></Include>
+  </Menu>
+</Menu>
+""",
+    'merged.menu': """<Menu>
+  <Name>Applications</Name>
+  <DefaultAppDirs/>
+  <DefaultDirectoryDirs/>
+  <MergeFile>merged-part.menu</MergeFile>
+  <Menu>
+    <Name>Office</Name>
+    <Include><Category>Office</Category></Include>
+  </Menu>
+  <Menu>
+    <Name>Office</Name>
+    <Exclude><Filename>calc.desktop</Filename></Exclude>
+  </Menu>
+  <Move>
+    <Old>Office</Old>
+    <New>Work/Office</New>
+  </Move>
+</Menu>
+""",
+    'merged-part.menu': """<Menu>
+  <Name>Applications</Name>
+  <Menu>
+    <Name>Games</Name>
+    <Include><Category>Game</Category></Include>
+  </Menu>
+</Menu>
+""",
+}
+
+# the user menu for user.menu, merging the system one of the same name
+USER_MENU = """<Menu>
+  <Name>Applications</Name>
+  <MergeFile type="parent"/>
+  <AppDir>%(user_apps)s</AppDir>
+  <Menu>
+    <Name>Utility</Name>
+    <Include><Filename>alacarte-made.desktop</Filename></Include>
+    <Exclude><Filename>editor.desktop</Filename></Exclude>
+  </Menu>
+  <Menu>
+    <Name>New</Name>
+    <Include><Filename>calc.desktop</Filename></Include>
+  </Menu>
+</Menu>
+"""
+
+SYSTEM_USER_MENU = """<Menu>
+  <Name>Applications</Name>
+  <DefaultAppDirs/>
+  <DefaultDirectoryDirs/>
+  <Menu>
+    <Name>Utility</Name>
+    <Directory>utility.directory</Directory>
+    <Include><Category>Utility</Category></Include>
+  </Menu>
+</Menu>
+"""
+
+# the system menu for sharded.menu, the user one is USER_MENU split into
+# shards in sharded-merged/, which <DefaultMergeDirs/> merges as well
+SYSTEM_SHARDED_MENU = """<Menu>
+  <Name>Applications</Name>
+  <DefaultAppDirs/>
+  <DefaultDirectoryDirs/>
+  <DefaultMergeDirs/>
+  <Menu>
+    <Name>Utility</Name>
+    <Directory>utility.directory</Directory>
+    <Include><Category>Utility</Category></Include>
+  </Menu>
+</Menu>
+"""
+
+USER_ENTRIES = {
+    'alacarte-made.desktop': 'Name=Made\nExec=true\n',
+    'writer.desktop': 'Name=My Writer\nExec=true\nCategories=Utility;\n',
+}
+
+root = None
+GMenu = None
+MenuResolver = None
+
+def writeFile(path, contents):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(contents)
+
+def writeFixture():
+    system_data = os.path.join(root, 'system', 'share')
+    system_menus = os.path.join(root, 'system', 'xdg', 'menus')
+    user_data = os.path.join(root, 'home', 'share')
+    user_menus = os.path.join(root, 'home', 'config', 'menus')
+    for file_id, keys in ENTRIES.items():
+        writeFile(os.path.join(system_data, 'applications', file_id), '[Desktop Entry]\nType=Application\n' + keys)
+    for file_id, keys in DIRECTORIES.items():
+        writeFile(os.path.join(system_data, 'desktop-directories', file_id), '[Desktop Entry]\nType=Directory\n' + keys)
+    for basename, contents in MENUS.items():
+        writeFile(os.path.join(system_menus, basename), DOCTYPE + contents)
+    writeFile(os.path.join(system_menus, 'user.menu'), DOCTYPE + SYSTEM_USER_MENU)
+    user_apps = os.path.join(user_data, 'applications')
+    for file_id, keys in USER_ENTRIES.items():
+        writeFile(os.path.join(user_apps, file_id), '[Desktop Entry]\nType=Application\n' + keys)
+    contents = USER_MENU % dict(user_apps=user_apps)
+    writeFile(os.path.join(user_menus, 'user.menu'), DOCTYPE + contents)
+
+    from Alacarte import xdg
+    writeFile(os.path.join(system_menus, 'sharded.menu'), DOCTYPE + SYSTEM_SHARDED_MENU)
+    dom = xml.dom.minidom.parseString(DOCTYPE + contents)
+    xdg.removeWhitespaceNodes(dom)
+    contents, shards = xdg.splitShards(dom, 'sharded.menu')
+    dom.unlink()
+    writeFile(os.path.join(user_menus, 'sharded.menu'), contents)
+    for path, shard in shards.items():
+        writeFile(os.path.join(user_menus, path), shard)
+
+    os.environ['XDG_DATA_DIRS'] = system_data
+    os.environ['XDG_CONFIG_DIRS'] = os.path.dirname(system_menus)
+    os.environ['XDG_DATA_HOME'] = user_data
+    os.environ['XDG_CONFIG_HOME'] = os.path.dirname(user_menus)
+    os.environ['XDG_MENU_PREFIX'] = ''
+    os.environ['LANGUAGE'] = os.environ['LC_ALL'] = os.environ['LANG'] = 'C'
+
+def setUpModule():
+    global root, GMenu, MenuResolver
+    root = tempfile.mkdtemp(prefix='alacarte-test-')
+    # before GLib is loaded, it reads the XDG dirs once
+    writeFixture()
+    try:
+        import gi
+        gi.require_version('GMenu', '3.0')
+        from gi.repository import GMenu
+    except (ImportError, ValueError) as e:
+        raise unittest.SkipTest('GMenu is not available: %s' % (e,))
+    from Alacarte import MenuResolver
+
+def tearDownModule():
+    if root is not None:
+        shutil.rmtree(root)
+
+def describeGMenu(directory):
+    items = []
+    item_iter = directory.iter()
+    item_type = item_iter.next()
+    while item_type != GMenu.TreeItemType.INVALID:
+        if item_type == GMenu.TreeItemType.DIRECTORY:
+            items.append(describeGMenu(item_iter.get_directory()))
+        elif item_type == GMenu.TreeItemType.ENTRY:
+            entry = item_iter.get_entry()
+            app_info = entry.get_app_info()
+            items.append(('Entry', entry.get_desktop_file_id(), entry.get_desktop_file_path(),
+                          app_info.get_display_name(), entry.get_is_excluded(), app_info.get_nodisplay()))
+        elif item_type == GMenu.TreeItemType.SEPARATOR:
+            items.append(('Separator',))
+        item_type = item_iter.next()
+    return ('Menu', directory.get_menu_id(), directory.get_name(), directory.get_desktop_file_path(),
+            directory.get_is_nodisplay(), items)
+
+def describeResolver(directory):
+    items = []
+    for item in directory.contents:
+        if isinstance(item, MenuResolver.Directory):
+            items.append(describeResolver(item))
+        elif isinstance(item, MenuResolver.Entry):
+            items.append(('Entry', item.desktop_file_id, item.desktop_file_path,
+                          item.display_name, item.is_excluded, item.nodisplay))
+        elif isinstance(item, MenuResolver.Separator):
+            items.append(('Separator',))
+    return ('Menu', directory.menu_id, directory.name, directory.desktop_file_path,
+            directory.is_nodisplay, items)
+
+class MenuResolverTest(unittest.TestCase):
+    def assertSameTree(self, basename):
+        tree = GMenu.Tree.new(basename, GMenu.TreeFlags.SHOW_EMPTY|GMenu.TreeFlags.INCLUDE_EXCLUDED|GMenu.TreeFlags.INCLUDE_NODISPLAY|GMenu.TreeFlags.SHOW_ALL_SEPARATORS|GMenu.TreeFlags.SORT_DISPLAY_NAME)
+        tree.load_sync()
+        expected = describeGMenu(tree.get_root_directory())
+        actual = describeResolver(MenuResolver.MenuTree(basename).load())
+        self.assertEqual(actual, expected)
+
+    def test_rules(self):
+        self.assertSameTree('rules.menu')
+
+    def test_only_unallocated(self):
+        self.assertSameTree('unallocated.menu')
+
+    def test_layout(self):
+        self.assertSameTree('layout.menu')
+
+    def test_merge_file_and_move(self):
+        self.assertSameTree('merged.menu')
+
+    def test_user_menu(self):
+        self.assertSameTree('user.menu')
+
+    def test_sharded_user_menu(self):
+        self.assertSameTree('sharded.menu')
+        root = MenuResolver.MenuTree('sharded.menu').load()
+        utility = [item for item in root.contents if isinstance(item, MenuResolver.Directory) and item.menu_id == 'Utility'][0]
+        editor = [item for item in utility.contents if isinstance(item, MenuResolver.Entry) and item.desktop_file_id == 'editor.desktop'][0]
+        self.assertTrue(editor.is_excluded)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Checks that a compiled menu template writes, byte for byte, the files
+# MenuEditor writes for the same edits (Template.verify), on the fixture
+# menu of tools/OperationBudget.py.
+#
+#   python3 -m unittest discover tests
+#
+# Needs GMenu and Gtk for the MenuEditor side; the tests are skipped
+# without them.
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+ITEMS = 24
+MENUS = 4
+
+# the items of CategoryN are appN, appN+MENUS, ...
+SPECS = {
+    'hide': [
+        dict(action='hide', menu='Category0', item='app0.desktop'),
+        dict(action='hide', menu='Category0', item='app4.desktop'),
+    ],
+    'show': [
+        dict(action='hide', menu='Category1', item='app1.desktop'),
+        dict(action='show', menu='Category1', item='app1.desktop'),
+    ],
+    'delete': [
+        dict(action='delete', menu='Category2', item='app2.desktop'),
+    ],
+    'menus': [
+        dict(action='hide-menu', menu='Category1'),
+        dict(action='show-menu', menu='Category1'),
+        dict(action='delete-menu', menu='Category3'),
+    ],
+    'move': [
+        dict(action='move', menu='Category0', item='app20.desktop', before='app0.desktop'),
+        dict(action='move', menu='', item='Category2', after='Category3'),
+        dict(action='move', menu='Category0', item='app0.desktop', after='app8.desktop'),
+    ],
+    'mixed': [
+        dict(action='hide', menu='Category0', item='app8.desktop'),
+        dict(action='move', menu='Category0', item='app12.desktop', before='app4.desktop'),
+        dict(action='delete', menu='Category1', item='app5.desktop'),
+        dict(action='hide-menu', menu='Category2'),
+    ],
+}
+
+root = None
+Template = None
+
+def setUpModule():
+    global root, Template
+    try:
+        import gi
+        #MenuEditor runs in a child process, only check that it can
+        gi.require_version('GMenu', '3.0')
+        gi.require_version('Gtk', '3.0')
+    except (ImportError, ValueError) as e:
+        raise unittest.SkipTest('GMenu or Gtk is not available: %s' % (e,))
+    from tools import OperationBudget
+    from Alacarte import Template
+    root = tempfile.mkdtemp(prefix='alacarte-test-')
+    OperationBudget.writeFixture(root, ITEMS, MENUS)
+
+def tearDownModule():
+    if root is not None:
+        shutil.rmtree(root)
+
+class TemplateTest(unittest.TestCase):
+    def assertSameFiles(self, name):
+        spec_path = os.path.join(root, name + '.json')
+        with open(spec_path, 'w') as f:
+            json.dump(dict(menu='applications.menu', actions=SPECS[name]), f)
+        out = io.StringIO()
+        self.assertEqual(Template.verify(spec_path, out=out), [], out.getvalue())
+
+    def test_hide(self):
+        self.assertSameFiles('hide')
+
+    def test_show(self):
+        self.assertSameFiles('show')
+
+    def test_delete(self):
+        self.assertSameFiles('delete')
+
+    def test_menus(self):
+        self.assertSameFiles('menus')
+
+    def test_move(self):
+        self.assertSameFiles('move')
+
+    def test_mixed(self):
+        self.assertSameFiles('mixed')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Measures what rendering the icons of a menu tree costs per icon, the
+# old way (lookup at 24px, HYPER scaling) against the scale-aware lookup
+# util.getIcon does now, at scale factors 1 and 2. The disk cache is not
+# used, and every round gets a new icon theme so nothing is cached in GTK.
+#
+#   python3 -m tools.IconBenchmark [--menu applications.menu] [--rounds 3]
+#
+# from the top of the source tree, after configure made Alacarte/config.py.
+
+import argparse
+import sys
+import time
+import gi
+gi.require_version('GMenu', '3.0')
+gi.require_version('Gtk', '3.0')
+from gi.repository import Gtk, Gdk, GdkPixbuf, GMenu
+from Alacarte.MenuEditor import MenuEditor
+from Alacarte import util
+
+SCALES = (1, 2)
+
+def collectIcons(editor):
+    icons = []
+    def walk(menu):
+        for item, visible in editor.getItems(menu):
+            gicon = util.getItemGIcon(item)
+            if gicon is not None:
+                icons.append(gicon)
+            if isinstance(item, GMenu.TreeDirectory):
+                walk(item)
+    walk(editor.getRoot())
+    return icons
+
+def newTheme():
+    theme = Gtk.IconTheme()
+    theme.set_screen(Gdk.Screen.get_default())
+    return theme
+
+def renderOld(theme, gicon, scale):
+    size = util.ICON_SIZE * scale
+    info = theme.lookup_by_gicon(gicon, size, 0)
+    if info is None:
+        return None
+    pixbuf = util.renderIcon(info, size, GdkPixbuf.InterpType.HYPER)
+    if pixbuf is None:
+        return None
+    return Gdk.cairo_surface_create_from_pixbuf(pixbuf, scale, None)
+
+def renderNew(theme, gicon, scale):
+    info = theme.lookup_by_gicon_for_scale(gicon, util.ICON_SIZE, scale, Gtk.IconLookupFlags.FORCE_SIZE)
+    if info is None:
+        return None
+    pixbuf = util.renderIcon(info, util.ICON_SIZE * scale)
+    if pixbuf is None:
+        return None
+    return Gdk.cairo_surface_create_from_pixbuf(pixbuf, scale, None)
+
+def measure(render, icons, scale, rounds):
+    best = None
+    for i in range(rounds):
+        theme = newTheme()
+        start = time.perf_counter()
+        for gicon in icons:
+            render(theme, gicon, scale)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / max(len(icons), 1)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure the cost of rendering menu icons.')
+    parser.add_argument('--menu', help='menu basename, e.g. applications.menu')
+    parser.add_argument('--rounds', type=int, default=3, help='best of this many rounds')
+    args = parser.parse_args(argv)
+
+    icons = collectIcons(MenuEditor(args.menu))
+    sys.stdout.write('%d icons\n' % (len(icons),))
+    sys.stdout.write('scale  old (us/icon)  new (us/icon)\n')
+    for scale in SCALES:
+        old = measure(renderOld, icons, scale, args.rounds)
+        new = measure(renderNew, icons, scale, args.rounds)
+        sys.stdout.write('%5d  %13.1f  %13.1f\n' % (scale, old * 1e6, new * 1e6))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# Checks how much work each MenuEditor operation does, counted rather than
+# timed, so a regression fails the same way on every machine. It builds a
+# synthetic menu tree in a temporary directory, runs each operation on a
+# fresh editor with counters wrapped around the interesting calls and
+# compares the counts to the budgets below.
+#
+#   python3 -m tools.OperationBudget [--items 200] [--menus 10] [-v]
+#
+# from the top of the source tree, after configure made Alacarte/config.py.
+# Exits with 1 if an operation goes over its budget.
+
+import argparse
+import collections
+import os
+import shutil
+import sys
+import tempfile
+
+# what is counted:
+#   saves         MenuEditor.save calls
+#   writes        jobs given to the FileWriter (writes, copies, patches, removals)
+#   loads         MenuEditor.load, i.e. GMenu.Tree.load_sync
+#   tree_scans    MenuEditor.findMenu searches from the root
+#   contents      MenuEditor.getContents walks over one menu
+#   dom_lookups   MenuEditor.getXmlMenu lookups in the user menu
+#   path_lookups  util.get*Path calls, each one stats the file system
+COUNTERS = ('saves', 'writes', 'loads', 'tree_scans', 'contents', 'dom_lookups', 'path_lookups')
+
+PATH_FUNCTIONS = ('getItemPath', 'getUserItemPath', 'getDirectoryPath', 'getUserDirectoryPath', 'getUserMenuPath', 'getSystemMenuPath')
+
+OVERRIDES = 5
+DELETE_COUNT = 10
+
+MENU_TEMPLATE = """<!DOCTYPE Menu PUBLIC '-//freedesktop//DTD Menu 1.0//EN' 'http://standards.freedesktop.org/menu-spec/menu-1.0.dtd'>
+<Menu>
+  <Name>Applications</Name>
+  <DefaultAppDirs/>
+  <DefaultDirectoryDirs/>
+%s
+</Menu>
+"""
+
+SUBMENU_TEMPLATE = """  <Menu>
+    <Name>Category%(index)d</Name>
+    <Directory>category%(index)d.directory</Directory>
+    <Include><Category>Category%(index)d</Category></Include>
+  </Menu>"""
+
+def writeFixture(root, items, menus):
+    system_data = os.path.join(root, 'system', 'share')
+    system_config = os.path.join(root, 'system', 'xdg')
+    for path in ('applications', 'desktop-directories'):
+        os.makedirs(os.path.join(system_data, path))
+    os.makedirs(os.path.join(system_config, 'menus'))
+    os.makedirs(os.path.join(root, 'home', 'share'))
+    os.makedirs(os.path.join(root, 'home', 'config'))
+
+    submenus = '\n'.join(SUBMENU_TEMPLATE % dict(index=index) for index in range(menus))
+    with open(os.path.join(system_config, 'menus', 'applications.menu'), 'w') as f:
+        f.write(MENU_TEMPLATE % (submenus,))
+    for index in range(menus):
+        with open(os.path.join(system_data, 'desktop-directories', 'category%d.directory' % (index,)), 'w') as f:
+            f.write('[Desktop Entry]\nType=Directory\nName=Category %d\n' % (index,))
+    for index in range(items):
+        with open(os.path.join(system_data, 'applications', 'app%d.desktop' % (index,)), 'w') as f:
+            f.write('[Desktop Entry]\nType=Application\nName=Application %d\nExec=true\nCategories=Category%d;\n' % (index, index % menus))
+
+    os.environ['XDG_DATA_DIRS'] = system_data
+    os.environ['XDG_CONFIG_DIRS'] = system_config
+    os.environ['XDG_DATA_HOME'] = os.path.join(root, 'home', 'share')
+    os.environ['XDG_CONFIG_HOME'] = os.path.join(root, 'home', 'config')
+    os.environ['XDG_MENU_PREFIX'] = ''
+
+def resetHome(root):
+    for name in ('share', 'config'):
+        path = os.path.join(root, 'home', name)
+        shutil.rmtree(path)
+        os.makedirs(path)
+
+class Counters(object):
+    def __init__(self):
+        self.counts = collections.Counter()
+        self.patches = []
+
+    def wrap(self, owner, name, counter, condition=None):
+        original = getattr(owner, name)
+        counts = self.counts
+        def wrapper(*args, **kwargs):
+            if condition is None or condition(*args, **kwargs):
+                counts[counter] += 1
+            return original(*args, **kwargs)
+        setattr(owner, name, wrapper)
+        self.patches.append((owner, name, original))
+
+    def restore(self):
+        for owner, name, original in reversed(self.patches):
+            setattr(owner, name, original)
+        self.patches = []
+
+def countCalls(func):
+    # the classes and modules are only imported once the fixture is set up,
+    # GLib caches the XDG directories the first time it is asked
+    from Alacarte import util
+    from Alacarte.FileWriter import FileWriter
+    from Alacarte.MenuEditor import MenuEditor
+
+    counters = Counters()
+    counters.wrap(MenuEditor, 'save', 'saves')
+    counters.wrap(MenuEditor, 'load', 'loads')
+    counters.wrap(MenuEditor, 'findMenu', 'tree_scans', lambda self, menu_id, parent=None: parent is None)
+    counters.wrap(MenuEditor, 'getContents', 'contents')
+    counters.wrap(MenuEditor, 'getXmlMenu', 'dom_lookups')
+    counters.wrap(FileWriter, 'submit', 'writes')
+    for name in PATH_FUNCTIONS:
+        counters.wrap(util, name, 'path_lookups')
+    try:
+        func()
+    finally:
+        counters.restore()
+    return counters.counts
+
+def getEntries(editor, menu):
+    from gi.repository import GMenu
+    return [item for item in editor.getContents(menu) if isinstance(item, GMenu.TreeEntry)]
+
+def getSubmenu(editor, index=0):
+    root = editor.getRoot()
+    menus = [menu for menu, visible in editor.getMenus(root)]
+    return menus[index]
+
+def setupOverrides(editor):
+    from Alacarte import util
+    menu = getSubmenu(editor)
+    for item in getEntries(editor, menu)[:OVERRIDES]:
+        shutil.copy(item.get_desktop_file_path(), util.getUserItemPath())
+
+# every operation gets the editor and returns the call to count, so the
+# setup isn't counted
+def opHide(editor):
+    item = getEntries(editor, getSubmenu(editor))[0]
+    return lambda: editor.setVisible(item, False)
+
+def opShow(editor):
+    item = getEntries(editor, getSubmenu(editor))[0]
+    return lambda: editor.setVisible(item, True)
+
+def opMove(editor):
+    menu = getSubmenu(editor)
+    entries = getEntries(editor, menu)
+    return lambda: editor.moveItem(menu, entries[-1], before=entries[0])
+
+def opPlaceItem(editor):
+    menu = getSubmenu(editor)
+    entries = getEntries(editor, menu)
+    return lambda: editor.placeItem(entries[-1], menu, before=entries[0])
+
+def opPlaceItemInto(editor):
+    entry = getEntries(editor, getSubmenu(editor))[0]
+    menu = getSubmenu(editor, 1)
+    return lambda: editor.placeItem(entry, menu)
+
+def opPlaceMenuInto(editor):
+    menu = getSubmenu(editor)
+    parent = getSubmenu(editor, 1)
+    return lambda: editor.placeItem(menu, parent)
+
+def opEditItem(editor):
+    menu = getSubmenu(editor)
+    item = getEntries(editor, menu)[0]
+    app_info = item.get_app_info()
+    return lambda: editor.editItem(item, app_info.get_icon(), 'Renamed', item.get_comment(), item.get_exec(), False, menu)
+
+def opCreateItem(editor):
+    menu = getSubmenu(editor)
+    return lambda: editor.createItem(menu, None, None, Name='New', Exec='true', Type='Application')
+
+def opDeleteItems(editor):
+    items = getEntries(editor, getSubmenu(editor))[:DELETE_COUNT]
+    return lambda: editor.deleteItems(items)
+
+def opDeleteMenu(editor):
+    menu = getSubmenu(editor, 1)
+    return lambda: editor.deleteMenu(menu)
+
+def opRestore(editor):
+    setupOverrides(editor)
+    return lambda: editor.restoreToSystem()
+
+# operation, setup, budget; counters that aren't given must stay at 0
+BUDGETS = [
+    ('setVisible (hide)', opHide, dict(saves=1, writes=1, dom_lookups=1, path_lookups=1)),
+    ('setVisible (show)', opShow, dict(saves=1, writes=2, dom_lookups=1, path_lookups=2)),
+    ('moveItem', opMove, dict(saves=1, writes=1, contents=1, dom_lookups=1)),
+    ('placeItem (same menu)', opPlaceItem, dict(saves=1, writes=1, contents=1, dom_lookups=1)),
+    ('placeItem (other menu)', opPlaceItemInto, dict(saves=1, writes=1, contents=1, dom_lookups=3)),
+    ('placeItem (menu into menu)', opPlaceMenuInto, dict(saves=1, writes=1, contents=1, dom_lookups=1)),
+    ('editItem', opEditItem, dict(saves=1, writes=2, dom_lookups=1, path_lookups=2)),
+    ('createItem', opCreateItem, dict(saves=1, writes=2, tree_scans=1, contents=1, dom_lookups=2, path_lookups=3)),
+    ('deleteItems (%d)' % (DELETE_COUNT,), opDeleteItems, dict(saves=1, writes=2, path_lookups=1)),
+    ('deleteMenu', opDeleteMenu, dict(saves=1, writes=1, dom_lookups=1)),
+    ('restoreToSystem (%d)' % (OVERRIDES,), opRestore, dict(saves=1, writes=OVERRIDES + 1, path_lookups=5)),
+]
+
+def runBudgets(root, verbose=False, out=sys.stdout):
+    from Alacarte.MenuEditor import MenuEditor
+
+    failures = 0
+    for name, setup, budget in BUDGETS:
+        resetHome(root)
+        editor = MenuEditor()
+        counts = countCalls(setup(editor))
+        over = [counter for counter in COUNTERS if counts[counter] > budget.get(counter, 0)]
+        if over:
+            failures += 1
+        if over or verbose:
+            out.write('%s %s\n' % ('FAIL' if over else 'ok  ', name))
+            for counter in COUNTERS:
+                if counts[counter] or counter in budget:
+                    mark = '  <-- over budget' if counter in over else ''
+                    out.write('       %-13s %3d / %d%s\n' % (counter, counts[counter], budget.get(counter, 0), mark))
+    out.write('%d of %d operations over budget\n' % (failures, len(BUDGETS)))
+    return failures
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Check the operation counts of menu edits against their budgets.')
+    parser.add_argument('--items', type=int, default=200, help='number of launchers in the fixture')
+    parser.add_argument('--menus', type=int, default=10, help='number of submenus in the fixture')
+    parser.add_argument('-v', '--verbose', action='store_true', help='print the counts of every operation')
+    args = parser.parse_args(argv)
+
+    root = tempfile.mkdtemp(prefix='alacarte-budget-')
+    try:
+        writeFixture(root, args.items, max(args.menus, 2))
+        failures = runBudgets(root, args.verbose)
+    finally:
+        shutil.rmtree(root)
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,409 @@
+# -*- coding: utf-8 -*-
+#   Alacarte Menu Editor - Simple fd.o Compliant Menu Editor
+#
+#   This library is free software; you can redistribute it and/or
+#   modify it under the terms of the GNU Library General Public
+#   License as published by the Free Software Foundation; either
+#   version 2 of the License, or (at your option) any later version.
+#
+#   This library is distributed in the hope that it will be useful,
+#   but WITHOUT ANY WARRANTY; without even the implied warranty of
+#   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+#   Library General Public License for more details.
+#
+#   You should have received a copy of the GNU Library General Public
+#   License along with this library; if not, write to the Free Software
+#   Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+# How the main window copes with a package upgrade rewriting many
+# .desktop files at once. The harness builds a synthetic menu in a
+# temporary XDG tree (see tools/OperationBudget.py), starts the main
+# window under Xvfb or Broadway, waits a while with nothing happening,
+# then writes bursts of changes into the system applications dir:
+#
+#   python3 -m tools.StormHarness [--bursts 5] [--files 200]
+#       [--burst-duration 2] [--gap 5] [--display xvfb|broadway|none]
+#       [--output report.json] [--baseline old-report.json]
+#
+# from the top of the source tree, after configure made Alacarte/config.py.
+#
+# The window runs in a child process. A timeout on its main loop records
+# how late it runs, which is how long the window didn't respond, and the
+# view updates (loadUpdates, refreshMenus, loadMenus) and tree loads are
+# counted and timed. Both processes use the monotonic clock, so the
+# child's records are matched to the bursts afterwards.
+#
+# The report has the latency percentiles while idle and while the files
+# change, the update counts, and for every burst the time from its last
+# write until the window has caught up. It is written as JSON with the
+# version and the parameters so runs can be compared over releases;
+# --baseline prints the change against an earlier report. The same
+# --seed gives the same file changes.
+
+import argparse
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+# what is timed in the child, on MainWindow unless noted
+UPDATES = ('loadUpdates', 'refreshMenus', 'loadMenus')
+EVENTS = ('on_settled', 'on_files_changed', 'menuChanged')
+# MenuEditor.load, i.e. GMenu.Tree.load_sync
+TREE_LOAD = 'load'
+
+PERCENTILES = (50, 90, 99)
+
+def percentile(values, p):
+    # nearest rank
+    if not values:
+        return None
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, int(round(p / 100.0 * len(values) + 0.5)) - 1))
+    return values[index]
+
+def summarize(values):
+    summary = dict(('p%d' % p, percentile(values, p)) for p in PERCENTILES)
+    summary['max'] = max(values) if values else None
+    summary['samples'] = len(values)
+    return summary
+
+# The child: the main window with probes.
+
+class Recorder(object):
+    def __init__(self):
+        self.calls = []
+        self.ticks = []
+
+    def wrap(self, owner, name, label=None):
+        original = getattr(owner, name)
+        label = label or name
+        calls = self.calls
+        def wrapper(*args, **kwargs):
+            start = time.monotonic()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                calls.append((label, start, time.monotonic()))
+        setattr(owner, name, wrapper)
+
+    def startProbe(self, interval):
+        # a timeout that should run every interval ms; how much later it
+        # runs is how long the main loop was busy
+        from gi.repository import GLib
+        state = dict(expected=time.monotonic() + interval / 1000.0)
+        def tick():
+            now = time.monotonic()
+            self.ticks.append((now, max(0.0, now - state['expected'])))
+            state['expected'] = now + interval / 1000.0
+            return True
+        GLib.timeout_add(interval, tick)
+
+def runChild(results_path, interval):
+    import gi
+    gi.require_version('GMenu', '3.0')
+    gi.require_version('Gtk', '3.0')
+    from gi.repository import GLib
+    from Alacarte.MainWindow import MainWindow
+    from Alacarte.MenuEditor import MenuEditor
+
+    recorder = Recorder()
+    #on the classes, the window connects its bound methods in __init__
+    for name in UPDATES + EVENTS:
+        recorder.wrap(MainWindow, name)
+    recorder.wrap(MenuEditor, 'load', TREE_LOAD)
+
+    app = MainWindow()
+    app.setMenuBasename(None)
+
+    def on_ready():
+        recorder.startProbe(interval)
+        sys.stdout.write('ready\n')
+        sys.stdout.flush()
+        return False
+
+    def on_command(fd, condition):
+        data = os.read(fd, 4096)
+        if not data or b'quit' in data:
+            app.quit()
+            return False
+        return True
+
+    GLib.idle_add(on_ready)
+    GLib.unix_fd_add_full(GLib.PRIORITY_DEFAULT, sys.stdin.fileno(),
+                          GLib.IOCondition.IN | GLib.IOCondition.HUP, on_command)
+    app.run()
+
+    with open(results_path, 'w') as f:
+        json.dump(dict(ticks=recorder.ticks, calls=recorder.calls), f)
+    return 0
+
+# The parent: display, fixture, churn and the report.
+
+def findDisplay():
+    for number in range(99, 200):
+        if not os.path.exists('/tmp/.X11-unix/X%d' % (number,)) and not os.path.exists('/tmp/.X%d-lock' % (number,)):
+            return number
+    raise RuntimeError("no free display number")
+
+def waitFor(check, timeout, process=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if check():
+            return True
+        if process is not None and process.poll() is not None:
+            return False
+        time.sleep(0.05)
+    return False
+
+def canConnect(port):
+    try:
+        socket.create_connection(('127.0.0.1', port), 0.2).close()
+        return True
+    except OSError:
+        return False
+
+def startDisplay(kind, env):
+    # returns the display server process, None for the current display
+    if kind == 'none':
+        if not env.get('DISPLAY') and not env.get('WAYLAND_DISPLAY'):
+            raise RuntimeError("no display, use --display xvfb or broadway")
+        return None
+    number = findDisplay()
+    if kind == 'xvfb':
+        command = ['Xvfb', ':%d' % (number,), '-screen', '0', '1280x1024x24', '-nolisten', 'tcp']
+        ready = lambda: os.path.exists('/tmp/.X11-unix/X%d' % (number,))
+        env.update(DISPLAY=':%d' % (number,), GDK_BACKEND='x11')
+    else:
+        command = ['broadwayd', ':%d' % (number,)]
+        ready = lambda: canConnect(8080 + number)
+        env.update(BROADWAY_DISPLAY=':%d' % (number,), GDK_BACKEND='broadway')
+        env.pop('DISPLAY', None)
+    if shutil.which(command[0]) is None:
+        raise RuntimeError("%s is not installed" % (command[0],))
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    if not waitFor(ready, 10, process):
+        process.kill()
+        process.wait()
+        raise RuntimeError("%s did not start" % (command[0],))
+    return process
+
+def writeAtomically(path, contents):
+    # like package managers do: a new file renamed over the old one
+    dirname, basename = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix='.' + basename + '.', dir=dirname)
+    with os.fdopen(fd, 'w') as f:
+        f.write(contents)
+    os.replace(tmp_path, path)
+
+def churn(apps_dir, items, menus, files, duration, add, rng, serial, added):
+    # one burst: rewrites launchers, adds some new ones and removes
+    # the ones the last burst added; returns what this burst added
+    pause = duration / files if files else 0
+    new_files = []
+    for removed in added:
+        try:
+            os.remove(removed)
+        except OSError:
+            pass
+    for i in range(files):
+        if rng.random() < add:
+            index = len(new_files)
+            path = os.path.join(apps_dir, 'storm%d-%d.desktop' % (serial, index))
+            new_files.append(path)
+        else:
+            index = rng.randrange(items)
+            path = os.path.join(apps_dir, 'app%d.desktop' % (index,))
+        writeAtomically(path, '[Desktop Entry]\nType=Application\nName=Application %d (%d)\nExec=true\nCategories=Category%d;\n'
+                        % (index, serial, index % menus))
+        if pause:
+            time.sleep(pause)
+    return new_files
+
+def analyze(results, idle, bursts, end):
+    ticks = results['ticks']
+    calls = results['calls']
+    idle_start, idle_end = idle
+    idle_latency = [late * 1000 for t, late in ticks if idle_start <= t < idle_end]
+    churn_latency = [late * 1000 for t, late in ticks if bursts and bursts[0][0] <= t < end]
+
+    report_bursts = []
+    for i, (start, stop, files) in enumerate(bursts):
+        window_end = bursts[i + 1][0] if i + 1 < len(bursts) else end
+        in_window = [call for call in calls if start <= call[1] < window_end]
+        updates = [call for call in in_window if call[0] in UPDATES]
+        #caught up when the last bit of work the burst caused is done
+        ends = [call[2] for call in in_window]
+        last = max(ends) if ends else None
+        report_bursts.append(dict(
+            files=files,
+            duration=round(stop - start, 3),
+            updates=len(updates),
+            update_time=round(sum(call[2] - call[1] for call in updates) * 1000, 1),
+            tree_loads=len([call for call in in_window if call[0] == TREE_LOAD]),
+            settle=round(max(0.0, last - stop) * 1000, 1) if last is not None else None,
+            max_latency=round(max([late * 1000 for t, late in ticks if start <= t < window_end] or [0]), 1)))
+
+    counts = {}
+    churn_calls = [call for call in calls if bursts and call[1] >= bursts[0][0]]
+    for name in UPDATES + EVENTS + (TREE_LOAD,):
+        counts[name] = len([call for call in churn_calls if call[0] == name])
+    settles = [burst['settle'] for burst in report_bursts if burst['settle'] is not None]
+    return dict(idle_latency=summarize(idle_latency),
+                churn_latency=summarize(churn_latency),
+                counts=counts,
+                settle=summarize(settles),
+                bursts=report_bursts)
+
+def getVersion():
+    try:
+        from Alacarte import config
+        return config.VERSION
+    except ImportError:
+        return None
+
+def formatMs(value):
+    return '-' if value is None else '%.1f ms' % (value,)
+
+def printReport(report, out):
+    out.write('alacarte %s, %d bursts of %d files in %.1fs\n' % (report['version'] or '?', len(report['bursts']),
+                                                                 report['parameters']['files'],
+                                                                 report['parameters']['burst_duration']))
+    for name in ('idle_latency', 'churn_latency', 'settle'):
+        summary = report[name]
+        out.write('  %-14s %s  max %s  (%d samples)\n' % (name.replace('_', ' '),
+                                                          '  '.join('p%d %s' % (p, formatMs(summary['p%d' % p])) for p in PERCENTILES),
+                                                          formatMs(summary['max']), summary['samples']))
+    out.write('  counts         %s\n' % (', '.join('%s %d' % item for item in sorted(report['counts'].items())),))
+    for i, burst in enumerate(report['bursts']):
+        out.write('  burst %-3d      %d updates in %s, %d tree loads, settled after %s, worst stall %s\n'
+                  % (i + 1, burst['updates'], formatMs(burst['update_time']), burst['tree_loads'],
+                     formatMs(burst['settle']), formatMs(burst['max_latency'])))
+
+def compareReports(report, baseline, out):
+    out.write('against %s (alacarte %s):\n' % (baseline.get('date'), baseline.get('version') or '?'))
+    for name in ('churn_latency', 'settle'):
+        for key in ['p%d' % p for p in PERCENTILES] + ['max']:
+            new = report[name].get(key)
+            old = baseline.get(name, {}).get(key)
+            if new is None or old is None:
+                continue
+            change = '%+.0f%%' % ((new - old) * 100.0 / old,) if old else ''
+            out.write('  %-14s %-4s %s -> %s %s\n' % (name.replace('_', ' '), key, formatMs(old), formatMs(new), change))
+    for name, new in sorted(report['counts'].items()):
+        old = baseline.get('counts', {}).get(name)
+        if old is not None and old != new:
+            out.write('  %-19s %d -> %d\n' % (name, old, new))
+
+def run(args):
+    from tools import OperationBudget
+
+    root = tempfile.mkdtemp(prefix='alacarte-storm-')
+    display = None
+    child = None
+    saved_environ = dict(os.environ)
+    try:
+        OperationBudget.writeFixture(root, args.items, max(args.menus, 1))
+        env = dict(os.environ)
+        runtime_dir = os.path.join(root, 'runtime')
+        os.mkdir(runtime_dir, 0o700)
+        env['XDG_RUNTIME_DIR'] = runtime_dir
+        env['XDG_CACHE_HOME'] = os.path.join(root, 'cache')
+        display = startDisplay(args.display, env)
+
+        results_path = os.path.join(root, 'results.json')
+        command = [sys.executable, '-m', 'tools.StormHarness', '--child', results_path,
+                   '--probe-interval', str(args.probe_interval)]
+        top_srcdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        child = subprocess.Popen(command, env=env, cwd=top_srcdir, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        if child.stdout.readline().strip() != b'ready':
+            raise RuntimeError("the window did not start")
+
+        idle_start = time.monotonic()
+        time.sleep(args.idle)
+        idle = (idle_start, time.monotonic())
+
+        apps_dir = os.path.join(env['XDG_DATA_DIRS'], 'applications')
+        rng = random.Random(args.seed)
+        bursts = []
+        added = []
+        for serial in range(args.bursts):
+            start = time.monotonic()
+            added = churn(apps_dir, args.items, max(args.menus, 1), args.files, args.burst_duration, args.add, rng, serial, added)
+            bursts.append((start, time.monotonic(), args.files))
+            time.sleep(args.gap)
+        end = time.monotonic()
+
+        child.stdin.write(b'quit\n')
+        child.stdin.flush()
+        if child.wait(args.timeout) != 0:
+            raise RuntimeError("the window exited with %d" % (child.returncode,))
+        with open(results_path) as f:
+            results = json.load(f)
+    finally:
+        if child is not None and child.poll() is None:
+            child.kill()
+            child.wait()
+        if display is not None:
+            display.terminate()
+            display.wait()
+        shutil.rmtree(root, ignore_errors=True)
+        os.environ.clear()
+        os.environ.update(saved_environ)
+
+    report = analyze(results, idle, bursts, end)
+    report['version'] = getVersion()
+    report['date'] = time.strftime('%Y-%m-%dT%H:%M:%S%z')
+    report['parameters'] = dict(items=args.items, menus=args.menus, bursts=args.bursts, files=args.files,
+                                burst_duration=args.burst_duration, gap=args.gap, add=args.add, seed=args.seed,
+                                display=args.display, probe_interval=args.probe_interval)
+    return report
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure how the main window responds to bursts of .desktop file changes.')
+    parser.add_argument('--items', type=int, default=500, help='number of launchers in the fixture')
+    parser.add_argument('--menus', type=int, default=10, help='number of submenus in the fixture')
+    parser.add_argument('--bursts', type=int, default=5, help='number of bursts')
+    parser.add_argument('--files', type=int, default=200, help='files written per burst')
+    parser.add_argument('--burst-duration', type=float, default=2.0, help='seconds each burst is spread over')
+    parser.add_argument('--gap', type=float, default=5.0, help='seconds between bursts')
+    parser.add_argument('--add', type=float, default=0.1, help='share of the writes that add a new launcher')
+    parser.add_argument('--idle', type=float, default=3.0, help='seconds to measure before the first burst')
+    parser.add_argument('--seed', type=int, default=1, help='seed of the file changes')
+    parser.add_argument('--display', choices=('xvfb', 'broadway', 'none'), default='xvfb',
+                        help='virtual display to run the window on, none for the current one')
+    parser.add_argument('--probe-interval', type=int, default=10, help='milliseconds between main loop probes')
+    parser.add_argument('--timeout', type=float, default=60.0, help='seconds to wait for the window to exit')
+    parser.add_argument('--output', help='file to write the JSON report to')
+    parser.add_argument('--baseline', help='earlier JSON report to compare with')
+    parser.add_argument('--child', metavar='RESULTS', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        return runChild(args.child, args.probe_interval)
+
+    try:
+        report = run(args)
+    except (RuntimeError, OSError, subprocess.TimeoutExpired) as e:
+        sys.stderr.write('alacarte: %s\n' % (e,))
+        return 1
+    printReport(report, sys.stdout)
+    if args.baseline:
+        try:
+            with open(args.baseline) as f:
+                compareReports(report, json.load(f), sys.stdout)
+        except (OSError, ValueError) as e:
+            sys.stderr.write('alacarte: can not read %s: %s\n' % (args.baseline, e))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+            f.write('\n')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())